@@ -1,20 +1,41 @@
 from django.contrib import admin
-from user.models import User, Vendor, Customer, Transaction, PaymentCode
+from user.models import User, Vendor, Customer, Transaction, PaymentCode, LedgerEntry, WalletBalance
+from user.routers import replica_reads
 
 # Register your models here.
 
-class VendorAdmin(admin.ModelAdmin):
+class ReplicaAdmin(admin.ModelAdmin):
+    # Change lists read from a replica, change forms and actions stay on
+    # the primary. The page is rendered here, its rows are only read then.
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with replica_reads(request.user):
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+class VendorAdmin(ReplicaAdmin):
     list_display = ['VID', 'user', 'balance']
 
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ReplicaAdmin):
     list_display = ['CID', 'user', 'balance']
 
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(ReplicaAdmin):
     list_display = ['ref', 'sender', 'transaction_type', 'status', 'completed']
 
+class LedgerEntryAdmin(ReplicaAdmin):
+    list_display = ['wallet', 'amount', 'transaction', 'created_at']
+
+class WalletBalanceAdmin(ReplicaAdmin):
+    list_display = ['wallet', 'balance', 'entries', 'updated_at']
+
 
-admin.site.register(User)
+admin.site.register(User, ReplicaAdmin)
 admin.site.register(Vendor, VendorAdmin)
 admin.site.register(Customer, CustomerAdmin)
 admin.site.register(Transaction, TransactionAdmin)
-admin.site.register(PaymentCode)
\ No newline at end of file
+admin.site.register(PaymentCode, ReplicaAdmin)
+admin.site.register(LedgerEntry, LedgerEntryAdmin)
+admin.site.register(WalletBalance, WalletBalanceAdmin)
\ No newline at end of file
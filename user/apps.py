@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+
+
+def ensure_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from user.search import install_search_index
+
+    # SQLite rebuilds a table, dropping its triggers, whenever a migration
+    # alters it, so the search triggers are re-created after every migrate.
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if ('user', '0011_transaction_search') in applied:
+        install_search_index(connection)
 
 
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        from user.authentication import forget_on_change, revoke_on_change
+        from user.db import configure_sqlite
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        pre_save.connect(revoke_on_change, sender=self.get_model('User'))
+        post_save.connect(forget_on_change, sender=self.get_model('User'))
+        post_delete.connect(forget_on_change, sender=self.get_model('User'))
+        connection_created.connect(configure_sqlite)
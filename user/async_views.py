@@ -0,0 +1,99 @@
+import requests
+
+from asgiref.sync import sync_to_async
+
+from django.http import Http404
+
+from rest_framework.response import Response
+from rest_framework.decorators import permission_classes, throttle_classes
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+
+from user import flutterwave
+from user import views
+from user.asyncapi import async_api_view
+from user.decorators import roles_required, async_idempotent
+from user.models import Transaction
+from user.throttling import bucket_throttles
+
+# Async versions of the provider-bound views, routed in place of the sync
+# ones when ASYNC_PROVIDER_VIEWS is set. They run the same steps as the
+# views in user/views.py, database work goes through sync_to_async to
+# Django's sync thread and only the provider call runs on the event loop.
+
+
+async def charge(prepared, charge_type, respond, mark_transaction=False, catch_errors=True):
+    if isinstance(prepared, Response):
+        return prepared
+    transaction, json = prepared
+
+    try:
+        response = await flutterwave.get_async_client().charge(charge_type, json)
+        return await sync_to_async(respond)(transaction, response)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        if mark_transaction:
+            return await sync_to_async(views.provider_error_response)("Connection Timed Out", transaction, "pending")
+        return views.provider_error_response("Connection Timed Out")
+    except Exception:
+        if not catch_errors:
+            raise
+        if mark_transaction:
+            return await sync_to_async(views.provider_error_response)("An Error Occured.", transaction, "failed")
+        return views.provider_error_response("An Error Occured.")
+
+
+# START WITHDRAW
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+@async_api_view(['POST'])
+@throttle_classes(bucket_throttles('transfer'))
+@permission_classes([IsAuthenticated])
+@roles_required(['is_vendor', 'is_customer'])
+@async_idempotent
+async def withdraw(request, phone):
+    prepared = await sync_to_async(views.prepare_withdrawal)(request, phone)
+    return await charge(prepared, 'ussd', views.withdrawal_response, catch_errors=False)
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END WITHDRAW
+
+
+# START TOPUP
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+@async_api_view(['POST'])
+@throttle_classes(bucket_throttles('topup'))
+@async_idempotent
+async def ussd_topup(request):
+    prepared = await sync_to_async(views.prepare_ussd_topup)(request)
+    return await charge(prepared, 'ussd', views.ussd_topup_response, mark_transaction=True)
+
+
+@async_api_view(['POST'])
+@throttle_classes(bucket_throttles('topup'))
+@async_idempotent
+async def bank_transfer_topup(request):
+    prepared = await sync_to_async(views.prepare_bank_transfer_topup)(request)
+    return await charge(prepared, 'bank_transfer', views.bank_transfer_topup_response)
+
+
+@async_api_view(['POST'])
+@throttle_classes(bucket_throttles('topup'))
+@async_idempotent
+async def direct_bank_charge_topup(request):
+    prepared = await sync_to_async(views.prepare_direct_bank_charge_topup)(request)
+    return await charge(prepared, 'account', views.direct_bank_charge_topup_response)
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END TOPUP
+
+
+# START VERIFY TRANSACTIONS
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+@async_api_view(['GET'])
+async def verify_transaction(request, ref):
+    try:
+        transaction = await Transaction.objects.select_related('sender').aget(ref=ref)
+    except Transaction.DoesNotExist:
+        raise Http404
+
+    response = await transaction.averify_transaction()
+    return Response(response, status=status.HTTP_200_OK)
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END VERIFY TRANSACTIONS
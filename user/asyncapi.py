@@ -0,0 +1,76 @@
+import inspect
+
+from asgiref.sync import sync_to_async
+
+from rest_framework.views import APIView
+
+# DRF views are synchronous. Under ASGI Django runs them on one shared
+# thread, so a view waiting on the provider holds every other sync view
+# up. These views run on the event loop and only hop to that thread for
+# database work.
+
+POLICIES = (
+    'renderer_classes', 'parser_classes', 'authentication_classes', 'throttle_classes',
+    'permission_classes', 'content_negotiation_class', 'metadata_class', 'versioning_class', 'schema',
+)
+
+
+class AsyncAPIView(APIView):
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication, permissions and throttles may query the
+            # database.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            # OPTIONS is answered by APIView's sync handler.
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_api_view(http_method_names):
+    """
+    @api_view for `async def` views. Takes the same policy decorators,
+    @throttle_classes, @permission_classes and so on, below it.
+    """
+    def decorator(func):
+        attrs = {
+            '__doc__': func.__doc__,
+            'http_method_names': [method.lower() for method in set(http_method_names) | {'options'}],
+            'throttle_scope': getattr(func, 'throttle_scope', None),
+        }
+        for policy in POLICIES:
+            attrs[policy] = getattr(func, policy, getattr(APIView, policy))
+
+        async def handler(self, *args, **kwargs):
+            # Sync decorators like roles_required return a Response
+            # instead of the coroutine when they refuse the request.
+            response = func(*args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+            return response
+
+        for method in http_method_names:
+            attrs[method.lower()] = handler
+
+        WrappedAPIView = type(func.__name__, (AsyncAPIView,), attrs)
+        WrappedAPIView.__module__ = func.__module__
+        return WrappedAPIView.as_view()
+
+    return decorator
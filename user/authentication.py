@@ -0,0 +1,220 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Access tokens carry the user's phone, email, role flags and wallet ID, so
+# checking a request's roles reads nothing but the revocation state: the
+# User row's is_active, claims and tokens_valid_after. That state is kept
+# in the shared cache per user and loaded from the row on a miss. A token
+# is rejected once the user is gone or inactive, when its claims no longer
+# match the row, or when it descends from a login before
+# tokens_valid_after. Saving a password or claim change moves
+# tokens_valid_after forward.
+#
+# Saving or deleting a User and revoke_tokens() drop the cached state, at
+# once and again on commit, so no reader caches the row from before the
+# change. A queryset update() sends no signal and is only seen once the
+# state expires, after REVOCATION_CACHE_TIMEOUT.
+
+CLAIMS = ('phone', 'email', 'is_superuser', 'is_staff', 'is_vendor', 'is_customer', 'wallet_id')
+REVOKING_FIELDS = ('password', 'phone', 'email', 'is_active', 'is_superuser', 'is_staff', 'is_vendor', 'is_customer')
+
+
+def revocation_key(user_id):
+    return f"token-revocation:{user_id}"
+
+
+def forget_revocation_state(user_id):
+    cache.delete(revocation_key(user_id))
+    # A request may read the row before the change commits.
+    transaction.on_commit(lambda: cache.delete(revocation_key(user_id)))
+
+
+def revocation_state(user_id):
+    """
+    Return the cached revocation state of `user_id`, loading it from the
+    User row on a miss. Users that don't exist come back inactive.
+    """
+    from user.models import User, Vendor, Customer
+
+    state = cache.get(revocation_key(user_id))
+    if state is not None:
+        return state
+
+    state = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(
+        'pk', 'is_active', 'tokens_valid_after', *CLAIMS[:-1]
+    ).first()
+    if state is None:
+        state = {'is_active': False}
+    else:
+        state['wallet_id'] = None
+        if state['is_vendor']:
+            state['wallet_id'] = Vendor.objects.filter(user_id=state['pk']).values_list('VID', flat=True).first()
+        elif state['is_customer']:
+            state['wallet_id'] = Customer.objects.filter(user_id=state['pk']).values_list('CID', flat=True).first()
+    cache.set(revocation_key(user_id), state, settings.REVOCATION_CACHE_TIMEOUT)
+    return state
+
+
+def revoke_tokens(user_id):
+    """
+    Reject every token of `user_id` issued before now.
+    """
+    from user.models import User
+
+    User.objects.filter(pk=user_id).update(tokens_valid_after=timezone.now())
+    forget_revocation_state(user_id)
+
+
+def is_revoked(token, stored=None):
+    claims = [claim for claim in CLAIMS[:-1] if claim in token]
+    if stored is None:
+        stored = revocation_state(token[api_settings.USER_ID_CLAIM])
+    if not stored['is_active']:
+        return True
+    if any(token[claim] != stored[claim] for claim in claims):
+        return True
+
+    valid_after = stored['tokens_valid_after']
+    if valid_after is None:
+        return False
+    # auth_time is the login the token descends from, to the microsecond.
+    # Older tokens only have iat, in whole seconds, so one from the second
+    # of the revocation is rejected too.
+    if 'auth_time' in token:
+        return token['auth_time'] < valid_after.timestamp()
+    return token.get('iat', 0) <= valid_after.timestamp()
+
+
+def revoke_on_change(sender, instance, update_fields=None, **kwargs):
+    """
+    pre_save hook for User, moves tokens_valid_after forward when a
+    revoking field changes. It is written with the change itself, so a
+    token can't outlive a change that committed.
+    """
+    if instance.pk is None:
+        return
+    fields = REVOKING_FIELDS if update_fields is None else [f for f in REVOKING_FIELDS if f in update_fields]
+    if not fields:
+        return
+
+    stored = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    if stored is not None and any(stored[field] != getattr(instance, field) for field in fields):
+        instance.tokens_valid_after = timezone.now()
+        if update_fields is not None:
+            # Not among the fields this save writes.
+            sender.objects.filter(pk=instance.pk).update(tokens_valid_after=instance.tokens_valid_after)
+
+
+def forget_on_change(sender, instance, **kwargs):
+    """
+    post_save and post_delete hook for User, drops its cached revocation
+    state.
+    """
+    forget_revocation_state(instance.pk)
+
+
+def wallet_id(user):
+    from user.models import Vendor, Customer
+
+    try:
+        if user.is_vendor:
+            return user.vendor.VID
+        if user.is_customer:
+            return user.customer.CID
+    except (Vendor.DoesNotExist, Customer.DoesNotExist):
+        pass
+    return None
+
+
+class ClaimsUser:
+    """
+    The authenticated user as described by its access token. Claims are
+    answered straight from the token, or from `claims` for tokens without
+    them, any other attribute loads the User row once and reads it from
+    there.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, token, claims=None):
+        from user.models import User
+
+        self.token = token
+        # The claim holds the id as a string.
+        self.pk = self.id = User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM])
+        for claim in CLAIMS:
+            setattr(self, claim, (token if claims is None else claims)[claim])
+
+    @cached_property
+    def user(self):
+        from user.models import User
+
+        try:
+            return User.objects.get(**{api_settings.USER_ID_FIELD: self.pk})
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk and getattr(other, 'is_authenticated', False)
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.phone
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request User lookup. Tokens issued
+    before the role claims existed take theirs from the revocation state.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        state = revocation_state(validated_token[api_settings.USER_ID_CLAIM])
+        if is_revoked(validated_token, state):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        if all(claim in validated_token for claim in CLAIMS):
+            return ClaimsUser(validated_token)
+        return ClaimsUser(validated_token, state)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['auth_time'] = time.time()
+        for claim in CLAIMS[:-1]:
+            token[claim] = getattr(user, claim)
+        token['wallet_id'] = wallet_id(user)
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    # Refuse to mint access tokens from a revoked refresh token.
+    def validate(self, attrs):
+        if is_revoked(RefreshToken(attrs["refresh"])):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        return super().validate(attrs)
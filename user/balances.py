@@ -0,0 +1,112 @@
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+# Wallet summaries are cached per wallet ID under a version number. Every
+# committed ledger posting bumps the version before writing the new
+# summary, so a reader or writer still holding the old version can only
+# ever fill a key nobody reads any more.
+#
+# The version key can be evicted while summary keys under it survive, so
+# a new version is seeded from the clock in nanoseconds rather than a
+# constant. Restarting at 0 would count back up through versions whose
+# stale summaries may still be cached.
+
+
+def fresh_version():
+    return time.time_ns()
+
+
+def version_key(wallet):
+    return f"wallet-summary:{wallet}:version"
+
+
+def summary_key(wallet, version):
+    return f"wallet-summary:{wallet}:v{version}"
+
+
+def current_version(wallet):
+    version = cache.get(version_key(wallet))
+    if version is None:
+        seed = fresh_version()
+        cache.add(version_key(wallet), seed, timeout=None)
+        version = cache.get(version_key(wallet), seed)
+    return version
+
+
+def bump_version(wallet):
+    try:
+        return cache.incr(version_key(wallet))
+    except ValueError:
+        # Evicted or never cached, seed past every version handed out
+        # before. Another process may seed it first, incr either way.
+        cache.add(version_key(wallet), fresh_version(), timeout=None)
+        return cache.incr(version_key(wallet))
+
+
+def wallet_model_for(wallet):
+    from user.models import VENDOR_ID_PREFIX, CUSTOMER_ID_PREFIX
+
+    if wallet.startswith(VENDOR_ID_PREFIX):
+        return apps.get_model('user', 'Vendor'), 'VID'
+    if wallet.startswith(CUSTOMER_ID_PREFIX):
+        return apps.get_model('user', 'Customer'), 'CID'
+    return None, None
+
+
+def load_summary(wallet):
+    model, id_field = wallet_model_for(wallet)
+    if model is None:
+        return None
+
+    row = model.objects.filter(**{id_field: wallet}).values('user_id', 'balance').first()
+    if row is None:
+        return None
+
+    return {
+        "wallet_id": wallet,
+        "type": "vendor" if id_field == 'VID' else "customer",
+        "balance": f"{row['balance']}",
+        "user_id": row['user_id'],
+    }
+
+
+def wallet_summary(wallet):
+    """
+    Return the cached summary of `wallet`, loading it from the database on
+    a miss. Returns None for unknown wallets.
+    """
+    version = current_version(wallet)
+    summary = cache.get(summary_key(wallet, version))
+    if summary is None:
+        summary = load_summary(wallet)
+        if summary is not None:
+            cache.set(summary_key(wallet, version), summary, settings.WALLET_SUMMARY_TIMEOUT)
+    return summary
+
+
+def refresh_wallet_summary(wallet):
+    """
+    Write-through after a committed balance change: invalidate every
+    cached copy, then store the committed summary under the new version.
+    """
+    version = bump_version(wallet)
+    summary = load_summary(wallet)
+    if summary is not None:
+        cache.set(summary_key(wallet, version), summary, settings.WALLET_SUMMARY_TIMEOUT)
+
+
+def refresh_wallet_summaries(wallets):
+    """
+    Write-through for a transfer's couple of wallets. Bulk postings only
+    invalidate, each wallet reloads on its next read instead of all of
+    them being read back at once.
+    """
+    if len(wallets) <= settings.WALLET_SUMMARY_WRITE_THROUGH_LIMIT:
+        for wallet in wallets:
+            refresh_wallet_summary(wallet)
+    else:
+        for wallet in wallets:
+            bump_version(wallet)
@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction as db_transaction
+
+# SQLite serves small single-box installs. WAL lets readers carry on while
+# one writer commits, NORMAL syncs on checkpoints instead of every commit
+# (still safe against corruption, a power cut may lose the last commits),
+# and busy_timeout makes writers queue for the lock instead of failing.
+
+
+def sqlite_pragmas():
+    return [
+        f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT)}",
+    ]
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    connection_created hook, pragmas are per connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    atomic() for transactions that read balances and then write them.
+
+    SQLite ignores select_for_update() and a plain BEGIN only takes the
+    write lock at the first write, so two such transactions can both read
+    and then fail with 'database is locked' trying to write. BEGIN
+    IMMEDIATE takes the write lock up front, the second one waits for up
+    to busy_timeout instead. Nested blocks join the outer transaction.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with db_transaction.atomic(using=using):
+            yield
+        return
+
+    # Opening the connection resets transaction_mode from the settings.
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with db_transaction.atomic(using=using):
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
@@ -1,9 +1,20 @@
+import json
+import hashlib
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction as db_transaction
 from django.http import HttpResponse
 from django.shortcuts import redirect
+from django.utils import timezone
 
 from rest_framework.response import Response
 from rest_framework import status
 
+from user.models import IdempotencyKey
+
 def unauthorised_user(view_func):
     def wrapper_func(request, *args, **kwargs):
         if request.user.is_authenticated:
@@ -27,4 +38,204 @@ def roles_required(roles):
                 )
         return wrapper_func
     
-    return decorator
\ No newline at end of file
+    return decorator
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method}:{request.path}:{body}".encode()).hexdigest()
+
+def claim_idempotency_key(scope, key, fingerprint):
+    """
+    Return (record, None) when this request owns the key and should run,
+    or (None, response) when it must answer with `response` instead.
+    """
+    for _ in range(3):
+        now = timezone.now()
+        lock_until = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        try:
+            with db_transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope,
+                    key=key,
+                    fingerprint=fingerprint,
+                    locked_until=lock_until,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return record, None
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+
+        if record is None:
+            continue
+        if record.expires_at < now:
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lt=now).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            return None, Response(
+                {"status": False, "message": "Idempotency-Key was already used for a different request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.completed:
+            return None, Response(record.response, status=record.status_code, headers={"Idempotent-Replayed": "true"})
+        if record.locked_until < now:
+            # The request holding the key died without finishing, take over.
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True, locked_until=record.locked_until
+            ).update(locked_until=lock_until)
+            if taken:
+                return record, None
+            continue
+        break
+
+    return None, Response(
+        {"status": False, "message": "A request with this Idempotency-Key is still being processed"},
+        status=status.HTTP_409_CONFLICT,
+        headers={"Retry-After": "1"},
+    )
+
+def idempotency_scope(request, kwargs):
+    """
+    Whose keys a request's key is looked up among. Anonymous callers are
+    told apart by the phone they act for, from the URL or the body, or
+    else by the URL arguments naming the resource.
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+
+    phone = kwargs.get('phone')
+    if phone is None and hasattr(request.data, 'get'):
+        phone = request.data.get('phone')
+    if phone is not None:
+        return f"phone:{phone}"[:50]
+    arguments = ','.join(f"{name}={value}" for name, value in sorted(kwargs.items()))
+    return f"anonymous:{arguments}"[:50]
+
+
+def begin_idempotent(request, kwargs):
+    """
+    Return (record, None) when the view should run, with `record` None
+    for requests without an Idempotency-Key, or (None, response) to answer
+    with `response` instead.
+    """
+    key = request.headers.get('Idempotency-Key')
+    if not key or request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return None, None
+
+    if len(key) > 255:
+        return None, Response(
+            {"status": False, "message": "Idempotency-Key is too long"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    return claim_idempotency_key(idempotency_scope(request, kwargs), key, request_fingerprint(request))
+
+
+class WriteTracker:
+    """
+    Notes whether a view wrote to the database, so a failed request can be
+    told apart from one that failed after moving money.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.wrote = False
+
+    statements = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:7].upper().startswith(self.statements):
+            self.wrote = True
+        return execute(sql, params, many, context)
+
+    def start(self):
+        connections[self.using].execute_wrappers.append(self)
+
+    def stop(self):
+        wrappers = connections[self.using].execute_wrappers
+        if self in wrappers:
+            wrappers.remove(self)
+
+
+INCOMPLETE_RESPONSE = {
+    "status": False,
+    "message": "The request failed after it was partly processed, check the transaction status before retrying",
+}
+
+
+def finish_idempotent(record, response, wrote):
+    if response is not None and response.status_code < 500 and hasattr(response, 'data'):
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=response.status_code, response=response.data, locked_until=None
+        )
+    elif not wrote:
+        # Nothing happened, the same key may be retried.
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+    else:
+        # Money may already have moved, a retry must not run it again.
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=getattr(response, 'status_code', None) or status.HTTP_500_INTERNAL_SERVER_ERROR,
+            response=INCOMPLETE_RESPONSE,
+            locked_until=None,
+        )
+
+
+def idempotent(view_func):
+    """
+    Replay the stored response when a request is retried with the same
+    Idempotency-Key header instead of running the view again. Requests
+    without the header run as before. Server errors are only stored when
+    the view had written to the database, otherwise the same key can be
+    retried.
+    """
+    def wrapper_func(request, *args, **kwargs):
+        record, replay = begin_idempotent(request, kwargs)
+        if replay is not None:
+            return replay
+        if record is None:
+            return view_func(request, *args, **kwargs)
+
+        tracker = WriteTracker()
+        tracker.start()
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            tracker.stop()
+            finish_idempotent(record, None, tracker.wrote)
+            raise
+        tracker.stop()
+
+        finish_idempotent(record, response, tracker.wrote)
+        return response
+    return wrapper_func
+
+
+def async_idempotent(view_func):
+    """
+    idempotent() for async views. The tracker is installed from the
+    thread the views' sync_to_async() database work runs in. Other
+    requests sharing that thread can only make a failure look like it
+    wrote, which stores it rather than releasing the key.
+    """
+    async def wrapper_func(request, *args, **kwargs):
+        record, replay = await sync_to_async(begin_idempotent)(request, kwargs)
+        if replay is not None:
+            return replay
+        if record is None:
+            return await view_func(request, *args, **kwargs)
+
+        tracker = WriteTracker()
+        await sync_to_async(tracker.start)()
+        try:
+            response = await view_func(request, *args, **kwargs)
+        except Exception:
+            await sync_to_async(tracker.stop)()
+            await sync_to_async(finish_idempotent)(record, None, tracker.wrote)
+            raise
+        await sync_to_async(tracker.stop)()
+
+        await sync_to_async(finish_idempotent)(record, response, tracker.wrote)
+        return response
+    return wrapper_func
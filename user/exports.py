@@ -0,0 +1,95 @@
+import csv
+import json
+
+from django.conf import settings
+
+from user.models import User, Vendor, Customer
+from user.serializers import ValuesSerializer, UserSerializer, VendorSerializer, CustomerSerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Exports read plain values_list() tuples, joining the user row in the same
+# query, and stream them out in chunks so memory stays flat however large
+# the table is. PIN hashes never leave the database.
+PROFILE_USER_COLUMNS = {'phone': 'user__phone', 'email': 'user__email'}
+
+EXPORTS = {
+    'users': (
+        ValuesSerializer(UserSerializer),
+        lambda: User.objects.filter(is_superuser=False),
+    ),
+    'vendors': (
+        ValuesSerializer(VendorSerializer, related=PROFILE_USER_COLUMNS, exclude=['transaction_pin']),
+        lambda: Vendor.objects.all(),
+    ),
+    'customers': (
+        ValuesSerializer(CustomerSerializer, related=PROFILE_USER_COLUMNS, exclude=['transaction_pin']),
+        lambda: Customer.objects.all(),
+    ),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    # csv.writer wants a file, this one hands each line straight back.
+    def write(self, value):
+        return value
+
+
+def export_rows(resource, chunk_size=None):
+    serializer, queryset = EXPORTS[resource]
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    rows = serializer.values(queryset().order_by('pk'))
+    # Pick the database now, the rows are read after the view has returned.
+    rows = rows.using(rows.db).iterator(chunk_size=chunk_size)
+    return serializer.names, serializer.format_rows(rows)
+
+
+def chunked(lines, size):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= size:
+            yield b''.join(buffer)
+            buffer = []
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream_csv(resource, chunk_size=None):
+    names, rows = export_rows(resource, chunk_size)
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(names).encode()
+        for values in rows:
+            yield writer.writerow(values).encode()
+
+    return chunked(lines(), chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+def stream_ndjson(resource, chunk_size=None):
+    names, rows = export_rows(resource, chunk_size)
+
+    def lines():
+        for values in rows:
+            row = dict(zip(names, values))
+            if orjson is not None:
+                yield orjson.dumps(row) + b'\n'
+            else:
+                yield (json.dumps(row, separators=(',', ':')) + '\n').encode()
+
+    return chunked(lines(), chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+STREAMS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,284 @@
+import time
+import random
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class ProviderUnavailable(requests.exceptions.ConnectionError):
+    pass
+
+
+class ProviderResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    @property
+    def status(self):
+        return self.payload.get('status')
+
+    @property
+    def data(self):
+        data = self.payload.get('data')
+        return data if isinstance(data, dict) else {}
+
+    @property
+    def meta(self):
+        meta = self.payload.get('meta')
+        return meta if isinstance(meta, dict) else {}
+
+    def __repr__(self):
+        return f"<ProviderResponse [{self.status_code}]>"
+
+
+class CircuitBreaker:
+    """
+    Stops calling the provider after `threshold` consecutive failures and
+    lets a single trial request through once `reset_timeout` has passed.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half open, the next failure re-opens the circuit.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class FlutterwaveClient:
+    def __init__(self, secret_key, base_url, timeout, max_retries, backoff, pool_size, breaker):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker
+
+        # One keep-alive pool per process, so a topup reuses an open TLS
+        # connection instead of handshaking on every call.
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update({"Authorization": f"Bearer {secret_key}"})
+
+    def charge(self, charge_type, payload):
+        return self.request('POST', '/charges', params={"type": charge_type}, json=payload)
+
+    def verify_by_reference(self, ref):
+        return self.request('GET', '/transactions/verify_by_reference', params={"tx_ref": ref}, idempotent=True)
+
+    def request(self, method, path, idempotent=False, **kwargs):
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            # Checked before every attempt, so retries stop as soon as
+            # failures here or in other requests open the circuit.
+            if not self.breaker.allow():
+                raise ProviderUnavailable("Flutterwave circuit is open")
+
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.exceptions.RequestException as error:
+                self.breaker.record_failure()
+                # A charge is only safe to resend when the connection was
+                # never made, otherwise the provider may already have it.
+                retryable = idempotent or isinstance(error, requests.exceptions.ConnectTimeout)
+                if last_attempt or not retryable:
+                    raise
+            else:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return ProviderResponse(response.status_code, self.parse(response))
+
+                self.breaker.record_failure()
+                if last_attempt or not idempotent:
+                    return ProviderResponse(response.status_code, self.parse(response))
+
+            # Full jitter keeps retrying workers from hitting the provider
+            # in lockstep.
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def parse(self, response):
+        return parse(response)
+
+
+def parse(response):
+    try:
+        payload = response.json()
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def as_requests_error(error):
+    """
+    The requests exception matching an httpx one, so callers handle
+    errors from either client the same way.
+    """
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(str(error))
+    if isinstance(error, (httpx.ConnectError, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return requests.exceptions.ConnectionError(str(error))
+    return requests.exceptions.RequestException(str(error))
+
+
+class AsyncFlutterwaveClient:
+    """
+    FlutterwaveClient for async views, with the same retries and errors.
+    Waiting on the provider holds no thread, so one process can have
+    hundreds of calls in flight.
+    """
+
+    def __init__(self, secret_key, base_url, timeout, max_retries, backoff, pool_size, breaker):
+        if httpx is None:
+            raise ImproperlyConfigured("The async Flutterwave client needs httpx installed")
+
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker
+
+        connect_timeout, read_timeout = timeout
+        self.session = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            headers={"Authorization": f"Bearer {secret_key}"},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def charge(self, charge_type, payload):
+        return await self.request('POST', '/charges', params={"type": charge_type}, json=payload)
+
+    async def verify_by_reference(self, ref):
+        return await self.request('GET', '/transactions/verify_by_reference', params={"tx_ref": ref}, idempotent=True)
+
+    async def request(self, method, path, idempotent=False, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise ProviderUnavailable("Flutterwave circuit is open")
+
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self.session.request(method, path, **kwargs)
+            except httpx.HTTPError as error:
+                self.breaker.record_failure()
+                retryable = idempotent or isinstance(error, httpx.ConnectTimeout)
+                if last_attempt or not retryable:
+                    raise as_requests_error(error) from error
+            else:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return ProviderResponse(response.status_code, parse(response))
+
+                self.breaker.record_failure()
+                if last_attempt or not idempotent:
+                    return ProviderResponse(response.status_code, parse(response))
+
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+
+_breaker = None
+_client = None
+_client_lock = threading.Lock()
+# httpx connections belong to the event loop that opened them.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_breaker():
+    # One breaker per process, shared by the sync and async clients.
+    global _breaker
+
+    if _breaker is None:
+        with _client_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    threshold=settings.FLUTTERWAVE_BREAKER_THRESHOLD,
+                    reset_timeout=settings.FLUTTERWAVE_BREAKER_RESET,
+                )
+    return _breaker
+
+
+def get_client():
+    global _client
+
+    if _client is None:
+        breaker = get_breaker()
+        with _client_lock:
+            if _client is None:
+                _client = FlutterwaveClient(
+                    secret_key=settings.FLUTTERWAVE_SECRET_KEY,
+                    base_url=settings.FLUTTERWAVE_BASE_URL,
+                    timeout=(settings.FLUTTERWAVE_CONNECT_TIMEOUT, settings.FLUTTERWAVE_READ_TIMEOUT),
+                    max_retries=settings.FLUTTERWAVE_MAX_RETRIES,
+                    backoff=settings.FLUTTERWAVE_RETRY_BACKOFF,
+                    pool_size=settings.FLUTTERWAVE_POOL_SIZE,
+                    breaker=breaker,
+                )
+    return _client
+
+
+@contextmanager
+def override_client(client):
+    """
+    Answer get_client() with `client` inside the block, e.g. a local
+    stand-in for the provider during load tests.
+    """
+    global _client
+
+    with _client_lock:
+        previous, _client = _client, client
+    try:
+        yield client
+    finally:
+        with _client_lock:
+            _client = previous
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncFlutterwaveClient(
+            secret_key=settings.FLUTTERWAVE_SECRET_KEY,
+            base_url=settings.FLUTTERWAVE_BASE_URL,
+            timeout=(settings.FLUTTERWAVE_CONNECT_TIMEOUT, settings.FLUTTERWAVE_READ_TIMEOUT),
+            max_retries=settings.FLUTTERWAVE_MAX_RETRIES,
+            backoff=settings.FLUTTERWAVE_RETRY_BACKOFF,
+            pool_size=settings.FLUTTERWAVE_ASYNC_POOL_SIZE,
+            breaker=get_breaker(),
+        )
+    return client
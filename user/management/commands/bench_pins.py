@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure PIN authorizations per second for one worker process at "
+        "different bcrypt costs, checked inline and on a thread pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, nargs='+', default=[8, 10, 12])
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--seconds', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"configured: rounds={settings.PIN_HASH_ROUNDS} workers={settings.PIN_HASH_WORKERS}")
+        self.stdout.write(f"{'rounds':>7} {'threads':>8} {'ms/check':>9} {'checks/s':>9}")
+        for rounds in options['rounds']:
+            stored = bcrypt.hashpw(b'123456', bcrypt.gensalt(rounds))
+            for threads in options['threads']:
+                checks, elapsed = self.measure(stored, threads, options['seconds'])
+                self.stdout.write(
+                    f"{rounds:>7} {threads:>8} {elapsed * 1000 * threads / checks:>9.1f} {checks / elapsed:>9.1f}"
+                )
+
+    def measure(self, stored, threads, seconds):
+        deadline = time.perf_counter() + seconds
+
+        def checker():
+            checks = 0
+            while time.perf_counter() < deadline:
+                bcrypt.checkpw(b'123456', stored)
+                checks += 1
+            return checks
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            checks = sum(pool.map(lambda _: checker(), range(threads)))
+        return checks, time.perf_counter() - started
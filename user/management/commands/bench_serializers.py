@@ -0,0 +1,96 @@
+import time
+import random
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+
+from user.models import User, Vendor, Customer, Transaction
+from user.serializers import UserSerializer, VendorSerializer, CustomerSerializer, TransactionSerializer
+from user.serializers import fast_users, fast_vendors, fast_customers, fast_transactions
+from user.renderers import ORJSONRenderer
+from user.utils import generate_ref
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-row cost of the ModelSerializer + JSONRenderer list path with the "
+        ".values() fast path + orjson, on scratch rows that are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with db_transaction.atomic():
+                self.populate(options['rows'])
+                self.run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def populate(self, count):
+        users = User.objects.bulk_create([
+            User(phone=f"b{position:010d}", username=f"bench{position}", email=f"bench{position}@example.com",
+                 is_vendor=position % 2 == 0, is_customer=position % 2 == 1)
+            for position in range(count * 2)
+        ])
+        Vendor.objects.bulk_create([
+            Vendor(user=user, VID=f"BNCV{position:07d}", balance=Decimal(random.randint(0, 10 ** 6)) / 100,
+                   business_name="Bench stores", business_type="food", institution="Bench University")
+            for position, user in enumerate(users) if user.is_vendor
+        ])
+        Customer.objects.bulk_create([
+            Customer(user=user, CID=f"BNCC{position:07d}", balance=Decimal(random.randint(0, 10 ** 6)) / 100,
+                     fullname="Bench Student", institution="Bench University")
+            for position, user in enumerate(users) if user.is_customer
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(sender=random.choice(users), recepient=random.choice(users), ref=generate_ref(),
+                        amount=random.randint(50, 5000), transaction_type='transfer', status='success',
+                        description="bench")
+            for _ in range(count)
+        ])
+
+    def run(self, options):
+        bench_users = User.objects.filter(username__startswith='bench')
+        cases = [
+            ('users', UserSerializer, fast_users, bench_users),
+            ('vendors', VendorSerializer, fast_vendors, Vendor.objects.filter(VID__startswith='BNCV')),
+            ('customers', CustomerSerializer, fast_customers, Customer.objects.filter(CID__startswith='BNCC')),
+            ('transactions', TransactionSerializer, fast_transactions,
+             Transaction.objects.filter(sender__in=bench_users)),
+        ]
+
+        self.stdout.write(f"{'serializer':>14} {'rows':>6} {'DRF us/row':>11} {'fast us/row':>12} {'speedup':>8} {'same output':>12}")
+        for label, serializer_class, fast, queryset in cases:
+            rows = queryset.count()
+            slow_time = self.time(
+                lambda: JSONRenderer().render(serializer_class(queryset.all(), many=True).data), options['repeat']
+            )
+            fast_time = self.time(
+                lambda: ORJSONRenderer().render(fast.serialize(queryset.all())), options['repeat']
+            )
+            same = JSONRenderer().render(serializer_class(queryset.all(), many=True).data) == \
+                JSONRenderer().render(fast.serialize(queryset.all()))
+            self.stdout.write(
+                f"{label:>14} {rows:>6} {slow_time / rows * 10 ** 6:>11.1f} {fast_time / rows * 10 ** 6:>12.1f} "
+                f"{slow_time / fast_time:>7.1f}x {'yes' if same else 'NO':>12}"
+            )
+
+    def time(self, render, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,118 @@
+import os
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+from statistics import quantiles
+
+from django.core.management.base import BaseCommand
+
+from user.db import sqlite_pragmas
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent transfer throughput on SQLite with its defaults (rollback "
+        "journal, synchronous=FULL, deferred BEGIN) and with the settings in "
+        "user/db.py (WAL, synchronous=NORMAL, busy_timeout, BEGIN IMMEDIATE), on a "
+        "scratch database file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--seconds', type=float, default=3)
+        parser.add_argument('--wallets', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        modes = (
+            ('default', [], 'BEGIN'),
+            ('wal+immediate', sqlite_pragmas(), 'BEGIN IMMEDIATE'),
+        )
+        self.stdout.write(
+            f"{'threads':>8} {'mode':>14} {'transfers/s':>12} {'locked':>8} {'p50 ms':>8} {'p99 ms':>8}"
+        )
+        for threads in options['threads']:
+            for mode, pragmas, begin in modes:
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'bench.sqlite3')
+                    self.scratch_tables(path, options['wallets'])
+                    done, locked, latencies = self.run(path, pragmas, begin, threads, options)
+                self.stdout.write(
+                    f"{threads:>8} {mode:>14} {done / options['seconds']:>12.0f} {locked:>8} "
+                    f"{self.percentile(latencies, 49):>8.1f} {self.percentile(latencies, 98):>8.1f}"
+                )
+
+    def scratch_tables(self, path, wallets):
+        connection = sqlite3.connect(path)
+        connection.executescript(
+            """
+            CREATE TABLE wallet (id INTEGER PRIMARY KEY, balance DECIMAL NOT NULL);
+            CREATE TABLE txn (id INTEGER PRIMARY KEY, sender_id INTEGER, recepient_id INTEGER, amount DECIMAL);
+            CREATE TABLE ledger (id INTEGER PRIMARY KEY, txn_id INTEGER, wallet_id INTEGER, amount DECIMAL);
+            CREATE INDEX ledger_wallet ON ledger (wallet_id);
+            """
+        )
+        connection.executemany("INSERT INTO wallet (balance) VALUES (?)", ((1000000,) for _ in range(wallets)))
+        connection.commit()
+        connection.close()
+
+    def run(self, path, pragmas, begin, threads, options):
+        lock = threading.Lock()
+        totals = {'done': 0, 'locked': 0}
+        latencies = []
+        deadline = time.perf_counter() + options['seconds']
+
+        def worker():
+            connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            for pragma in pragmas:
+                connection.execute(pragma)
+            done = locked = 0
+            timings = []
+            while time.perf_counter() < deadline:
+                sender, recepient = random.sample(range(1, options['wallets'] + 1), 2)
+                started = time.perf_counter()
+                try:
+                    self.transfer(connection, begin, sender, recepient, 1)
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    locked += 1
+                    continue
+                timings.append((time.perf_counter() - started) * 1000)
+                done += 1
+            connection.close()
+            with lock:
+                totals['done'] += done
+                totals['locked'] += locked
+                latencies.extend(timings)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return totals['done'], totals['locked'], latencies
+
+    def transfer(self, connection, begin, sender, recepient, amount):
+        # The statements user.transfers.transfer() runs: read both wallets,
+        # claim the transaction, move the balance, post the ledger entries.
+        connection.execute(begin)
+        connection.execute("SELECT id, balance FROM wallet WHERE id IN (?, ?)", (sender, recepient)).fetchall()
+        txn = connection.execute(
+            "INSERT INTO txn (sender_id, recepient_id, amount) VALUES (?, ?, ?)", (sender, recepient, amount)
+        ).lastrowid
+        connection.execute(
+            "UPDATE wallet SET balance = balance - ? WHERE id = ? AND balance >= ?", (amount, sender, amount)
+        )
+        connection.execute("UPDATE wallet SET balance = balance + ? WHERE id = ?", (amount, recepient))
+        connection.executemany(
+            "INSERT INTO ledger (txn_id, wallet_id, amount) VALUES (?, ?, ?)",
+            ((txn, sender, -amount), (txn, recepient, amount)),
+        )
+        connection.execute("COMMIT")
+
+    def percentile(self, values, index):
+        if len(values) < 2:
+            return values[0] if values else 0
+        return quantiles(values, n=100)[index]
@@ -0,0 +1,132 @@
+import os
+import time
+import random
+import sqlite3
+import tempfile
+import statistics
+
+from django.core.management.base import BaseCommand
+
+from user.search import SQLITE_SCHEMA, SQLITE_QUERY, SQLITE_COUNT, SQLITE_MATCH, prefers_filters
+
+# The same SQL Django emits for the Q(...contains) filter and its Paginator
+# on SQLite: a COUNT(*) plus the first page, both scanning the user's rows.
+LIKE_WHERE = """
+    WHERE sender_id = ? AND (
+        ref LIKE ? ESCAPE '\\' OR transaction_type LIKE ? ESCAPE '\\' OR status LIKE ? ESCAPE '\\'
+    )
+"""
+LIKE_COUNT = "SELECT COUNT(*) FROM user_transaction" + LIKE_WHERE
+LIKE_PAGE = "SELECT * FROM user_transaction" + LIKE_WHERE + " ORDER BY created_at LIMIT 10"
+
+WORDS = ['jollof', 'rice', 'printing', 'transport', 'books', 'hostel', 'laundry', 'data', 'airtime', 'snacks']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare transaction search latency of the FTS5 index with the old Q filter "
+        "on a scratch SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--heavy-rows', type=int, default=50000, help="Rows owned by the single heaviest user.")
+        parser.add_argument('--queries', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            connection = sqlite3.connect(os.path.join(directory, 'bench.sqlite3'))
+            self.stdout.write(f"Loading {options['rows']} transactions...")
+            started = time.perf_counter()
+            refs = self.populate(connection, options)
+            self.stdout.write(f"Loaded in {time.perf_counter() - started:.1f}s, index kept in sync by triggers.")
+
+            cases = [
+                ('ref fragment', lambda: refs[random.randrange(len(refs))][4:14]),
+                ('description word', lambda: random.choice(WORDS)),
+                ('counterparty phone', lambda: f"0803{random.randrange(options['users']):07d}"),
+                ('status', lambda: 'pending'),
+            ]
+            self.stdout.write(f"{'query':>20} {'Q filter p50':>14} {'FTS5 p50':>10} {'Q filter p95':>14} {'FTS5 p95':>10}  served by")
+            for label, make_query in cases:
+                terms = [make_query() for _ in range(options['queries'])]
+                like = self.time(lambda term: self.like_search(connection, 1, term), terms)
+                fts = self.time(lambda term: self.fts_search(connection, 1, term), terms)
+                # Status values and phone numbers are sent to the filters
+                # by the view, see user.search.prefers_filters().
+                served = 'filters' if prefers_filters(terms[0]) else 'index'
+                self.stdout.write(
+                    f"{label:>20} {like[0]:>12.2f}ms {fts[0]:>8.2f}ms {like[1]:>12.2f}ms {fts[1]:>8.2f}ms  {served}"
+                )
+            connection.close()
+
+    def populate(self, connection, options):
+        connection.executescript("""
+            CREATE TABLE user_user (id INTEGER PRIMARY KEY, phone TEXT UNIQUE);
+            CREATE TABLE user_transaction (
+                id INTEGER PRIMARY KEY, sender_id INTEGER, recepient_id INTEGER, ref TEXT UNIQUE,
+                amount DECIMAL, transaction_type TEXT, description TEXT, created_at DATETIME, status TEXT
+            );
+            CREATE INDEX user_transaction_sender_id ON user_transaction (sender_id);
+        """)
+        for statement in SQLITE_SCHEMA:
+            connection.execute(statement)
+
+        connection.executemany(
+            "INSERT INTO user_user (id, phone) VALUES (?, ?)",
+            ((user, f"0803{user:07d}") for user in range(1, options['users'] + 1)),
+        )
+
+        refs = []
+
+        def rows():
+            for position in range(options['rows']):
+                # User 1 is the heavy vendor, the rest is spread evenly.
+                if position < options['heavy_rows']:
+                    sender = 1
+                else:
+                    sender = random.randint(2, options['users'])
+                ref = '%026x' % random.getrandbits(104)
+                if sender == 1:
+                    refs.append(ref)
+                yield (
+                    sender, random.randint(1, options['users']), ref, random.randint(50, 5000),
+                    random.choice(['transfer', 'topup', 'withdraw']),
+                    ' '.join(random.sample(WORDS, 2)),
+                    f"2026-{random.randint(1, 9):02d}-{random.randint(1, 28):02d} 12:00:00",
+                    random.choice(['pending', 'success', 'failed']),
+                )
+
+        connection.executemany(
+            "INSERT INTO user_transaction (sender_id, recepient_id, ref, amount, transaction_type, "
+            "description, created_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows(),
+        )
+        connection.commit()
+        return refs
+
+    def like_search(self, connection, user, term):
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        params = (user, pattern, pattern, pattern)
+        connection.execute(LIKE_COUNT, params).fetchone()
+        return connection.execute(LIKE_PAGE, params).fetchall()
+
+    def fts_search(self, connection, user, term):
+        # What the view runs: a COUNT(*) and one ranked page from the index.
+        phrase = '"' + term.replace('"', '""') + '"'
+        match = SQLITE_MATCH.format(owner=user, phrase=phrase)
+        connection.execute(SQLITE_COUNT.replace('%s', '?'), (match,)).fetchone()
+        page = [row[0] for row in connection.execute(SQLITE_QUERY.replace('%s', '?'), (match, 10, 0))]
+        return connection.execute(
+            f"SELECT * FROM user_transaction WHERE id IN ({','.join('?' * len(page))})", page
+        ).fetchall()
+
+    def time(self, search, terms):
+        timings = []
+        for term in terms:
+            started = time.perf_counter()
+            search(term)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.95)]
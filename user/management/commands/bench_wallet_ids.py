@@ -0,0 +1,78 @@
+import time
+import random
+import sqlite3
+
+from django.core.management.base import BaseCommand
+
+from user.utils import permute_id, WALLET_ID_SPACE
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare signup throughput of the old random-probe wallet IDs with the "
+        "leased-block allocator, on a scratch in-memory SQLite table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--used', type=int, nargs='+', default=[50000, 90000, 99000])
+        parser.add_argument('--signups', type=int, default=1000)
+        parser.add_argument('--block-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'used':>8} {'scheme':>10} {'signups/s':>12} {'queries/signup':>15}")
+        for used in options['used']:
+            signups = min(options['signups'], WALLET_ID_SPACE - used)
+            for scheme in (self.random_probe, self.allocator):
+                connection = self.scratch_table(used)
+                started = time.perf_counter()
+                queries = scheme(connection, used, signups, options['block_size'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{used:>8} {scheme.__name__:>10} {signups / elapsed:>12.0f} {queries / signups:>15.2f}"
+                )
+
+    def scratch_table(self, used):
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE TABLE wallet (id INTEGER PRIMARY KEY, wid TEXT UNIQUE)")
+        connection.execute("CREATE TABLE sequence (prefix TEXT PRIMARY KEY, next_value INTEGER)")
+        # The same numbers are taken for both schemes: the first `used`
+        # values of the permutation, which is what the allocator issues.
+        connection.executemany(
+            "INSERT INTO wallet (wid) VALUES (?)",
+            ((f"VEND26{permute_id(value, 'bench'):05d}",) for value in range(used)),
+        )
+        connection.execute("INSERT INTO sequence VALUES ('VEND26', ?)", (used,))
+        connection.commit()
+        return connection
+
+    def random_probe(self, connection, used, signups, block_size):
+        queries = 0
+        for _ in range(signups):
+            while True:
+                wid = f"VEND26{random.randint(0, WALLET_ID_SPACE - 1):05d}"
+                queries += 1
+                if not connection.execute("SELECT 1 FROM wallet WHERE wid = ?", (wid,)).fetchone():
+                    break
+            connection.execute("INSERT INTO wallet (wid) VALUES (?)", (wid,))
+            queries += 1
+            connection.commit()
+        return queries
+
+    def allocator(self, connection, used, signups, block_size):
+        queries = 0
+        start = end = 0
+        for _ in range(signups):
+            if start >= end:
+                start = connection.execute(
+                    "SELECT next_value FROM sequence WHERE prefix = 'VEND26'"
+                ).fetchone()[0]
+                end = min(start + block_size, WALLET_ID_SPACE)
+                connection.execute("UPDATE sequence SET next_value = ? WHERE prefix = 'VEND26'", (end,))
+                connection.commit()
+                queries += 2
+            wid = f"VEND26{permute_id(start, 'bench'):05d}"
+            start += 1
+            connection.execute("INSERT INTO wallet (wid) VALUES (?)", (wid,))
+            queries += 1
+            connection.commit()
+        return queries
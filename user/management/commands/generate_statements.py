@@ -0,0 +1,71 @@
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from user.statements import RENDERERS, parse_period, wallets, shards, write_statements
+
+
+def previous_period():
+    first = timezone.localtime().replace(day=1)
+    return f"{first.year - (first.month == 1)}-{(first.month - 2) % 12 + 1:02d}"
+
+
+def write_shard(wallet_rows, period, extensions, chunk_size):
+    try:
+        return write_statements(wallet_rows, period, extensions, chunk_size)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Generate monthly CSV/PDF statements for every wallet, sharded across a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', default=None, help="YYYY-MM, defaults to last month.")
+        parser.add_argument('--formats', default='csv,pdf')
+        parser.add_argument('--workers', type=int, default=settings.STATEMENT_WORKERS)
+        parser.add_argument('--shard-size', type=int, default=settings.STATEMENT_SHARD_SIZE,
+                            help="Wallets per task, each task reads one user id range.")
+        parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        period = options['period'] or previous_period()
+        try:
+            parse_period(period)
+        except ValueError:
+            raise CommandError(f"Invalid period {period!r}, expected YYYY-MM.")
+
+        extensions = [extension.strip() for extension in options['formats'].split(',') if extension.strip()]
+        unknown = set(extensions) - set(RENDERERS)
+        if unknown:
+            raise CommandError(f"Unknown formats: {', '.join(sorted(unknown))}")
+
+        started = time.perf_counter()
+        tasks = list(shards(wallets(), options['shard_size']))
+        written = 0
+
+        if options['workers'] <= 1:
+            for wallet_rows in tasks:
+                written += write_statements(wallet_rows, period, extensions, options['chunk_size'])
+        else:
+            # Forked workers must not share the parent's open connections.
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=options['workers'], mp_context=multiprocessing.get_context('fork')
+            )
+            with pool:
+                futures = [
+                    pool.submit(write_shard, wallet_rows, period, extensions, options['chunk_size'])
+                    for wallet_rows in tasks
+                ]
+                for future in as_completed(futures):
+                    written += future.result()
+
+        self.stdout.write(
+            f"Wrote {period} statements for {written} wallets in {time.perf_counter() - started:.1f}s."
+        )
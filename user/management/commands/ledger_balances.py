@@ -0,0 +1,112 @@
+from decimal import Decimal
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.db.models import Sum, Count, Min
+
+from user.models import Vendor, Customer, LedgerEntry, WalletBalance, OPENING_ACCOUNT
+
+
+class Command(BaseCommand):
+    help = "Verify wallet balances against the ledger, or rebuild the materialized balances from it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Overwrite materialized balances with the ledger totals.")
+        parser.add_argument('--open', action='store_true', help="Post opening entries for wallet balances that predate the ledger.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['open']:
+            self.open_wallets(batch_size)
+
+        wallets = 0
+        unopened = 0
+        drifted = 0
+        mismatches = 0
+        for batch in self.wallet_batches(batch_size):
+            wallets += len(batch)
+            totals = {
+                row['wallet']: (row['balance'], row['entries'])
+                for row in LedgerEntry.objects.filter(wallet__in=batch)
+                .values('wallet')
+                .annotate(balance=Sum('amount'), entries=Count('id'))
+            }
+            materialized = dict(
+                WalletBalance.objects.filter(wallet__in=batch).values_list('wallet', 'balance')
+            )
+
+            for wallet, wallet_balance in batch.items():
+                if wallet not in totals:
+                    # Wallets whose balance predates the ledger, or that
+                    # never moved money. Only the former need --open.
+                    if wallet_balance:
+                        unopened += 1
+                        self.stdout.write(f"{wallet}: no ledger entries, wallet {wallet_balance}")
+                    continue
+
+                balance, entries = totals[wallet]
+                if wallet_balance != balance:
+                    drifted += 1
+                    self.stdout.write(f"{wallet}: ledger {balance}, wallet {wallet_balance}")
+
+                if materialized.get(wallet) == balance:
+                    continue
+                mismatches += 1
+                self.stdout.write(f"{wallet}: ledger {balance}, materialized {materialized.get(wallet)}")
+                if options['rebuild']:
+                    WalletBalance.objects.update_or_create(
+                        wallet=wallet, defaults={'balance': balance, 'entries': entries}
+                    )
+
+        drift = LedgerEntry.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        if drift:
+            raise CommandError(f"Ledger does not balance, entries sum to {drift}")
+
+        self.stdout.write(
+            f"Checked {wallets} wallets, {unopened} without ledger entries, "
+            f"{drifted} differing from the ledger, {mismatches} mismatched."
+        )
+        if unopened:
+            raise CommandError("Wallet balances predate the ledger, run with --open.")
+        if drifted:
+            raise CommandError("Wallet balances differ from the ledger, run with --open if they predate it.")
+        if mismatches and not options['rebuild']:
+            raise CommandError("Materialized balances differ from the ledger, run with --rebuild.")
+
+    def wallet_batches(self, batch_size):
+        # Every vendor and customer wallet, {wallet ID: balance} per batch,
+        # so wallets the ledger has never seen are checked as well.
+        # External accounts have no wallet row and no materialized
+        # balance, the drift check below covers them.
+        for model, id_field in ((Vendor, 'VID'), (Customer, 'CID')):
+            batch = {}
+            wallets = model.objects.values_list(id_field, 'balance').order_by(id_field)
+            for wallet, balance in wallets.iterator(chunk_size=batch_size):
+                batch[wallet] = balance
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = {}
+            if batch:
+                yield batch
+
+    def open_wallets(self, batch_size):
+        opened = 0
+        for model, id_field in ((Vendor, 'VID'), (Customer, 'CID')):
+            wallets = model.objects.values_list(id_field, 'balance').order_by(id_field)
+            for wallet, balance in wallets.iterator(chunk_size=batch_size):
+                with db_transaction.atomic():
+                    ledger_balance = LedgerEntry.objects.filter(wallet=wallet).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+                    difference = balance - ledger_balance
+                    if difference:
+                        # The balance predates every entry, dating it before
+                        # them keeps statement opening balances right.
+                        first = LedgerEntry.objects.filter(wallet=wallet).aggregate(first=Min('created_at'))['first']
+                        LedgerEntry.objects.post(
+                            [(wallet, difference), (OPENING_ACCOUNT, -difference)],
+                            created_at=first - timedelta(microseconds=1) if first else None,
+                        )
+                        opened += 1
+        self.stdout.write(f"Posted opening entries for {opened} wallets.")
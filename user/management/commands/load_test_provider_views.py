@@ -0,0 +1,152 @@
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, AsyncRequestFactory, override_settings
+
+from user import views, async_views
+from user.models import User, Transaction
+
+
+class FakeFlutterwave(ThreadingHTTPServer):
+    """
+    Answers every charge after `latency` seconds and records how many
+    calls were in flight at once.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), ChargeHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+
+    def reset(self):
+        with self.lock:
+            self.in_flight = self.peak = 0
+
+
+class ChargeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(server.latency)
+        body = json.dumps({
+            'status': 'success',
+            'data': {'status': 'pending', 'app_fee': 0, 'charged_amount': 100},
+            'meta': {'authorization': {'mode': 'ussd', 'note': '*000#'}},
+        }).encode()
+
+        with server.lock:
+            server.in_flight -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test ussd_topup against a fake Flutterwave with a fixed latency, "
+        "in one process: the sync view on a WSGI-style thread pool, and the sync "
+        "and async views on an ASGI event loop. Creates topup transactions, run "
+        "it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads.")
+        parser.add_argument('--latency', type=float, default=0.5, help="Provider latency in seconds.")
+        parser.add_argument('--phone', default='09000000000')
+
+    def handle(self, *args, **options):
+        provider = FakeFlutterwave(options['latency'])
+        threading.Thread(target=provider.serve_forever, daemon=True).start()
+
+        user, created = User.objects.get_or_create(
+            phone=options['phone'], defaults={'email': 'load-test@campuspay.invalid', 'is_customer': True}
+        )
+        payload = {'phone': user.phone, 'email': user.email, 'amount': '100', 'account_bank': '057'}
+        unthrottled = {scope: '1000000/s' for scope in settings.THROTTLE_RATES}
+
+        try:
+            with override_settings(
+                FLUTTERWAVE_BASE_URL=f'http://127.0.0.1:{provider.server_port}',
+                FLUTTERWAVE_POOL_SIZE=options['threads'],
+                FLUTTERWAVE_ASYNC_POOL_SIZE=options['concurrency'],
+                FLUTTERWAVE_MAX_RETRIES=0,
+                THROTTLE_RATES=unthrottled,
+            ):
+                self.stdout.write(
+                    f"{options['requests']} requests, provider latency {options['latency']:.2f}s\n"
+                    f"{'mode':<22} {'req/s':>8} {'peak in flight':>15} {'ok':>6}"
+                )
+                for mode, run in (
+                    (f"wsgi {options['threads']} threads", self.run_wsgi),
+                    ('asgi sync view', self.run_asgi_sync),
+                    ('asgi async view', self.run_asgi_async),
+                ):
+                    provider.reset()
+                    started = time.perf_counter()
+                    statuses = run(payload, options)
+                    elapsed = time.perf_counter() - started
+                    ok = sum(1 for code in statuses if code == 200)
+                    self.stdout.write(
+                        f"{mode:<22} {len(statuses) / elapsed:>8.1f} {provider.peak:>15} {ok:>6}"
+                    )
+        finally:
+            provider.shutdown()
+            Transaction.objects.filter(sender=user).delete()
+            if created:
+                user.delete()
+
+    def run_wsgi(self, payload, options):
+        factory = RequestFactory()
+
+        def call(_):
+            request = factory.post('/api/v1/ussd-topup/', payload, content_type='application/json')
+            return views.ussd_topup(request).status_code
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            return list(pool.map(call, range(options['requests'])))
+
+    def run_asgi_sync(self, payload, options):
+        # How Django serves a sync view under ASGI: on its one sync thread.
+        view = sync_to_async(views.ussd_topup, thread_sensitive=True)
+        return asyncio.run(self.gather(view, payload, options))
+
+    def run_asgi_async(self, payload, options):
+        return asyncio.run(self.gather(async_views.ussd_topup, payload, options))
+
+    async def gather(self, view, payload, options):
+        factory = AsyncRequestFactory()
+        slots = asyncio.Semaphore(options['concurrency'])
+
+        async def call():
+            async with slots:
+                request = factory.post('/api/v1/ussd-topup/', payload, content_type='application/json')
+                response = await view(request)
+                return response.status_code
+
+        return await asyncio.gather(*(call() for _ in range(options['requests'])))
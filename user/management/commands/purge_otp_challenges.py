@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from user.models import OTPChallenge
+
+
+class Command(BaseCommand):
+    help = "Delete OTP challenges that are past their TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        removed = OTPChallenge.objects.purge(batch_size=options['batch_size'])
+        self.stdout.write(f"Removed {removed} expired OTP challenges.")
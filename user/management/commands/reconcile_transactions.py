@@ -0,0 +1,77 @@
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q, F
+from django.utils import timezone
+
+from user.db import write_transaction
+from user.models import Transaction
+
+
+def next_delay(age):
+    # Fresh topups are checked often, older ones back off in proportion
+    # to their age so a stuck charge doesn't keep costing provider calls.
+    delay = age * settings.RECONCILE_BACKOFF_FACTOR
+    delay = max(delay, timedelta(seconds=settings.RECONCILE_MIN_DELAY))
+    return min(delay, timedelta(seconds=settings.RECONCILE_MAX_DELAY))
+
+
+def verify(transaction):
+    try:
+        return transaction.verify_transaction()
+    except Exception as error:
+        return {"status": False, "message": f"{error}"}
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Settle pending topups in the background by verifying them with the provider."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.RECONCILE_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=settings.RECONCILE_WORKERS)
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to sleep when nothing is due.")
+        parser.add_argument('--once', action='store_true', help="Process due transactions once and exit.")
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = self.claim_batch(options['batch_size'])
+                if batch:
+                    settled = sum(1 for result in pool.map(verify, batch) if result['status'])
+                    self.stdout.write(f"Verified {len(batch)} pending transactions, {settled} settled.")
+
+                if options['once'] and len(batch) < options['batch_size']:
+                    return
+                if not batch:
+                    time.sleep(options['interval'])
+
+    def claim_batch(self, batch_size):
+        now = timezone.now()
+        # Rows are locked, or on SQLite the whole database, until their
+        # next check is pushed out, so concurrent reconcilers never claim
+        # the same rows. Rows another reconciler holds are skipped.
+        with write_transaction():
+            due = list(
+                Transaction.objects.select_related('sender')
+                .select_for_update(skip_locked=True, of=('self',))
+                .filter(
+                    transaction_type='topup',
+                    status='pending',
+                    completed=False,
+                    created_at__gte=now - timedelta(seconds=settings.RECONCILE_MAX_AGE),
+                )
+                .filter(Q(next_verify_at__isnull=True) | Q(next_verify_at__lte=now))
+                .order_by(F('next_verify_at').asc(nulls_first=True), 'created_at')[:batch_size]
+            )
+
+            for transaction in due:
+                transaction.next_verify_at = now + next_delay(now - transaction.created_at)
+                transaction.verify_attempts += 1
+            Transaction.objects.bulk_update(due, ['next_verify_at', 'verify_attempts'])
+        return due
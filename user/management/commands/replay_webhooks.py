@@ -0,0 +1,143 @@
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import Client
+
+from user import flutterwave
+from user.models import WebhookEvent
+
+WEBHOOK_PATH = '/api/v1/webhooks/flutterwave/'
+
+
+class RecordedProvider:
+    """
+    Local stand-in for Flutterwave in in-process replays. Verifications
+    are answered from the recorded callbacks, so a replay never reaches
+    the real provider.
+    """
+
+    def __init__(self, callbacks):
+        self.charges = {}
+        for body in callbacks:
+            data = body.get('data') if isinstance(body, dict) else None
+            if isinstance(data, dict) and data.get('tx_ref'):
+                self.charges[data['tx_ref']] = data
+
+    def verify_by_reference(self, ref):
+        data = self.charges.get(ref)
+        if data is None:
+            return flutterwave.ProviderResponse(404, {'status': 'error', 'message': 'No transaction was found'})
+        return flutterwave.ProviderResponse(200, {'status': 'success', 'data': data})
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay recorded Flutterwave callbacks against the webhook endpoint at a "
+        "fixed rate. Callbacks are read from a file with one JSON body per line, "
+        "or from the stored WebhookEvent payloads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', help="File of recorded callbacks, one JSON body per line.")
+        parser.add_argument('--rate', type=float, default=200, help="Callbacks per second to send.")
+        parser.add_argument('--repeat', type=int, default=1, help="Send every callback this many times.")
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--timeout', type=float, default=30, help="Seconds to wait for in-process events to be processed.")
+        parser.add_argument(
+            '--url',
+            help="Send to a running server instead of the in-process test client. "
+                 "In-process replays verify against a local stand-in for the provider.",
+        )
+
+    def handle(self, *args, **options):
+        callbacks = self.load(options['source'])
+        if not callbacks:
+            raise CommandError("No recorded callbacks to replay.")
+        callbacks = callbacks * options['repeat']
+
+        if options['url']:
+            results, elapsed = self.replay(callbacks, self.http_sender(options['url']), options)
+        else:
+            provider = RecordedProvider(callbacks)
+            with flutterwave.override_client(provider):
+                results, elapsed = self.replay(callbacks, self.client_sender(), options)
+                # Events are processed in the background, the stand-in has
+                # to stay in place until they are.
+                self.wait_processed(provider.charges, options['timeout'])
+
+        latencies = sorted(latency for _, latency in results)
+        codes = Counter(code for code, _ in results)
+
+        self.stdout.write(f"Sent {len(results)} callbacks in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s)")
+        self.stdout.write(f"Status codes: {dict(codes)}")
+        self.stdout.write(
+            f"Latency p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms"
+        )
+
+    def replay(self, callbacks, send, options):
+        interval = 1 / options['rate']
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            futures = []
+            for position, body in enumerate(callbacks):
+                # Pace submissions to the requested rate.
+                delay = started + position * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(send, body))
+            results = [future.result() for future in futures]
+
+        return results, time.perf_counter() - started
+
+    def wait_processed(self, refs, timeout):
+        deadline = time.monotonic() + timeout
+        unprocessed = WebhookEvent.objects.filter(ref__in=list(refs), processed_at__isnull=True)
+        while unprocessed.exists():
+            if time.monotonic() > deadline:
+                raise CommandError(f"{unprocessed.count()} events were still unprocessed after {timeout}s.")
+            time.sleep(0.05)
+
+    def load(self, source):
+        if source is None:
+            return list(WebhookEvent.objects.values_list('payload', flat=True))
+        with open(source) as recorded:
+            return [json.loads(line) for line in recorded if line.strip()]
+
+    def client_sender(self):
+        def send(body):
+            client = Client()
+            started = time.perf_counter()
+            try:
+                response = client.post(
+                    WEBHOOK_PATH,
+                    data=body,
+                    content_type='application/json',
+                    headers={'verif-hash': settings.FLUTTERWAVE_WEBHOOK_HASH or ''},
+                )
+                return response.status_code, time.perf_counter() - started
+            finally:
+                close_old_connections()
+        return send
+
+    def http_sender(self, url):
+        session = requests.Session()
+
+        def send(body):
+            started = time.perf_counter()
+            response = session.post(
+                url,
+                json=body,
+                headers={'verif-hash': settings.FLUTTERWAVE_WEBHOOK_HASH or ''},
+                timeout=10,
+            )
+            return response.status_code, time.perf_counter() - started
+        return send
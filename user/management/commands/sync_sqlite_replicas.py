@@ -0,0 +1,44 @@
+import time
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary over every file in DATABASE_REPLICAS, once or "
+        "every --interval seconds. Stands in for replication when running with "
+        "local replica files; the interval is the replication lag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="Repeat every N seconds, 0 syncs once.")
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replicas = [settings.DATABASES[alias] for alias in settings.READ_REPLICAS]
+        if not replicas:
+            raise CommandError("DATABASE_REPLICAS is not set.")
+        if any(database['ENGINE'] != 'django.db.backends.sqlite3' for database in [primary, *replicas]):
+            raise CommandError("Only SQLite databases can be synced, use the database's own replication.")
+
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            try:
+                for replica in replicas:
+                    target = sqlite3.connect(replica['NAME'])
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(
+                f"Synced {len(replicas)} replicas in {(time.perf_counter() - started) * 1000:.0f}ms."
+            )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
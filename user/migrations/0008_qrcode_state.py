@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:28
+
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    for name in ('Vendor', 'Customer', 'PaymentCode'):
+        model = apps.get_model('user', name)
+        model.objects.exclude(qrcode__isnull=True).exclude(qrcode='').update(qrcode_state='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='qrcode_state',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='paymentcode',
+            name='qrcode_state',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='vendor',
+            name='qrcode_state',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], editable=False, max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='paymentcode',
+            name='qrcode',
+            field=models.ImageField(blank=True, upload_to='qrcode/payment_code/'),
+        ),
+        migrations.RunPython(mark_existing_ready, migrations.RunPython.noop),
+    ]
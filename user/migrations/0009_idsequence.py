@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_qrcode_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IDSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10, unique=True)),
+                ('next_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:32
+
+import secrets
+
+from django.db import migrations, models
+from django.db.models import Count
+
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def ulid(at):
+    # Frozen copy of user.utils.generate_ref, migrations must not depend on
+    # application code that may change later.
+    value = (int(at.timestamp() * 1000) << 80) | secrets.randbits(80)
+    return ''.join(CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def backfill_refs(apps, schema_editor):
+    Transaction = apps.get_model('user', 'Transaction')
+
+    # Existing refs were handed to the provider, so only blank and
+    # duplicated ones are replaced. Every duplicate after the first gets a
+    # fresh, time-ordered ref.
+    duplicated = (
+        Transaction.objects.exclude(ref='')
+        .values('ref').annotate(count=Count('id')).filter(count__gt=1)
+        .values_list('ref', flat=True)
+    )
+    keep = set()
+    stale = Transaction.objects.filter(models.Q(ref='') | models.Q(ref__in=list(duplicated)))
+    for transaction in stale.order_by('id').only('id', 'ref', 'created_at').iterator(chunk_size=1000):
+        if transaction.ref and transaction.ref not in keep:
+            keep.add(transaction.ref)
+            continue
+        Transaction.objects.filter(pk=transaction.pk).update(ref=ulid(transaction.created_at))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_idsequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='ref',
+            field=models.CharField(blank=True, max_length=26),
+        ),
+        migrations.RunPython(backfill_refs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='ref',
+            field=models.CharField(blank=True, max_length=26, unique=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from user.search import install_search_index
+
+    install_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        statements = [
+            "DROP TRIGGER IF EXISTS user_transaction_search_insert",
+            "DROP TRIGGER IF EXISTS user_transaction_search_update",
+            "DROP TRIGGER IF EXISTS user_transaction_search_delete",
+            "DROP TABLE IF EXISTS user_transaction_search",
+        ]
+    elif connection.vendor == 'postgresql':
+        statements = [
+            "DROP TRIGGER IF EXISTS user_transaction_search_sync ON user_transaction",
+            "DROP FUNCTION IF EXISTS user_transaction_search_sync()",
+            "DROP TABLE IF EXISTS user_transaction_search",
+        ]
+    else:
+        statements = []
+
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0010_transaction_ref_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0011_transaction_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['sender', 'created_at'], name='user_transa_sender__8107cd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['recepient', 'created_at'], name='user_transa_recepie_08d12d_idx'),
+        ),
+    ]
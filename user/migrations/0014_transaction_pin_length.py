@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0013_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='transaction_pin',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AlterField(
+            model_name='vendor',
+            name='transaction_pin',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+    ]
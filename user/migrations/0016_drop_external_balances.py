@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:30
+
+from django.db import migrations
+
+
+def drop_external_balances(apps, schema_editor):
+    # External account balances are summed from their ledger entries.
+    WalletBalance = apps.get_model('user', 'WalletBalance')
+    WalletBalance.objects.filter(wallet__startswith='EXT:').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0015_otpchallenge'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_external_balances, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,14 @@
-import secrets
 import requests
 
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from functools import partial
 
-from django.db import models
+from asgiref.sync import sync_to_async
+
+from django.db import models, transaction as db_transaction, IntegrityError
+from django.db.models import F, Sum
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 
 from django.shortcuts import get_object_or_404
 from django.conf import settings
@@ -12,9 +16,93 @@ from django.conf import settings
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from user.utils import generate_qrcode, generate_ID, generate_otp
+from user import flutterwave
+from user.tasks import enqueue
+from user.utils import render_qrcode, generate_otp, QRCODE_STATES, QRCODE_PENDING, QRCODE_READY
+from user.utils import WalletIDAllocator, WalletIDsExhausted, WALLET_ID_SPACE
+from user.utils import generate_ref, decode_ref, REF_LENGTH
+from user.balances import refresh_wallet_summaries
+from user.db import write_transaction
+
+# Ledger accounts for money that enters or leaves the platform. Wallet
+# accounts are keyed by their VID/CID.
+EXTERNAL_PREFIX = 'EXT:'
+PROVIDER_ACCOUNT = 'EXT:FLUTTERWAVE'
+OPENING_ACCOUNT = 'EXT:OPENING'
+
+
+def is_external(wallet):
+    return wallet.startswith(EXTERNAL_PREFIX)
+
+VENDOR_ID_PREFIX = 'VEND'
+CUSTOMER_ID_PREFIX = 'CUST'
+
+
+class IDSequenceManager(models.Manager):
+    def lease(self, prefix, size):
+        """
+        Reserve the next `size` counter values for `prefix` and return them
+        as a (start, end) range.
+        """
+        with write_transaction():
+            sequence, _ = self.select_for_update().get_or_create(prefix=prefix)
+            start = sequence.next_value
+            end = min(start + size, WALLET_ID_SPACE)
+            if start >= end:
+                raise WalletIDsExhausted(f"No wallet IDs left for {prefix}")
+            self.filter(pk=sequence.pk).update(next_value=end)
+        return start, end
+
+
+class IDSequence(models.Model):
+    prefix = models.CharField(max_length=10, unique=True)
+    next_value = models.PositiveIntegerField(default=0)
+
+    objects = IDSequenceManager()
+
+    def __str__(self):
+        return f"{self.prefix} {self.next_value}"
+
+
+wallet_ids = WalletIDAllocator(lease_block=IDSequence.objects.lease)
+
+
+def save_with_wallet_id(instance, id_field, prefix, save, *args, **kwargs):
+    if getattr(instance, id_field):
+        return save(*args, **kwargs)
+
+    for attempt in range(3):
+        setattr(instance, id_field, wallet_ids.allocate(prefix))
+        try:
+            with db_transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            # Allocated IDs never repeat, so a clash can only be with an ID
+            # issued by the old random generator. Anything else is re-raised.
+            taken = type(instance).objects.filter(**{id_field: getattr(instance, id_field)}).exists()
+            if not taken or attempt == 2:
+                raise
+
+
+def keep_rendered_qrcode(instance, kwargs):
+    """
+    save() kwargs that leave `qrcode` and `qrcode_state` alone when an
+    existing row is saved. The background render writes those with
+    .update(), a full save of an instance loaded before it finished would
+    put the pending state back for good.
+    """
+    if instance._state.adding or kwargs.get('update_fields') is not None:
+        return kwargs
+    skipped = {'qrcode', 'qrcode_state', *instance.get_deferred_fields()}
+    fields = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.attname not in skipped and field.name not in skipped
+    ]
+    return {**kwargs, 'update_fields': fields}
+
 
 class User(AbstractUser):
     username = models.CharField(max_length=50)
@@ -24,6 +112,8 @@ class User(AbstractUser):
 
     is_customer = models.BooleanField(default=False)
     is_vendor = models.BooleanField(default=False)
+    # Tokens from logins before this are rejected, see user.authentication.
+    tokens_valid_after = models.DateTimeField(null=True, blank=True, editable=False)
 
     USERNAME_FIELD = 'phone'
     # REQUIRED_FIELDS = ['username']
@@ -42,50 +132,72 @@ class Vendor(models.Model):
     business_type = models.CharField(max_length=30, blank=True)
     institution = models.CharField(max_length=200, null=True, blank=True)
     qrcode = models.ImageField(upload_to='qrcode/vendors/', null=True, blank=True)
-    transaction_pin = models.CharField(max_length=50, null=True, blank=True)
+    qrcode_state = models.CharField(max_length=10, choices=QRCODE_STATES, blank=True, editable=False)
+    transaction_pin = models.CharField(max_length=128, null=True, blank=True)
     
     def save(self, *args, **kwargs):
-        generated_ID = generate_ID(vendor=True)
-
-        while Vendor.objects.filter(VID=generated_ID).exists():
-            generated_ID = generate_ID(vendor=True)
-
-        if not self.VID:  
-            self.VID = generated_ID
-
+        render = False
         if (
             self.user.email 
             and self.business_name 
             and self.business_type 
             and self.institution 
             and not self.qrcode  # Checks if there's no existing QR code
+            and self.qrcode_state not in (QRCODE_PENDING, QRCODE_READY)
         ):
-            data = {
-                'ID': self.VID,
-                'phone': self.user.phone,
-                'email': self.user.email,
-                'business_name': self.business_name,
-                'business_type': self.business_type,
-                'institution': self.institution,
-            }
-
-            self.qrcode = generate_qrcode(data)
-
-        super().save(*args, **kwargs)
+            self.qrcode_state = QRCODE_PENDING
+            render = True
+        else:
+            kwargs = keep_rendered_qrcode(self, kwargs)
+
+        save_with_wallet_id(self, 'VID', VENDOR_ID_PREFIX, super().save, *args, **kwargs)
+
+        # Rendering happens off the request, the image URL is filled in
+        # once the background job stores it.
+        if render:
+            enqueue(render_qrcode, Vendor, self.pk)
+
+    def qrcode_data(self):
+        return {
+            'ID': self.VID,
+            'phone': self.user.phone,
+            'email': self.user.email,
+            'business_name': self.business_name,
+            'business_type': self.business_type,
+            'institution': self.institution,
+        }
 
     def __str__(self):
         return self.VID
     
-    def deposit(self, amount):
-        self.balance += Decimal(amount)
-        self.save()
+    @property
+    def wallet_id(self):
+        return self.VID
+
+    def deposit(self, amount, transaction=None, counterparty=PROVIDER_ACCOUNT):
+        amount = Decimal(amount)
+        with write_transaction():
+            Vendor.objects.filter(pk=self.pk).update(balance=F('balance') + amount)
+            LedgerEntry.objects.post(
+                [(self.wallet_id, amount), (counterparty, -amount)],
+                transaction=transaction,
+            )
+        self.refresh_from_db(fields=['balance'])
         return self.balance
 
-    def withdraw(self, amount):
+    def withdraw(self, amount, transaction=None, counterparty=PROVIDER_ACCOUNT):
         amount = Decimal(amount)
-        if amount <= self.balance:
-            self.balance -= amount
-            self.save()
+        with write_transaction():
+            updated = Vendor.objects.filter(pk=self.pk, balance__gte=amount).update(
+                balance=F('balance') - amount
+            )
+            if updated:
+                LedgerEntry.objects.post(
+                    [(self.wallet_id, -amount), (counterparty, amount)],
+                    transaction=transaction,
+                )
+        if updated:
+            self.refresh_from_db(fields=['balance'])
             return self.balance
         else:
             return None
@@ -104,48 +216,68 @@ class Customer(models.Model):
     gender = models.CharField(max_length=20, null=True, blank=True)
     institution = models.CharField(max_length=200, blank=True)
     qrcode = models.ImageField(upload_to='qrcode/customers/', null=True, blank=True)
-    transaction_pin = models.CharField(max_length=50, null=True, blank=True)
+    qrcode_state = models.CharField(max_length=10, choices=QRCODE_STATES, blank=True, editable=False)
+    transaction_pin = models.CharField(max_length=128, null=True, blank=True)
 
     def save(self, *args, **kwargs):
-        generated_ID = generate_ID(customer=True)
-
-        while Customer.objects.filter(CID=generated_ID).exists():
-            generated_ID = generate_ID(customer=True)
-
-        if not self.CID:  
-            self.CID = generated_ID
-
+        render = False
         if(
             self.user.email 
             and self.fullname
             and self.institution 
             and not self.qrcode  # Checks if there's no existing QR code
+            and self.qrcode_state not in (QRCODE_PENDING, QRCODE_READY)
         ):
-            data = {
-                'ID': self.CID,
-                'phone': self.user.phone,
-                'email': self.user.email,
-                'fullname': self.fullname,
-                'institution': self.institution,
-            }
+            self.qrcode_state = QRCODE_PENDING
+            render = True
+        else:
+            kwargs = keep_rendered_qrcode(self, kwargs)
 
-            self.qrcode = generate_qrcode(data)
+        save_with_wallet_id(self, 'CID', CUSTOMER_ID_PREFIX, super().save, *args, **kwargs)
 
-        super().save(*args, **kwargs)
+        if render:
+            enqueue(render_qrcode, Customer, self.pk)
+
+    def qrcode_data(self):
+        return {
+            'ID': self.CID,
+            'phone': self.user.phone,
+            'email': self.user.email,
+            'fullname': self.fullname,
+            'institution': self.institution,
+        }
 
     def __str__(self):
         return self.CID
     
-    def deposit(self, amount):
-        self.balance += Decimal(amount)
-        self.save()
+    @property
+    def wallet_id(self):
+        return self.CID
+
+    def deposit(self, amount, transaction=None, counterparty=PROVIDER_ACCOUNT):
+        amount = Decimal(amount)
+        with write_transaction():
+            Customer.objects.filter(pk=self.pk).update(balance=F('balance') + amount)
+            LedgerEntry.objects.post(
+                [(self.wallet_id, amount), (counterparty, -amount)],
+                transaction=transaction,
+            )
+        self.refresh_from_db(fields=['balance'])
         return self.balance
 
-    def withdraw(self, amount):
+    def withdraw(self, amount, transaction=None, counterparty=PROVIDER_ACCOUNT):
         amount = Decimal(amount)
-        if amount <= self.balance:
-            self.balance -= amount
-            self.save()
+        with write_transaction():
+            updated = Customer.objects.filter(pk=self.pk, balance__gte=amount).update(
+                balance=F('balance') - amount
+            )
+            if updated:
+                LedgerEntry.objects.post(
+                    [(self.wallet_id, -amount), (counterparty, amount)],
+                    transaction=transaction,
+                )
+        if updated:
+            self.refresh_from_db(fields=['balance'])
             return self.balance
         else:
             return None
@@ -159,7 +291,7 @@ class Transaction(models.Model):
     sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='sender', null=True, blank=True)
     recepient = models.ForeignKey('User', on_delete=models.CASCADE, related_name='recepient', null=True, blank=True)
 
-    ref = models.CharField(max_length=16, blank=True)
+    ref = models.CharField(max_length=REF_LENGTH, unique=True, blank=True)
     amount = models.DecimalField(max_digits=9, decimal_places=2, default=0.00)
     transaction_fee = models.DecimalField(max_digits=9, decimal_places=2, default=0.00)
     transaction_type = models.CharField(max_length=20)
@@ -168,89 +300,357 @@ class Transaction(models.Model):
     status = models.CharField(max_length=10)
     completed = models.BooleanField(default=False)
 
-    def verify_transaction(self):
-        user = get_object_or_404(User, phone=self.sender)
+    # Scheduling for the background reconciler of pending topups.
+    verify_attempts = models.PositiveIntegerField(default=0, editable=False)
+    next_verify_at = models.DateTimeField(null=True, blank=True, editable=False)
 
-        url = "https://api.flutterwave.com/v3/transactions/verify_by_reference"
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_verify_at']),
+            models.Index(fields=['sender', 'created_at']),
+            models.Index(fields=['recepient', 'created_at']),
+        ]
 
-        token = settings.FLUTTERWAVE_SECRET_KEY
-        headers = {
-            "Authorization": f"Bearer {token}"
-        }
+    def verify_transaction(self):
+        try:
+            response = flutterwave.get_client().verify_by_reference(self.ref)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            return {"status": False, "message": "Connection Error"}
+        return self.verification_result(response)
 
-        param = {
-            "tx_ref": self.ref,
-        }
-        
+    async def averify_transaction(self):
         try:
-            response = requests.get(url=url, headers=headers, params=param)
-            if response.status_code == 200:
-                if response.json()['status'] == 'success':
-                    if not self.completed and response.json()['data']['amount'] == self.amount:
-                        amount = Decimal(response.json()['data']['amount'] - self.transaction_fee)
-                        if user.is_vendor:
-                            vendor = get_object_or_404(Vendor, user=user)
-                            vendor.deposit(amount)
-                            vendor.save()
-                        elif user.is_customer:
-                            customer = get_object_or_404(Customer, user=user)
-                            customer.deposit(amount)
-                            customer.save()
-                        
-                        self.status = response.json()['status']
-                        self.completed = True
-                        self.save()
-                    else:
-                        return {"status": False, "message": "Transaction already verified"}
-                elif response.json()['status'] == 'pending':
-                    self.status = response.json()['status']
-                    self.save()
+            response = await flutterwave.get_async_client().verify_by_reference(self.ref)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            return {"status": False, "message": "Connection Error"}
+        return await sync_to_async(self.verification_result)(response)
+
+    def verification_result(self, response):
+        user = self.sender
+
+        if response.status_code == 200:
+            # `status` says whether the API call worked, `data.status`
+            # whether the charge was paid. USSD and bank transfer charges
+            # verify as success with data.status pending until the
+            # customer pays, only 'successful' is credited.
+            charge_status = response.data.get('status')
+            if response.status == 'failed' or charge_status == 'failed':
+                # Terminal, the reconciler stops polling it.
+                Transaction.objects.filter(pk=self.pk, completed=False).update(status='failed')
+                self.status = 'failed'
+                return {"status": False, "message": "Transaction failed"}
+            elif response.status == 'success' and charge_status == 'successful':
+                try:
+                    paid = Decimal(str(response.data.get('amount')))
+                except InvalidOperation:
                     return {"status": False, "message": ""}
+                if paid == self.amount:
+                    amount = paid - self.transaction_fee
+                    if not self.credit_topup(user, amount):
+                        return {"status": False, "message": "Transaction already verified"}
                 else:
-                    return {"status": False, "message": ""}   
-
-                context = {
-                    'status': True,
-                    'data': {
-                        'ref': self.ref,
-                        'sender': user.phone,
-                        'recepient': "",
-                        'amount': self.amount,
-                        'transaction_fee': self.transaction_fee,
-                        'transaction_type': self.transaction_type,
-                        'description': self.description,
-                        'created_at': self.created_at,
-                        'status': self.status,
-                    }
-                }
-                return context
+                    return {"status": False, "message": "Transaction already verified"}
+            elif charge_status == 'pending' or response.status == 'pending':
+                Transaction.objects.filter(pk=self.pk, completed=False).update(status='pending')
+                self.status = 'pending'
+                return {"status": False, "message": ""}
             else:
-                return {
-                    "status": False, 
-                    "message": {
-                        "response_code": f"{response}",
-                        # "data": response.json()
-                    }
-                }
-        except requests.exceptions.ConnectionError:
+                return {"status": False, "message": ""}
+
             context = {
-                "status": False,
-                "message": "Connection Error"
+                'status': True,
+                'data': {
+                    'ref': self.ref,
+                    'sender': user.phone,
+                    'recepient': "",
+                    'amount': self.amount,
+                    'transaction_fee': self.transaction_fee,
+                    'transaction_type': self.transaction_type,
+                    'description': self.description,
+                    'created_at': self.created_at,
+                    'status': self.status,
+                }
             }
             return context
+        else:
+            return {
+                "status": False, 
+                "message": {
+                    "response_code": f"{response}",
+                    # "data": response.payload
+                }
+            }
 
-    def save(self, *args, **kwargs):
-        generated_ref = secrets.token_urlsafe(16)
-        while Transaction.objects.filter(ref=generated_ref).exists():
-            generated_ref = secrets.token_urlsafe(16)
+    def credit_topup(self, user, amount):
+        """
+        Credit a verified topup to the sender's wallet exactly once. Returns
+        False when another request or the reconciler already settled it.
+        """
+        with write_transaction():
+            claimed = Transaction.objects.filter(pk=self.pk, completed=False).update(
+                status='success', completed=True
+            )
+            if not claimed:
+                return False
+
+            if user.is_vendor:
+                vendor = get_object_or_404(Vendor, user=user)
+                vendor.deposit(amount, transaction=self)
+            elif user.is_customer:
+                customer = get_object_or_404(Customer, user=user)
+                customer.deposit(amount, transaction=self)
+
+        self.status = 'success'
+        self.completed = True
+        return True
+
+    @property
+    def ref_created_at(self):
+        return decode_ref(self.ref)
 
+    def save(self, *args, **kwargs):
         if not self.ref:  
-            self.ref = generated_ref
+            self.ref = generate_ref()
 
         super().save(*args, **kwargs)
 
+class WebhookEvent(models.Model):
+    ref = models.CharField(max_length=64, unique=True)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event} {self.ref}"
+
+    def process(self):
+        transaction = Transaction.objects.select_related('sender').filter(ref=self.ref).first()
+        if transaction is not None and not transaction.completed:
+            # Never trust the callback body for amounts, settle through the
+            # same provider verification the verify endpoint uses.
+            transaction.verify_transaction()
+
+        WebhookEvent.objects.filter(pk=self.pk).update(processed_at=timezone.now())
+
+class ExpiringManager(models.Manager):
+    def purge(self, batch_size=1000):
+        """
+        Delete expired rows in batches, returns how many were removed.
+        """
+        removed = 0
+        while True:
+            expired = list(
+                self.filter(expires_at__lt=timezone.now()).values_list('pk', flat=True)[:batch_size]
+            )
+            if not expired:
+                return removed
+            removed += self.filter(pk__in=expired).delete()[0]
+
+
+class IdempotencyKey(models.Model):
+    # `scope` is the caller, a key only ever replays for the same caller.
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = ExpiringManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+    @property
+    def completed(self):
+        return self.status_code is not None
+
+
+class OTPChallenge(models.Model):
+    # Only a keyed hash of the code is stored. A challenge is spent by the
+    # first correct verification, or after OTP_MAX_ATTEMPTS guesses.
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='otp_challenges')
+    purpose = models.CharField(max_length=20)
+    code_hash = models.CharField(max_length=64)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    used_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ExpiringManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'purpose', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.purpose}"
+
 class PaymentCode(models.Model):
     user = models.ForeignKey('User', on_delete=models.CASCADE, default=None, blank=True)
     transaction = models.OneToOneField('Transaction', on_delete=models.CASCADE, default=None, blank=True)
 
-    qrcode = models.ImageField(upload_to='qrcode/payment_code/')
\ No newline at end of file
+    qrcode = models.ImageField(upload_to='qrcode/payment_code/', blank=True)
+    qrcode_state = models.CharField(max_length=10, choices=QRCODE_STATES, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        render = not self.qrcode and self.qrcode_state not in (QRCODE_PENDING, QRCODE_READY)
+        if render:
+            self.qrcode_state = QRCODE_PENDING
+        else:
+            kwargs = keep_rendered_qrcode(self, kwargs)
+
+        super().save(*args, **kwargs)
+
+        if render:
+            enqueue(render_qrcode, PaymentCode, self.pk)
+
+    def qrcode_data(self):
+        transaction = self.transaction
+        return {
+            "ref": transaction.ref,
+            "sender": transaction.sender.phone,
+            "recepient": transaction.recepient.phone,
+            "amount": f"{transaction.amount}",
+            "description": transaction.description,
+            "status": transaction.status,
+            "created_at": f"{transaction.created_at}",
+        }
+
+
+class LedgerManager(models.Manager):
+    def post(self, legs, transaction=None, created_at=None):
+        """
+        Append one balanced posting to the ledger and fold it into the
+        materialized wallet balances. `legs` is a list of (wallet, amount)
+        pairs where credits are positive and debits negative.
+        """
+        return self.post_many([(transaction, legs)], created_at=created_at)
+
+    def post_many(self, postings, created_at=None):
+        """
+        Append several (transaction, legs) postings at once, with a single
+        insert and one set-based update of the wallet balances. Entries are
+        dated now unless `created_at` backdates them.
+        """
+        created_at = created_at or timezone.now()
+        entries = []
+        totals = {}
+        for transaction, legs in postings:
+            legs = [(wallet, Decimal(amount)) for wallet, amount in legs]
+            if sum(amount for _, amount in legs) != 0:
+                raise ValueError("Ledger postings must balance to zero")
+            for wallet, amount in legs:
+                entries.append(LedgerEntry(wallet=wallet, amount=amount, transaction=transaction, created_at=created_at))
+                # External accounts are a leg of every topup and payout,
+                # a materialized row for them would be one lock all
+                # provider traffic queues on. Their balance is summed from
+                # the entries when asked for.
+                if is_external(wallet):
+                    continue
+                balance, count = totals.get(wallet, (Decimal(0), 0))
+                totals[wallet] = (balance + amount, count + 1)
+
+        with write_transaction():
+            entries = self.bulk_create(entries)
+            if len(totals) == 1:
+                (wallet, (amount, count)), = totals.items()
+                WalletBalance.objects.apply(wallet, amount, count)
+            elif totals:
+                WalletBalance.objects.apply_many(totals)
+            # Cached wallet summaries are rewritten once the posting is
+            # committed, never with balances that may roll back.
+            db_transaction.on_commit(partial(refresh_wallet_summaries, list(totals)))
+        return entries
+
+    def balance(self, wallet):
+        """
+        Current ledger balance of `wallet`, from its materialized row or,
+        for external accounts, from the entries.
+        """
+        if is_external(wallet):
+            total = self.filter(wallet=wallet).aggregate(total=Sum('amount'))['total']
+        else:
+            total = WalletBalance.objects.filter(wallet=wallet).values_list('balance', flat=True).first()
+        return total or Decimal('0.00')
+
+    def balance_at(self, wallet, at):
+        total = self.filter(wallet=wallet, created_at__lte=at).aggregate(total=Sum('amount'))['total']
+        return total or Decimal('0.00')
+
+
+class LedgerEntry(models.Model):
+    wallet = models.CharField(max_length=20)
+    transaction = models.ForeignKey('Transaction', on_delete=models.PROTECT, related_name='entries', null=True, blank=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = LedgerManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'created_at']),
+        ]
+        verbose_name_plural = 'ledger entries'
+
+    def __str__(self):
+        return f"{self.wallet} {self.amount}"
+
+
+class WalletBalanceManager(models.Manager):
+    def apply(self, wallet, amount, entries=1):
+        changes = {
+            'balance': F('balance') + amount,
+            'entries': F('entries') + entries,
+            'updated_at': timezone.now(),
+        }
+        if not self.filter(wallet=wallet).update(**changes):
+            # First posting for this wallet.
+            self.get_or_create(wallet=wallet)
+            self.filter(wallet=wallet).update(**changes)
+
+    def apply_many(self, totals):
+        """
+        Apply {wallet: (amount, entries)} in one UPDATE, creating the rows
+        of wallets posted to for the first time.
+        """
+        wallets = list(totals)
+        existing = set(self.filter(wallet__in=wallets).values_list('wallet', flat=True))
+        missing = [WalletBalance(wallet=wallet) for wallet in wallets if wallet not in existing]
+        if missing:
+            self.bulk_create(missing, ignore_conflicts=True)
+
+        # Payouts mostly repeat the same amount, so wallets are grouped by
+        # their change and each group is one plain UPDATE ... WHERE IN.
+        groups = {}
+        for wallet, change in totals.items():
+            groups.setdefault(change, []).append(wallet)
+
+        now = timezone.now()
+        for (amount, count), group in groups.items():
+            self.filter(wallet__in=group).update(
+                balance=F('balance') + amount,
+                entries=F('entries') + count,
+                updated_at=now,
+            )
+
+
+class WalletBalance(models.Model):
+    wallet = models.CharField(max_length=20, unique=True)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    entries = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = WalletBalanceManager()
+
+    def __str__(self):
+        return f"{self.wallet} {self.balance}"
@@ -0,0 +1,104 @@
+import hmac
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from user.models import OTPChallenge
+from user.tasks import enqueue
+from user.utils import generate_otp
+
+logger = logging.getLogger(__name__)
+
+# Challenges live in the database, so a code sent by one worker process
+# verifies in any other.
+
+PURPOSES = ('verification', 'reset_pin')
+
+# Purposes the verify endpoint spends on its own. The others are spent by
+# the request they authorize, a reset_pin code by the PIN reset itself.
+VERIFY_PURPOSES = ('verification',)
+
+
+class OTPError(Exception):
+    message = "Invalid OTP"
+
+
+class OTPExpired(OTPError):
+    message = "OTP has expired or has already been used, request a new one"
+
+
+class InvalidOTP(OTPError):
+    def __init__(self, attempts_left):
+        super().__init__(self.message)
+        self.attempts_left = attempts_left
+
+
+def code_hash(user_id, purpose, code):
+    message = f"{user_id}:{purpose}:{code}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def log_otp(user, code, purpose):
+    """
+    Default OTP_SENDER, for development. Production points OTP_SENDER at
+    an SMS gateway callable taking the same arguments.
+    """
+    logger.info("OTP for %s (%s): %s", user.phone, purpose, code)
+
+
+def send_otp(user, purpose):
+    """
+    Replace any pending `purpose` challenge of `user` with a new one and
+    deliver its code in the background. Returns the challenge.
+    """
+    code = generate_otp(settings.OTP_DIGITS)
+    # The pending code is only dropped together with storing its
+    # replacement, and concurrent sends replace each other in turn.
+    with db_transaction.atomic():
+        OTPChallenge.objects.filter(user_id=user.pk, purpose=purpose, used_at__isnull=True).delete()
+        challenge = OTPChallenge.objects.create(
+            user_id=user.pk,
+            purpose=purpose,
+            code_hash=code_hash(user.pk, purpose, code),
+            expires_at=timezone.now() + timedelta(seconds=settings.OTP_TTL),
+        )
+    enqueue(import_string(settings.OTP_SENDER), user, code, purpose)
+    return challenge
+
+
+def verify_otp(user, purpose, code):
+    """
+    Spend the pending `purpose` challenge of `user` if `code` matches,
+    otherwise raise an OTPError. A code verifies at most once.
+    """
+    now = timezone.now()
+    challenge = (
+        OTPChallenge.objects.filter(user_id=user.pk, purpose=purpose, used_at__isnull=True, expires_at__gt=now)
+        .order_by('-created_at')
+        .values_list('pk', 'code_hash')
+        .first()
+    )
+    if challenge is None:
+        raise OTPExpired()
+    pk, stored = challenge
+
+    # Each guess is counted before it is compared, so concurrent guesses
+    # can't get past the limit.
+    pending = OTPChallenge.objects.filter(pk=pk, used_at__isnull=True, attempts__lt=settings.OTP_MAX_ATTEMPTS)
+    if not pending.update(attempts=F('attempts') + 1):
+        raise OTPExpired()
+
+    if not hmac.compare_digest(stored, code_hash(user.pk, purpose, str(code))):
+        attempts = OTPChallenge.objects.values_list('attempts', flat=True).get(pk=pk)
+        raise InvalidOTP(max(0, settings.OTP_MAX_ATTEMPTS - attempts))
+
+    # Two requests with the right code race here, only one of them marks
+    # the challenge used.
+    if not OTPChallenge.objects.filter(pk=pk, used_at__isnull=True).update(used_at=now):
+        raise OTPExpired()
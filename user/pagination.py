@@ -0,0 +1,94 @@
+import json
+import heapq
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(row, direction):
+    value = json.dumps([row.created_at.isoformat(), row.pk, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(created_at)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor()
+
+    if created_at is None or not isinstance(pk, int) or direction not in ('next', 'prev'):
+        raise InvalidCursor()
+    return created_at, pk, direction
+
+
+def after(queryset, created_at, pk, descending):
+    if descending:
+        return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    return queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+
+
+def ordered(queryset, descending):
+    if descending:
+        return queryset.order_by('-created_at', '-pk')
+    return queryset.order_by('created_at', 'pk')
+
+
+def keyset_page(querysets, cursor=None, page_size=10, newest_first=False):
+    """
+    Return one page in (created_at, id) order along with the `next` and
+    `prev` cursors. Each page is a single index range scan, so deep pages
+    cost the same as the first and no COUNT(*) is needed.
+
+    `querysets` may be a list, e.g. the sent and received sides of a feed.
+    Each side is read with its own index and the sides are merged in
+    Python, rather than running one OR query over the table.
+    """
+    if not isinstance(querysets, (list, tuple)):
+        querysets = [querysets]
+
+    direction = 'next'
+    if cursor:
+        created_at, pk, direction = decode_cursor(cursor)
+
+    # Paging backwards reads in the opposite order and flips the result.
+    descending = newest_first if direction == 'next' else not newest_first
+
+    sides = []
+    for queryset in querysets:
+        if cursor:
+            queryset = after(queryset, created_at, pk, descending)
+        # One extra row tells us whether there is another page that way.
+        sides.append(ordered(queryset, descending)[:page_size + 1])
+
+    rows = []
+    seen = set()
+    for row in heapq.merge(*sides, key=lambda row: (row.created_at, row.pk), reverse=descending):
+        # A row can be on more than one side, e.g. a transfer to oneself.
+        if row.pk in seen:
+            continue
+        seen.add(row.pk)
+        rows.append(row)
+        if len(rows) > page_size:
+            break
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'prev':
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if direction == 'prev' or has_more:
+            next_cursor = encode_cursor(rows[-1], 'next')
+        if cursor and (direction == 'next' or has_more):
+            prev_cursor = encode_cursor(rows[0], 'prev')
+
+    return rows, next_cursor, prev_cursor
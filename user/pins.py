@@ -0,0 +1,168 @@
+import hmac
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from django.conf import settings
+from django.core.cache import caches
+
+from user.models import Vendor, Customer
+
+# bcrypt releases the GIL, so hashing runs on a small shared pool: PIN
+# checks from several request threads overlap, but never take more than
+# PIN_HASH_WORKERS cores away from the rest of the worker.
+
+PIN_PATTERN = re.compile(r'^\d{4,6}$')
+
+
+class PinError(Exception):
+    message = "Invalid authorization pin"
+
+
+class PinNotSet(PinError):
+    message = "Authorization pin has not been set"
+
+
+class PinLocked(PinError):
+    message = "Too many wrong authorization pins, try again later"
+
+    def __init__(self, retry_after):
+        super().__init__(self.message)
+        self.retry_after = retry_after
+
+
+class InvalidPin(PinError):
+    def __init__(self, attempts_left):
+        super().__init__(self.message)
+        self.attempts_left = attempts_left
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.PIN_HASH_WORKERS, thread_name_prefix='pin')
+    return _executor
+
+
+def run(func, *args):
+    return executor().submit(func, *args).result()
+
+
+def valid_pin(pin):
+    return isinstance(pin, str) and PIN_PATTERN.match(pin) is not None
+
+
+def hash_pin(pin, rounds=None):
+    salt = bcrypt.gensalt(rounds or settings.PIN_HASH_ROUNDS)
+    return run(bcrypt.hashpw, pin.encode(), salt).decode()
+
+
+def is_hashed(stored):
+    return stored.startswith('$2')
+
+
+def needs_upgrade(stored):
+    # '$2b$<cost>$...'
+    return not is_hashed(stored) or int(stored.split('$')[2]) != settings.PIN_HASH_ROUNDS
+
+
+def matches(pin, stored):
+    if not is_hashed(stored):
+        # PINs saved before hashing was in place.
+        return hmac.compare_digest(pin.encode(), stored.encode())
+    return run(bcrypt.checkpw, pin.encode()[:72], stored.encode())
+
+
+def pin_holder(user):
+    """
+    The vendor or customer wallet whose PIN authorizes `user`'s payments.
+    """
+    model = Vendor if user.is_vendor else Customer
+    try:
+        return model.objects.only('pk', 'transaction_pin').get(user_id=user.pk)
+    except model.DoesNotExist:
+        # Users without a wallet, such as staff, have no PIN either.
+        raise PinNotSet()
+
+
+def lockout_cache():
+    return caches[settings.PIN_CACHE]
+
+
+def attempts_key(wallet):
+    return f"pin-attempts:{wallet._meta.model_name}:{wallet.pk}"
+
+
+def locked_key(wallet):
+    return f"pin-locked:{wallet._meta.model_name}:{wallet.pk}"
+
+
+def locked_for(wallet):
+    until = lockout_cache().get(locked_key(wallet))
+    return max(0, until - time.time()) if until else 0
+
+
+def record_failure(wallet):
+    cache = lockout_cache()
+    key = attempts_key(wallet)
+    cache.add(key, 0, timeout=settings.PIN_LOCKOUT_SECONDS)
+    try:
+        attempts = cache.incr(key)
+    except ValueError:
+        attempts = 1
+        cache.set(key, attempts, timeout=settings.PIN_LOCKOUT_SECONDS)
+
+    if attempts >= settings.PIN_MAX_ATTEMPTS:
+        cache.set(locked_key(wallet), time.time() + settings.PIN_LOCKOUT_SECONDS, timeout=settings.PIN_LOCKOUT_SECONDS)
+        cache.delete(key)
+    return max(0, settings.PIN_MAX_ATTEMPTS - attempts)
+
+
+def clear_failures(wallet):
+    lockout_cache().delete_many([attempts_key(wallet), locked_key(wallet)])
+
+
+def check_pin(wallet, pin):
+    """
+    Raise a PinError unless `pin` is the transaction PIN of `wallet`.
+    Hashes made at another cost, or stored before hashing, are replaced
+    with one at PIN_HASH_ROUNDS once the PIN is known.
+    """
+    wait = locked_for(wallet)
+    if wait:
+        raise PinLocked(wait)
+
+    stored = wallet.transaction_pin
+    if not stored:
+        raise PinNotSet()
+
+    pin = str(pin)
+    if not matches(pin, stored):
+        attempts_left = record_failure(wallet)
+        if not attempts_left:
+            raise PinLocked(settings.PIN_LOCKOUT_SECONDS)
+        raise InvalidPin(attempts_left)
+
+    clear_failures(wallet)
+    if needs_upgrade(stored):
+        upgraded = hash_pin(pin)
+        # Only replaces the hash that was checked, a PIN changed in the
+        # meantime stays.
+        type(wallet).objects.filter(pk=wallet.pk, transaction_pin=stored).update(transaction_pin=upgraded)
+        wallet.transaction_pin = upgraded
+
+
+def set_pin(wallet, pin):
+    wallet.transaction_pin = hash_pin(pin)
+    type(wallet).objects.filter(pk=wallet.pk).update(transaction_pin=wallet.transaction_pin)
+    clear_failures(wallet)
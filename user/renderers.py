@@ -0,0 +1,48 @@
+import datetime
+from decimal import Decimal
+
+from django.utils.functional import Promise
+from django.db.models.query import QuerySet
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    # Types the DRF encoder knows about that orjson doesn't, encoded the
+    # same way it does them so switching renderers doesn't change output.
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Promise):
+        return str(value)
+    if isinstance(value, datetime.timedelta):
+        return str(value.total_seconds())
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, QuerySet):
+        return tuple(value)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, '__iter__'):
+        return list(value)
+    raise TypeError(f"Type {type(value).__name__} is not JSON serializable")
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson. Falls back to the stock renderer when
+    orjson isn't installed or the client asked for indented output.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        return orjson.dumps(data, default=default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,125 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+
+# Every write and, by default, every read goes to the primary. Views that
+# only list or search opt in to a replica with @read_from_replica, unless
+# the requesting user wrote something in the last READ_YOUR_WRITES_SECONDS,
+# since a replica may not have caught up with that write yet.
+
+_read_from = ContextVar('read_from', default=None)
+_request_writes = ContextVar('request_writes', default=None)
+
+
+def sticky_key(user_id):
+    return f"read-your-writes:{user_id}"
+
+
+def recently_wrote(user):
+    if user is None or not user.is_authenticated:
+        return False
+    return caches[settings.READ_YOUR_WRITES_CACHE].get(sticky_key(user.pk)) is not None
+
+
+def stick_to_primary(user_id):
+    caches[settings.READ_YOUR_WRITES_CACHE].set(sticky_key(user_id), True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+def choose_replica(user):
+    """
+    The replica alias `user`'s reads can go to, or None for the primary.
+    """
+    if not settings.READ_REPLICAS or recently_wrote(user):
+        return None
+    return random.choice(settings.READ_REPLICAS)
+
+
+@contextmanager
+def replica_reads(user):
+    # One replica for the whole block, so a page and its count agree.
+    token = _read_from.set(choose_replica(user))
+    try:
+        yield
+    finally:
+        _read_from.reset(token)
+
+
+def read_from_replica(methods=('GET',)):
+    """
+    Route the reads of a view to a replica for `methods`. Goes below
+    @api_view and the policy decorators, so request.user is the API user.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper_func(request, *args, **kwargs):
+            if request.method not in methods:
+                return view_func(request, *args, **kwargs)
+            with replica_reads(request.user):
+                return view_func(request, *args, **kwargs)
+        return wrapper_func
+
+    return decorator
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_from.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes.add(model._meta.label)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+@sync_and_async_middleware
+def read_your_writes_middleware(get_response):
+    """
+    Keep a user's reads on the primary for a while after a request of
+    theirs wrote to it. DRF sets request.user on the underlying request
+    once it has authenticated the token.
+    """
+    def wrote(request, writes):
+        user = getattr(request, 'user', None)
+        return writes and user is not None and user.is_authenticated
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            writes = set()
+            token = _request_writes.set(writes)
+            try:
+                response = await get_response(request)
+            finally:
+                _request_writes.reset(token)
+            if wrote(request, writes):
+                await caches[settings.READ_YOUR_WRITES_CACHE].aset(
+                    sticky_key(request.user.pk), True, settings.READ_YOUR_WRITES_SECONDS
+                )
+            return response
+    else:
+        def middleware(request):
+            writes = set()
+            token = _request_writes.set(writes)
+            try:
+                response = get_response(request)
+            finally:
+                _request_writes.reset(token)
+            if wrote(request, writes):
+                stick_to_primary(request.user.pk)
+            return response
+
+    return middleware
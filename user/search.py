@@ -0,0 +1,258 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Transaction search lives in a side table kept in sync by triggers, so
+# every insert or update of a transaction, including bulk and queryset
+# updates, is indexed without any application code.
+#
+# SQLite uses an FTS5 table with the trigram tokenizer, which answers the
+# same substring matches as the old icontains filters and ranks by bm25.
+# PostgreSQL uses a pg_trgm GIN index. Other backends fall back to the
+# plain filters in the view.
+
+MIN_QUERY_LENGTH = 3
+
+# A status value matches a large share of a user's rows and a phone number
+# names one counterparty, both are answered faster by the plain filters on
+# the user's own rows than by ranking every trigram match.
+FILTER_STATUSES = ('pending', 'success', 'successful', 'failed')
+PHONE_PATTERN = re.compile(r'^\d{11}$')
+
+SQLITE_INDEXED_COLUMNS = "ref, transaction_type, status, description, sender_id, recepient_id"
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS user_transaction_search USING fts5(
+        owner, ref, transaction_type, status, description, sender_phone, recepient_phone,
+        tokenize = 'trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_transaction_search_insert
+    AFTER INSERT ON user_transaction BEGIN
+        INSERT INTO user_transaction_search (
+            rowid, owner, ref, transaction_type, status, description, sender_phone, recepient_phone
+        ) VALUES (
+            NEW.id, 'u' || NEW.sender_id || 'x', NEW.ref, NEW.transaction_type, NEW.status, NEW.description,
+            (SELECT phone FROM user_user WHERE id = NEW.sender_id),
+            (SELECT phone FROM user_user WHERE id = NEW.recepient_id)
+        );
+    END
+    """,
+    # Only searchable columns re-index a row, reconciler bookkeeping does not.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_transaction_search_update
+    AFTER UPDATE OF {SQLITE_INDEXED_COLUMNS} ON user_transaction BEGIN
+        DELETE FROM user_transaction_search WHERE rowid = OLD.id;
+        INSERT INTO user_transaction_search (
+            rowid, owner, ref, transaction_type, status, description, sender_phone, recepient_phone
+        ) VALUES (
+            NEW.id, 'u' || NEW.sender_id || 'x', NEW.ref, NEW.transaction_type, NEW.status, NEW.description,
+            (SELECT phone FROM user_user WHERE id = NEW.sender_id),
+            (SELECT phone FROM user_user WHERE id = NEW.recepient_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_transaction_search_delete
+    AFTER DELETE ON user_transaction BEGIN
+        DELETE FROM user_transaction_search WHERE rowid = OLD.id;
+    END
+    """,
+]
+
+SQLITE_BACKFILL = """
+    INSERT INTO user_transaction_search (
+        rowid, owner, ref, transaction_type, status, description, sender_phone, recepient_phone
+    )
+    SELECT t.id, 'u' || t.sender_id || 'x', t.ref, t.transaction_type, t.status, t.description, s.phone, r.phone
+    FROM user_transaction t
+    LEFT JOIN user_user s ON s.id = t.sender_id
+    LEFT JOIN user_user r ON r.id = t.recepient_id
+    WHERE t.id NOT IN (SELECT rowid FROM user_transaction_search)
+"""
+
+SQLITE_MATCHES = """
+    SELECT rowid FROM user_transaction_search
+    WHERE user_transaction_search MATCH %s
+"""
+
+SQLITE_COUNT = """
+    SELECT count(*) FROM user_transaction_search
+    WHERE user_transaction_search MATCH %s
+"""
+
+SQLITE_QUERY = SQLITE_MATCHES + """
+    ORDER BY rank
+    LIMIT %s OFFSET %s
+"""
+
+# Rows are scoped to their sender through an `owner` token, u<id>x, so the
+# index intersects the user's rows with the match instead of filtering
+# every user's matches afterwards. The delimiters keep u12x from matching
+# inside u123x. The searched phrase is limited to the content columns.
+SQLITE_MATCH = 'owner : "u{owner}x" AND {{ref transaction_type status description sender_phone recepient_phone}} : {phrase}'
+
+POSTGRESQL_DOCUMENT = """
+    concat_ws(' ', {row}.ref, {row}.transaction_type, {row}.status, {row}.description,
+        (SELECT phone FROM user_user WHERE id = {row}.sender_id),
+        (SELECT phone FROM user_user WHERE id = {row}.recepient_id))
+"""
+
+POSTGRESQL_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE TABLE IF NOT EXISTS user_transaction_search (
+        transaction_id bigint PRIMARY KEY REFERENCES user_transaction (id) ON DELETE CASCADE,
+        sender_id bigint,
+        document text NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS user_transaction_search_document
+    ON user_transaction_search USING gin (document gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS user_transaction_search_sender
+    ON user_transaction_search (sender_id)
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION user_transaction_search_sync() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO user_transaction_search (transaction_id, sender_id, document)
+        VALUES (NEW.id, NEW.sender_id, {POSTGRESQL_DOCUMENT.format(row='NEW')})
+        ON CONFLICT (transaction_id) DO UPDATE
+        SET sender_id = EXCLUDED.sender_id, document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS user_transaction_search_sync ON user_transaction",
+    """
+    CREATE TRIGGER user_transaction_search_sync
+    AFTER INSERT OR UPDATE OF ref, transaction_type, status, description, sender_id, recepient_id
+    ON user_transaction FOR EACH ROW EXECUTE FUNCTION user_transaction_search_sync()
+    """,
+]
+
+POSTGRESQL_BACKFILL = f"""
+    INSERT INTO user_transaction_search (transaction_id, sender_id, document)
+    SELECT t.id, t.sender_id, {POSTGRESQL_DOCUMENT.format(row='t')}
+    FROM user_transaction t
+    ON CONFLICT (transaction_id) DO NOTHING
+"""
+
+POSTGRESQL_MATCHES = """
+    SELECT transaction_id FROM user_transaction_search
+    WHERE sender_id = %s AND document ILIKE %s
+"""
+
+POSTGRESQL_COUNT = """
+    SELECT count(*) FROM user_transaction_search
+    WHERE sender_id = %s AND document ILIKE %s
+"""
+
+POSTGRESQL_QUERY = POSTGRESQL_MATCHES + """
+    ORDER BY similarity(document, %s) DESC, transaction_id DESC
+    LIMIT %s OFFSET %s
+"""
+
+
+def install_search_index(using_connection=None):
+    """
+    Create the search table and its triggers if they are missing and index
+    any rows that are not in it yet. Safe to run repeatedly.
+    """
+    using_connection = using_connection or connection
+    vendor = using_connection.vendor
+
+    if vendor == 'sqlite':
+        statements = SQLITE_SCHEMA + [SQLITE_BACKFILL]
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_SCHEMA + [POSTGRESQL_BACKFILL]
+    else:
+        return
+
+    with using_connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class RankedMatches:
+    """
+    The transactions of `user` matching `text`, best match first. Sliced
+    like a list, so Paginator pages it, and each slice is one LIMIT/OFFSET
+    query on the index. Nothing is read until a page or the count is
+    asked for.
+    """
+
+    def __init__(self, user, text, using_connection):
+        self.connection = using_connection
+        if using_connection.vendor == 'sqlite':
+            # Quote the input so FTS5 treats it as one literal phrase.
+            phrase = '"' + text.replace('"', '""') + '"'
+            self.params = [SQLITE_MATCH.format(owner=user.pk, phrase=phrase)]
+            self.rank_params = []
+            self.matches_sql, self.count_sql, self.query_sql = SQLITE_MATCHES, SQLITE_COUNT, SQLITE_QUERY
+        else:
+            pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            self.params = [user.pk, pattern]
+            self.rank_params = [text]
+            self.matches_sql, self.count_sql, self.query_sql = POSTGRESQL_MATCHES, POSTGRESQL_COUNT, POSTGRESQL_QUERY
+
+    def subquery(self):
+        """
+        The matching ids as SQL for `pk__in`, so a keyset page filters and
+        limits them in the same statement.
+        """
+        return RawSQL(self.matches_sql, self.params)
+
+    def count(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.count_sql, self.params)
+            return cursor.fetchone()[0]
+
+    def ids(self, offset, limit):
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.query_sql, self.params + self.rank_params + [limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None or key.start is None or key.stop is None:
+            raise TypeError("RankedMatches only supports bounded slices")
+        return self.ids(key.start, max(0, key.stop - key.start))
+
+
+def prefers_filters(text):
+    return text.lower() in FILTER_STATUSES or PHONE_PATTERN.match(text) is not None
+
+
+def search_filters(text):
+    """
+    The plain filters over a user's transactions, for queries the index
+    can't answer or answers slower.
+    """
+    if PHONE_PATTERN.match(text):
+        return Q(recepient__phone=text) | Q(ref__contains=text)
+    return (
+        Q(ref__contains=text) |
+        Q(transaction_type__icontains=text) |
+        Q(status__icontains=text)
+    )
+
+
+def ranked_matches(user, text, using_connection=None):
+    """
+    Return the RankedMatches of `user`'s transactions for `text`, or None
+    when the caller should use search_filters() instead.
+    """
+    using_connection = using_connection or connection
+    vendor = using_connection.vendor
+
+    if len(text) < MIN_QUERY_LENGTH or prefers_filters(text) or vendor not in ('sqlite', 'postgresql'):
+        return None
+
+    return RankedMatches(user, text, using_connection)
@@ -1,3 +1,9 @@
+from decimal import Decimal
+
+from django.db import models
+from django.utils import timezone
+from django.core.files.storage import default_storage
+
 from user.models import User, Vendor, Customer, Transaction
 
 from rest_framework import serializers
@@ -10,14 +16,119 @@ class UserSerializer(serializers.ModelSerializer):
 class VendorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vendor
-        exclude = ['id']
+        exclude = ['id', 'transaction_pin']
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
-        exclude = ['id']
+        exclude = ['id', 'transaction_pin']
         
 class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
-        exclude = ['id', 'sender', 'recepient']
\ No newline at end of file
+        exclude = ['id', 'sender', 'recepient', 'verify_attempts', 'next_verify_at']
+
+# ------------------------------------------------------------------------------
+# FAST PATH
+# ------------------------------------------------------------------------------
+class ValuesSerializer:
+    """
+    Read-only serializer for list endpoints. It produces the same output as
+    `serializer_class` but reads `.values_list()` tuples and formats each
+    column with a plain function, skipping the per-field machinery of DRF.
+
+    `related` adds columns read through a join, as {name: lookup}, and
+    `exclude` drops fields of `serializer_class`.
+    """
+
+    def __init__(self, serializer_class, related=None, exclude=()):
+        self.serializer_class = serializer_class
+        self.related = related or {}
+        self.exclude = exclude
+        self._columns = None
+
+    @property
+    def columns(self):
+        # Taken from the ModelSerializer's own fields, so both stay in sync.
+        if self._columns is None:
+            model = self.serializer_class.Meta.model
+            names = [name for name in self.serializer_class().fields if name not in self.exclude]
+            columns = [(name, name, model._meta.get_field(name)) for name in names]
+            columns += [
+                (name, lookup, resolve_field(model, lookup)) for name, lookup in self.related.items()
+            ]
+            self._columns = [(name, lookup, column_formatter(field)) for name, lookup, field in columns]
+        return self._columns
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self.columns]
+
+    def values(self, queryset):
+        return queryset.values_list(*[lookup for _, lookup, _ in self.columns])
+
+    def serialize(self, queryset):
+        return self.serialize_rows(self.values(queryset))
+
+    def serialize_rows(self, rows):
+        names = self.names
+        return [dict(zip(names, values)) for values in self.format_rows(rows)]
+
+    def format_rows(self, rows):
+        # Formatted values in column order, for writers that don't need dicts.
+        formatters = [formatter for _, _, formatter in self.columns]
+        for row in rows:
+            yield [None if value is None else formatter(value) for formatter, value in zip(formatters, row)]
+
+    def serialize_instances(self, instances):
+        attnames = [self.attname(name) for name in self.names]
+        return self.serialize_rows([getattr(instance, attname) for attname in attnames] for instance in instances)
+
+    def attname(self, name):
+        return self.serializer_class.Meta.model._meta.get_field(name).attname
+
+
+def resolve_field(model, lookup):
+    *path, name = lookup.split('__')
+    for step in path:
+        model = model._meta.get_field(step).related_model
+    return model._meta.get_field(name)
+
+
+def column_formatter(field):
+    if isinstance(field, models.DateTimeField):
+        return format_datetime
+    if isinstance(field, models.DateField):
+        return format_date
+    if isinstance(field, models.DecimalField):
+        quantum = Decimal(1).scaleb(-field.decimal_places)
+        return lambda value: f"{Decimal(value).quantize(quantum):f}"
+    if isinstance(field, models.FileField):
+        return format_file
+    return identity
+
+
+def format_datetime(value):
+    value = timezone.localtime(value) if timezone.is_aware(value) else value
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def format_date(value):
+    return value.isoformat()
+
+
+def format_file(value):
+    return default_storage.url(value) if value else None
+
+
+def identity(value):
+    return value
+
+
+fast_users = ValuesSerializer(UserSerializer)
+fast_vendors = ValuesSerializer(VendorSerializer)
+fast_customers = ValuesSerializer(CustomerSerializer)
+fast_transactions = ValuesSerializer(TransactionSerializer)
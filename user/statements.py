@@ -0,0 +1,228 @@
+import csv
+import heapq
+import itertools
+from io import StringIO
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Sum, Q, BooleanField, ExpressionWrapper
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from user.models import Vendor, Customer, Transaction, LedgerEntry
+from user.pdf import text_pdf
+
+STATEMENT_COLUMNS = ['date', 'ref', 'type', 'description', 'counterparty', 'debit', 'credit', 'balance']
+
+TRANSACTION_COLUMNS = (
+    'pk', 'created_at', 'ref', 'transaction_type', 'description', 'amount', 'transaction_fee',
+    'sender__phone', 'recepient__phone',
+)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'pdf': 'application/pdf',
+}
+
+
+def parse_period(period):
+    """
+    'YYYY-MM' to the (start, end) datetimes of that month. Raises
+    ValueError for anything else.
+    """
+    year, month = (int(part) for part in period.split('-'))
+    start = timezone.make_aware(datetime(year, month, 1))
+    end = timezone.make_aware(datetime(year + month // 12, month % 12 + 1, 1))
+    return start, end
+
+
+def wallets(user_ids=None):
+    """
+    Every wallet as (user_id, wallet_id, name, phone, active), ordered by
+    user id. Transfers and topups move money through the wallet picked by
+    the user's vendor flag, `active` marks that one so a user holding both
+    a vendor and a customer wallet gets their activity on the right one.
+    """
+    vendors = Vendor.objects.values_list('user_id', 'VID', 'business_name', 'user__phone', 'user__is_vendor')
+    customers = Customer.objects.annotate(
+        active=ExpressionWrapper(Q(user__is_vendor=False), output_field=BooleanField())
+    ).values_list('user_id', 'CID', 'fullname', 'user__phone', 'active')
+    if user_ids is not None:
+        vendors = vendors.filter(user_id__in=user_ids)
+        customers = customers.filter(user_id__in=user_ids)
+    return sorted(itertools.chain(vendors, customers))
+
+
+def shards(wallet_rows, size):
+    for start in range(0, len(wallet_rows), size):
+        yield wallet_rows[start:start + size]
+
+
+def party_stream(party, low, high, start, end, chunk_size):
+    # One index range scan over (party, created_at), read in chunks.
+    rows = (
+        Transaction.objects.filter(
+            **{f'{party}__gte': low, f'{party}__lte': high},
+            completed=True,
+            created_at__gte=start,
+            created_at__lt=end,
+        )
+        .order_by(f'{party}_id', 'created_at', 'pk')
+        .values_list(f'{party}_id', *TRANSACTION_COLUMNS)
+        .iterator(chunk_size=chunk_size)
+    )
+    for user_id, *row in rows:
+        yield user_id, row[1], row[0], party, row
+
+
+def activity(low, high, start, end, chunk_size):
+    """
+    Completed transactions of users `low`..`high` in [start, end), grouped
+    by user and ordered by time. Sent and received rows are streamed from
+    their own indexes and merged.
+    """
+    merged = heapq.merge(
+        party_stream('sender', low, high, start, end, chunk_size),
+        party_stream('recepient', low, high, start, end, chunk_size),
+        key=lambda item: item[:3],
+    )
+    for user_id, items in itertools.groupby(merged, key=lambda item: item[0]):
+        yield user_id, [(party, row) for _, _, _, party, row in items]
+
+
+def statement_line(party, row):
+    _, created_at, ref, transaction_type, description, amount, fee, sender_phone, recepient_phone = row
+
+    if party == 'recepient':
+        return created_at, ref, transaction_type, description, sender_phone, Decimal(0), amount
+    if transaction_type == 'topup':
+        return created_at, ref, transaction_type, description, 'Topup', Decimal(0), amount - fee
+    return created_at, ref, transaction_type, description, recepient_phone or '', amount, Decimal(0)
+
+
+def opening_balances(wallet_ids, start):
+    # Summed from the ledger, so balances that predate it only show up
+    # once `ledger_balances --open` has posted their opening entries,
+    # which it dates before the wallet's first ledger entry. Periods from
+    # before the ledger existed have no opening balance to start from.
+    totals = (
+        LedgerEntry.objects.filter(wallet__in=wallet_ids, created_at__lt=start)
+        .values_list('wallet')
+        .annotate(total=Sum('amount'))
+    )
+    return dict(totals)
+
+
+def build_statements(wallet_rows, start, end, chunk_size=None):
+    """
+    Yield one statement dict per wallet in `wallet_rows`, which must be
+    ordered by user id. A user's activity goes on their active wallet, any
+    other wallet of theirs gets a statement without lines.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    if not wallet_rows:
+        return
+
+    openings = opening_balances([row[1] for row in wallet_rows], start)
+    stream = activity(wallet_rows[0][0], wallet_rows[-1][0], start, end, chunk_size)
+    pending = next(stream, None)
+
+    for user_id, wallet_id, name, phone, active in wallet_rows:
+        # Users without a wallet in this shard are skipped over.
+        while pending is not None and pending[0] < user_id:
+            pending = next(stream, None)
+
+        items = []
+        if active and pending is not None and pending[0] == user_id:
+            items = pending[1]
+            pending = next(stream, None)
+
+        balance = openings.get(wallet_id) or Decimal('0.00')
+        statement = {
+            'wallet_id': wallet_id,
+            'name': name,
+            'phone': phone,
+            'start': start,
+            'end': end,
+            'opening_balance': balance,
+            'lines': [],
+        }
+        for party, row in items:
+            created_at, ref, transaction_type, description, counterparty, debit, credit = statement_line(party, row)
+            balance += credit - debit
+            statement['lines'].append(
+                (created_at, ref, transaction_type, description, counterparty, debit, credit, balance)
+            )
+        statement['closing_balance'] = balance
+        yield statement
+
+
+def period_label(statement):
+    return statement['start'].strftime('%Y-%m')
+
+
+def render_csv(statement):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['wallet', statement['wallet_id']])
+    writer.writerow(['name', statement['name']])
+    writer.writerow(['period', period_label(statement)])
+    writer.writerow(['opening balance', f"{statement['opening_balance']:.2f}"])
+    writer.writerow(['closing balance', f"{statement['closing_balance']:.2f}"])
+    writer.writerow([])
+    writer.writerow(STATEMENT_COLUMNS)
+    for created_at, ref, transaction_type, description, counterparty, debit, credit, balance in statement['lines']:
+        writer.writerow([
+            created_at.isoformat(), ref, transaction_type, description, counterparty,
+            f"{debit:.2f}" if debit else '', f"{credit:.2f}" if credit else '', f"{balance:.2f}",
+        ])
+    return buffer.getvalue().encode()
+
+
+def render_pdf(statement):
+    lines = [
+        f"CampusPay statement {period_label(statement)}",
+        '',
+        f"Wallet:           {statement['wallet_id']}",
+        f"Name:             {statement['name']}",
+        f"Phone:            {statement['phone']}",
+        f"Opening balance:  {statement['opening_balance']:.2f}",
+        f"Closing balance:  {statement['closing_balance']:.2f}",
+        '',
+        f"{'Date':<17}{'Ref':<27}{'Type':<10}{'Counterparty':<14}{'Debit':>11}{'Credit':>11}{'Balance':>12}",
+    ]
+    for created_at, ref, transaction_type, _, counterparty, debit, credit, balance in statement['lines']:
+        lines.append(
+            f"{created_at:%Y-%m-%d %H:%M}  {ref[:26]:<27}{transaction_type[:9]:<10}{(counterparty or '')[:13]:<14}"
+            f"{f'{debit:.2f}' if debit else '':>11}{f'{credit:.2f}' if credit else '':>11}{balance:>12.2f}"
+        )
+    return text_pdf(lines, title=f"Statement {statement['wallet_id']} {period_label(statement)}")
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'pdf': render_pdf,
+}
+
+
+def statement_path(statement, extension):
+    return f"statements/{period_label(statement)}/{statement['wallet_id']}.{extension}"
+
+
+def write_statements(wallet_rows, period, extensions, chunk_size=None):
+    """
+    Render and store the statements of one shard, returns how many
+    wallets were written. Runs inside the worker processes.
+    """
+    start, end = parse_period(period)
+    written = 0
+    for statement in build_statements(wallet_rows, start, end, chunk_size):
+        for extension in extensions:
+            path = statement_path(statement, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            default_storage.save(path, ContentFile(RENDERERS[extension](statement)))
+        written += 1
+    return written
@@ -1,3 +1,1788 @@
-from django.test import TestCase
+import csv
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+import tempfile
+from io import StringIO
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipIf
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+import requests
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, IntegrityError, close_old_connections, connection, connections
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.decorators import api_view, throttle_classes
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from user.models import User, Vendor, Customer, Transaction, PaymentCode, LedgerEntry, WalletBalance
+from user.models import WebhookEvent, IDSequence, IdempotencyKey, OTPChallenge, PROVIDER_ACCOUNT
+from user.decorators import idempotent
+from user.db import write_transaction
+from user.routers import ReplicaRouter, replica_reads, stick_to_primary, sticky_key
+from user import otp
+from user.throttling import LocalBuckets, CacheBuckets, bucket_throttles
+from user.authentication import ClaimsJWTAuthentication, ClaimsTokenObtainPairSerializer, ClaimsTokenRefreshSerializer, revoke_tokens
+from user import flutterwave
+from user import views, async_views
+from user.management.commands.reconcile_transactions import Command as ReconcileCommand
+from user.pins import set_pin, check_pin, pin_holder, InvalidPin, PinLocked
+from user.serializers import VendorSerializer, TransactionSerializer, fast_vendors, fast_customers, fast_transactions
+from user.utils import render_qrcode, store_qrcode, generate_qrcode, QRCODE_READY
+from user.utils import permute_id, WalletIDAllocator, WalletIDsExhausted, WALLET_ID_SPACE
+from user.utils import generate_ref, decode_ref, REF_LENGTH
+from user.transfers import transfer, bulk_transfer, InsufficientBalance, TransferNotPending, InvalidAmount, NoWallet
+from user.pagination import keyset_page, InvalidCursor
+from user.search import ranked_matches
+from user.balances import wallet_summary, version_key
+from user.renderers import ORJSONRenderer, orjson
+from user.exports import stream_csv
+from user.statements import wallets, build_statements, opening_balances, parse_period
+
+
+def make_user(phone, vendor=False, balance='0.00'):
+    user = User.objects.create(
+        phone=phone,
+        email=f"{phone}@example.com",
+        is_vendor=vendor,
+        is_customer=not vendor,
+    )
+    model = Vendor if vendor else Customer
+    model.objects.filter(user=user).update(balance=Decimal(balance))
+    return user
+
+
+def balance_of(user):
+    model = Vendor if user.is_vendor else Customer
+    return model.objects.values_list('balance', flat=True).get(user=user)
+
+
+def pending_transfer(sender, recepient, amount):
+    return Transaction.objects.create(
+        sender=sender,
+        recepient=recepient,
+        amount=Decimal(amount),
+        transaction_type='transfer',
+        description='',
+        status='pending',
+    )
+
+
+@override_settings(PIN_HASH_ROUNDS=4)
+class TransferTests(TestCase):
+    def setUp(self):
+        self.sender = make_user('08000000001', balance='100.00')
+        self.recepient = make_user('08000000002', vendor=True)
+
+    def test_transfer_moves_money_once(self):
+        transaction = pending_transfer(self.sender, self.recepient, '40.00')
+
+        transfer(transaction)
+
+        self.assertEqual(balance_of(self.sender), Decimal('60.00'))
+        self.assertEqual(balance_of(self.recepient), Decimal('40.00'))
+        self.assertEqual(LedgerEntry.objects.filter(transaction=transaction).count(), 2)
+        with self.assertRaises(TransferNotPending):
+            transfer(transaction)
+        self.assertEqual(balance_of(self.sender), Decimal('60.00'))
+
+    def test_transfer_refuses_overdraft(self):
+        transaction = pending_transfer(self.sender, self.recepient, '100.01')
+
+        with self.assertRaises(InsufficientBalance):
+            transfer(transaction)
+
+        self.assertEqual(balance_of(self.sender), Decimal('100.00'))
+        self.assertEqual(balance_of(self.recepient), Decimal('0.00'))
+        self.assertFalse(Transaction.objects.get(pk=transaction.pk).completed)
+
+    def test_transfer_refuses_non_positive_amounts(self):
+        Vendor.objects.filter(user=self.recepient).update(balance=Decimal('50.00'))
+        transaction = pending_transfer(self.sender, self.recepient, '-20.00')
+
+        with self.assertRaises(InvalidAmount):
+            transfer(transaction)
+
+        self.assertEqual(balance_of(self.sender), Decimal('100.00'))
+        self.assertEqual(balance_of(self.recepient), Decimal('50.00'))
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_initiate_validates_the_amount(self):
+        client = APIClient()
+        with mock.patch('user.throttling._buckets', LocalBuckets(100)):
+            for amount in ('-20.00', '0', 'ten', '1.001', 'NaN'):
+                response = client.post(f'/api/v1/initiate-transfer/{self.sender.phone}/', {
+                    'recepient': self.recepient.phone,
+                    'amount': amount,
+                }, format='json')
+                self.assertEqual(response.status_code, 400, amount)
+            for amount in ('-20.00', 'ten'):
+                client.force_authenticate(self.sender)
+                response = client.post(f'/api/v1/generate-code/{self.sender.phone}/', {
+                    'recepientID': self.recepient.phone,
+                    'amount': amount,
+                    'transaction_type': 'transfer',
+                }, format='json')
+                self.assertEqual(response.status_code, 400, amount)
+
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_payment_code_debits_sender_once(self):
+        client = APIClient()
+        client.force_authenticate(self.sender)
+        set_pin(Customer.objects.get(user=self.sender), '1234')
+
+        response = client.post(f'/api/v1/generate-code/{self.sender.phone}/', {
+            'recepientID': self.recepient.phone,
+            'amount': '30.00',
+            'transaction_type': 'transfer',
+            'description': 'lunch',
+        }, format='json')
+        self.assertTrue(response.data['status'])
+        # Generating the code only checks the balance.
+        self.assertEqual(balance_of(self.sender), Decimal('100.00'))
+        self.assertFalse(LedgerEntry.objects.exists())
+
+        ref = PaymentCode.objects.get().transaction.ref
+        response = client.post(f'/api/v1/authorize-transfer/{ref}/', {'authorization_pin': '1234'}, format='json')
+        self.assertTrue(response.data['status'])
+
+        self.assertEqual(balance_of(self.sender), Decimal('70.00'))
+        self.assertEqual(balance_of(self.recepient), Decimal('30.00'))
+        self.assertFalse(LedgerEntry.objects.filter(wallet__startswith='EXT:').exists())
+
+    def test_payment_code_checks_balance(self):
+        client = APIClient()
+        client.force_authenticate(self.sender)
+
+        response = client.post(f'/api/v1/generate-code/{self.sender.phone}/', {
+            'recepientID': self.recepient.phone,
+            'amount': '150.00',
+            'transaction_type': 'transfer',
+        }, format='json')
+
+        self.assertFalse(response.data['status'])
+        self.assertFalse(Transaction.objects.exists())
+
+
+
+@override_settings(PIN_HASH_ROUNDS=4)
+class BulkTransferTests(TestCase):
+    def setUp(self):
+        self.sender = make_user('08000000001', balance='100.00')
+        self.vendor = make_user('08000000002', vendor=True)
+        self.customer = make_user('08000000003')
+        self.staff = User.objects.create(phone='08000000009', email='staff@example.com', is_staff=True, is_superuser=True)
+
+    def line(self, user, amount):
+        return {'recepient': user.phone if isinstance(user, User) else user, 'amount': amount}
+
+    def test_lines_the_balance_cannot_cover_fail_alone(self):
+        results = bulk_transfer(self.sender, [
+            self.line(self.vendor, '60.00'),
+            self.line(self.customer, '50.00'),
+            self.line(self.customer, '30.00'),
+            self.line(self.vendor, '20.00'),
+        ], chunk_size=2)
+
+        self.assertEqual([result['status'] for result in results], ['success', 'failed', 'success', 'failed'])
+        self.assertEqual(results[1]['message'], InsufficientBalance.message)
+        self.assertEqual(balance_of(self.sender), Decimal('10.00'))
+        self.assertEqual(balance_of(self.vendor), Decimal('60.00'))
+        self.assertEqual(balance_of(self.customer), Decimal('30.00'))
+
+    def test_duplicate_recepients_are_credited_per_line(self):
+        results = bulk_transfer(self.sender, [self.line(self.vendor, '10.00'), self.line(self.vendor, '15.00')])
+
+        self.assertEqual([result['status'] for result in results], ['success', 'success'])
+        self.assertNotEqual(results[0]['ref'], results[1]['ref'])
+        self.assertEqual(balance_of(self.vendor), Decimal('25.00'))
+        self.assertEqual(balance_of(self.sender), Decimal('75.00'))
+
+    def test_invalid_lines_are_rejected(self):
+        results = bulk_transfer(self.sender, [
+            self.line(self.sender, '10.00'),
+            self.line('08099999999', '10.00'),
+            self.line(self.staff, '10.00'),
+            self.line(self.vendor, '-5'),
+            'not a line',
+            self.line(self.vendor, '5.00'),
+        ])
+
+        self.assertEqual(
+            [result['message'] for result in results],
+            ["Cannot transfer to self", "Resource not Found", "Resource not Found", "Invalid amount", "Bad Request", None],
+        )
+        self.assertEqual(balance_of(self.sender), Decimal('95.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_failed_chunk_rolls_back_alone(self):
+        post_many = LedgerEntry.objects.post_many
+        calls = []
+
+        def failing_first(postings, **kwargs):
+            calls.append(len(postings))
+            if len(calls) == 1:
+                raise DatabaseError("disk I/O error")
+            return post_many(postings, **kwargs)
+
+        lines = [self.line(self.vendor, '10.00'), self.line(self.customer, '20.00'), self.line(self.vendor, '5.00')]
+        with mock.patch.object(LedgerEntry.objects, 'post_many', failing_first):
+            results = bulk_transfer(self.sender, lines, chunk_size=2)
+
+        self.assertEqual([result['status'] for result in results], ['failed', 'failed', 'success'])
+        self.assertEqual(balance_of(self.sender), Decimal('95.00'))
+        self.assertEqual(balance_of(self.vendor), Decimal('5.00'))
+        self.assertEqual(balance_of(self.customer), Decimal('0.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_each_line_posts_its_ledger_legs(self):
+        results = bulk_transfer(self.sender, [self.line(self.vendor, '10.00'), self.line(self.customer, '20.00')])
+
+        sender_wallet = Customer.objects.get(user=self.sender).CID
+        for result, recepient in zip(results, (Vendor.objects.get(user=self.vendor).VID, Customer.objects.get(user=self.customer).CID)):
+            legs = set(LedgerEntry.objects.filter(transaction__ref=result['ref']).values_list('wallet', 'amount'))
+            amount = Decimal(result['amount'])
+            self.assertEqual(legs, {(sender_wallet, -amount), (recepient, amount)})
+
+    def test_view_pays_out_and_refuses_senders_without_a_wallet(self):
+        set_pin(Customer.objects.get(user=self.sender), '1234')
+        client = APIClient()
+        client.force_authenticate(self.sender)
+        with mock.patch('user.throttling._buckets', LocalBuckets(100)):
+            response = client.post(f'/api/v1/bulk-transfer/{self.sender.phone}/', {
+                'transfers': [self.line(self.vendor, '10.00'), self.line('08099999999', '1.00')],
+                'authorization_pin': '1234',
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.data['data']['succeeded'], response.data['data']['failed']), (1, 1))
+            self.assertEqual(response.data['data']['amount'], '10.00')
+
+            client.force_authenticate(self.staff)
+            response = client.post(f'/api/v1/bulk-transfer/{self.staff.phone}/', {
+                'transfers': [self.line(self.vendor, '10.00')],
+                'authorization_pin': '1234',
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['message'], "Authorization pin has not been set")
+
+        with self.assertRaises(NoWallet):
+            bulk_transfer(self.staff, [self.line(self.vendor, '10.00')])
+
+    def test_transfers_to_users_without_a_wallet_are_refused(self):
+        with mock.patch('user.throttling._buckets', LocalBuckets(100)):
+            response = APIClient().post(f'/api/v1/initiate-transfer/{self.sender.phone}/', {
+                'recepient': self.staff.phone, 'amount': '10.00',
+            }, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        with self.assertRaises(NoWallet):
+            transfer(pending_transfer(self.sender, self.staff, '10.00'))
+        self.assertEqual(balance_of(self.sender), Decimal('100.00'))
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.get(user=make_user('08000000001'))
+
+    def test_postings_must_balance(self):
+        with self.assertRaises(ValueError):
+            LedgerEntry.objects.post([(self.customer.CID, 10), (PROVIDER_ACCOUNT, -5)])
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_external_accounts_are_not_materialized(self):
+        self.customer.deposit('50.00')
+        self.customer.withdraw('20.00')
+
+        self.assertEqual(self.customer.balance, Decimal('30.00'))
+        self.assertEqual(LedgerEntry.objects.balance(self.customer.CID), Decimal('30.00'))
+        self.assertEqual(LedgerEntry.objects.balance(PROVIDER_ACCOUNT), Decimal('-30.00'))
+        self.assertFalse(WalletBalance.objects.filter(wallet__startswith='EXT:').exists())
+
+    def test_verify_flags_wallets_without_entries(self):
+        Customer.objects.filter(pk=self.customer.pk).update(balance=Decimal('25.00'))
+
+        with self.assertRaises(CommandError):
+            call_command('ledger_balances', stdout=StringIO())
+
+        call_command('ledger_balances', '--open', stdout=StringIO())
+        self.assertEqual(LedgerEntry.objects.balance(self.customer.CID), Decimal('25.00'))
+
+    def test_verify_compares_wallet_balances(self):
+        self.customer.deposit('10.00')
+        # A balance changed behind the ledger's back.
+        Customer.objects.filter(pk=self.customer.pk).update(balance=Decimal('15.00'))
+
+        output = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('ledger_balances', stdout=output)
+        self.assertIn(f"{self.customer.CID}: ledger", output.getvalue())
+        self.assertIn("1 differing from the ledger", output.getvalue())
+
+    def test_rebuild_restores_materialized_balances(self):
+        self.customer.deposit('10.00')
+        WalletBalance.objects.filter(wallet=self.customer.CID).update(balance=Decimal('99.00'))
+
+        with self.assertRaises(CommandError):
+            call_command('ledger_balances', stdout=StringIO())
+        call_command('ledger_balances', '--rebuild', stdout=StringIO())
+        call_command('ledger_balances', stdout=StringIO())
+
+
+
+class WalletSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.get(user=make_user('08000000001'))
+
+    def deposit(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.deposit(amount)
+
+    def test_postings_refresh_the_cached_summary(self):
+        self.assertEqual(wallet_summary(self.customer.CID)['balance'], '0.00')
+        self.deposit('10.00')
+        self.assertEqual(wallet_summary(self.customer.CID)['balance'], '10.00')
+
+    def test_evicted_version_does_not_serve_stale_summaries(self):
+        wallet_summary(self.customer.CID)
+        self.deposit('10.00')
+        cache.delete(version_key(self.customer.CID))
+        self.assertEqual(wallet_summary(self.customer.CID)['balance'], '10.00')
+
+        self.deposit('5.00')
+        cache.delete(version_key(self.customer.CID))
+        self.deposit('1.00')
+        self.assertEqual(wallet_summary(self.customer.CID)['balance'], '16.00')
+
+def provider_client(client_class, **options):
+    options = {
+        'secret_key': 'test',
+        'base_url': 'https://provider.test',
+        'timeout': (1, 1),
+        'max_retries': 3,
+        'backoff': 0,
+        'pool_size': 1,
+        'breaker': flutterwave.CircuitBreaker(threshold=1, reset_timeout=60),
+        **options,
+    }
+    return client_class(**options)
+
+
+class FlutterwaveClientTests(SimpleTestCase):
+    def test_retries_stop_once_the_breaker_opens(self):
+        client = provider_client(flutterwave.FlutterwaveClient)
+
+        with mock.patch.object(client.session, 'request', side_effect=requests.exceptions.ConnectTimeout) as request:
+            with self.assertRaises(flutterwave.ProviderUnavailable):
+                client.verify_by_reference('REF')
+
+        self.assertEqual(request.call_count, 1)
+
+    def test_retries_idempotent_calls_while_closed(self):
+        client = provider_client(flutterwave.FlutterwaveClient, breaker=flutterwave.CircuitBreaker(10, 60))
+        ok = mock.Mock(status_code=200)
+        ok.json.return_value = {'status': 'success'}
+
+        with mock.patch.object(client.session, 'request', side_effect=[requests.exceptions.ReadTimeout, ok]) as request:
+            response = client.verify_by_reference('REF')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 2)
+
+    @skipIf(flutterwave.httpx is None, "needs httpx")
+    def test_async_retries_stop_once_the_breaker_opens(self):
+        async def verify():
+            client = provider_client(flutterwave.AsyncFlutterwaveClient)
+            failure = flutterwave.httpx.ConnectTimeout('timed out')
+            with mock.patch.object(client.session, 'request', side_effect=failure) as request:
+                with self.assertRaises(flutterwave.ProviderUnavailable):
+                    await client.verify_by_reference('REF')
+            return request.call_count
+
+        self.assertEqual(asyncio.run(verify()), 1)
+
+    @skipIf(flutterwave.httpx is None, "needs httpx")
+    def test_async_client_answers_like_the_sync_one(self):
+        httpx = flutterwave.httpx
+        answers = []
+
+        def handler(request):
+            answer = answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return httpx.Response(answer, json={'status': 'success' if answer < 500 else 'error'})
+
+        async def call(method, *responses):
+            answers[:] = responses
+            client = provider_client(flutterwave.AsyncFlutterwaveClient, breaker=flutterwave.CircuitBreaker(10, 60))
+            client.session = httpx.AsyncClient(base_url='https://provider.test', transport=httpx.MockTransport(handler))
+            try:
+                return await getattr(client, method)(*(('ussd', {}) if method == 'charge' else ('REF',)))
+            finally:
+                await client.session.aclose()
+
+        response = asyncio.run(call('verify_by_reference', httpx.ReadTimeout('slow'), 502, 200))
+        self.assertEqual((response.status_code, response.status, answers), (200, 'success', []))
+
+        # Charges aren't retried, a 5xx is handed back and errors raise as
+        # requests' exceptions.
+        response = asyncio.run(call('charge', 502, 200))
+        self.assertEqual((response.status_code, answers), (502, [200]))
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            asyncio.run(call('charge', httpx.ReadTimeout('slow'), 200))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            asyncio.run(call('charge', httpx.ConnectError('refused'), 200))
+
+
+class StubProvider:
+    """
+    Stands in for the Flutterwave client, answering every verification
+    with `payload` and counting the calls.
+    """
+
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.calls = 0
+
+    def verify_by_reference(self, ref):
+        self.calls += 1
+        return flutterwave.ProviderResponse(self.status_code, self.payload)
+
+    def charge(self, charge_type, payload):
+        self.calls += 1
+        return flutterwave.ProviderResponse(self.status_code, self.payload)
+
+
+class AsyncStubProvider(StubProvider):
+    """
+    StubProvider for the async views, raising `error` from every call
+    when one is given.
+    """
+
+    def __init__(self, payload=None, status_code=200, error=None):
+        super().__init__(payload, status_code)
+        self.error = error
+
+    async def verify_by_reference(self, ref):
+        if self.error is not None:
+            self.calls += 1
+            raise self.error
+        return super().verify_by_reference(ref)
+
+    async def charge(self, charge_type, payload):
+        if self.error is not None:
+            self.calls += 1
+            raise self.error
+        return super().charge(charge_type, payload)
+
+
+def pending_topup(user, amount='50.00'):
+    topup = Transaction.objects.create(
+        sender=user, amount=Decimal(amount), transaction_type='topup', description='', status='pending'
+    )
+    return Transaction.objects.select_related('sender').get(pk=topup.pk)
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.user = make_user('08000000001')
+
+    def test_claimed_rows_are_not_claimed_again(self):
+        topup = pending_topup(self.user)
+
+        self.assertEqual([row.pk for row in ReconcileCommand().claim_batch(10)], [topup.pk])
+        self.assertEqual(ReconcileCommand().claim_batch(10), [])
+
+        topup.refresh_from_db()
+        self.assertEqual(topup.verify_attempts, 1)
+        self.assertIsNotNone(topup.next_verify_at)
+
+    def test_failed_topups_are_terminal(self):
+        topup = pending_topup(self.user)
+        provider = StubProvider({'status': 'success', 'data': {'status': 'failed', 'amount': 50}})
+
+        with mock.patch('user.flutterwave.get_client', return_value=provider):
+            result = topup.verify_transaction()
+
+        self.assertFalse(result['status'])
+        topup.refresh_from_db()
+        self.assertEqual(topup.status, 'failed')
+        self.assertFalse(topup.completed)
+        self.assertEqual(balance_of(self.user), Decimal('0.00'))
+        Transaction.objects.filter(pk=topup.pk).update(next_verify_at=None)
+        self.assertEqual(ReconcileCommand().claim_batch(10), [])
+
+    def test_successful_topups_are_credited_once(self):
+        topup = pending_topup(self.user)
+        provider = StubProvider({'status': 'success', 'data': {'status': 'successful', 'amount': 50}})
+
+        with mock.patch('user.flutterwave.get_client', return_value=provider):
+            self.assertTrue(topup.verify_transaction()['status'])
+            self.assertFalse(Transaction.objects.get(pk=topup.pk).verify_transaction()['status'])
+
+        self.assertEqual(balance_of(self.user), Decimal('50.00'))
+
+    def test_unpaid_charges_are_not_credited(self):
+        topup = pending_topup(self.user)
+        # What USSD and bank transfer charges verify as before payment.
+        provider = StubProvider({'status': 'success', 'data': {'status': 'pending', 'amount': 50}})
+
+        with mock.patch('user.flutterwave.get_client', return_value=provider):
+            self.assertFalse(topup.verify_transaction()['status'])
+
+        topup.refresh_from_db()
+        self.assertEqual((topup.status, topup.completed), ('pending', False))
+        self.assertEqual(balance_of(self.user), Decimal('0.00'))
+        # Still polled.
+        self.assertEqual([row.pk for row in ReconcileCommand().claim_batch(10)], [topup.pk])
+
+    def test_malformed_bodies_are_not_terminal(self):
+        topup = pending_topup(self.user)
+
+        for payload in ({}, {'status': 'success'}, {'status': 'success', 'data': None},
+                        {'status': 'success', 'data': [1]}, {'status': 'success', 'data': {'status': 'successful'}}):
+            with mock.patch('user.flutterwave.get_client', return_value=StubProvider(payload)):
+                self.assertFalse(topup.verify_transaction()['status'], payload)
+
+        topup.refresh_from_db()
+        self.assertFalse(topup.completed)
+        self.assertEqual(balance_of(self.user), Decimal('0.00'))
+
+
+    def test_reconciler_fields_are_not_serialized(self):
+        topup = pending_topup(self.user)
+        ReconcileCommand().claim_batch(10)
+
+        for data in (TransactionSerializer(topup).data, fast_transactions.serialize(Transaction.objects.all())[0]):
+            self.assertNotIn('verify_attempts', data)
+            self.assertNotIn('next_verify_at', data)
+
+
+def run_now(func, *args, **kwargs):
+    # Stands in for user.tasks.enqueue, runs the task in the request.
+    func(*args, **kwargs)
+
+
+class WebhookTestMixin:
+    def callback(self, topup):
+        return {
+            'event': 'charge.completed',
+            'data': {'tx_ref': topup.ref, 'amount': 50, 'status': 'successful'},
+        }
+
+    def post_callback(self, body, signature='secret-hash'):
+        return APIClient().post(
+            '/api/v1/webhooks/flutterwave/', body, format='json', HTTP_VERIF_HASH=signature
+        )
+
+    def replay(self, body, times, workers=1):
+        def send(_):
+            try:
+                return self.post_callback(body).status_code
+            finally:
+                close_old_connections()
+
+        provider = StubProvider({'status': 'success', 'data': body['data']})
+        with flutterwave.override_client(provider), mock.patch('user.views.enqueue', run_now):
+            if workers == 1:
+                # Inside a TestCase every request has to share its
+                # connection and open transaction.
+                return [self.post_callback(body).status_code for _ in range(times)], provider
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                codes = list(pool.map(send, range(times)))
+        return codes, provider
+
+
+@override_settings(FLUTTERWAVE_WEBHOOK_HASH='secret-hash')
+class WebhookTests(WebhookTestMixin, TestCase):
+    def setUp(self):
+        self.user = make_user('08000000001')
+        self.topup = pending_topup(self.user)
+
+    def test_duplicate_callbacks_credit_once(self):
+        codes, provider = self.replay(self.callback(self.topup), times=25)
+
+        self.assertEqual(set(codes), {200})
+        self.assertEqual(WebhookEvent.objects.filter(ref=self.topup.ref).count(), 1)
+        self.assertEqual(provider.calls, 1)
+        self.assertEqual(balance_of(self.user), Decimal('50.00'))
+        self.assertEqual(LedgerEntry.objects.filter(wallet__startswith='CUST').count(), 1)
+
+    def test_rejects_bad_signatures(self):
+        response = self.post_callback(self.callback(self.topup), signature='wrong')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_rejects_bodies_that_are_not_objects(self):
+        for body in ({'event': 'charge.completed', 'data': ['tx_ref']}, {'event': 'charge.completed', 'data': 'x'}, [1, 2]):
+            self.assertEqual(self.post_callback(body).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+@override_settings(FLUTTERWAVE_WEBHOOK_HASH='secret-hash')
+class ConcurrentWebhookTests(WebhookTestMixin, TransactionTestCase):
+    def test_concurrent_callbacks_credit_once(self):
+        users = [make_user(f'0800000000{index}') for index in range(1, 4)]
+        topups = [pending_topup(user) for user in users]
+
+        for topup in topups:
+            codes, _ = self.replay(self.callback(topup), times=24, workers=8)
+            self.assertEqual(set(codes), {200})
+
+        for user, topup in zip(users, topups):
+            self.assertEqual(WebhookEvent.objects.filter(ref=topup.ref).count(), 1)
+            self.assertEqual(balance_of(user), Decimal('50.00'))
+            self.assertEqual(LedgerEntry.objects.filter(transaction=topup).count(), 2)
+
+    def test_replay_command_uses_a_local_provider(self):
+        users = [make_user(f'0800000000{index}') for index in range(1, 3)]
+        topups = [pending_topup(user) for user in users]
+
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as recorded:
+            for topup in topups:
+                recorded.write(json.dumps(self.callback(topup)) + '\n')
+            recorded.flush()
+
+            with mock.patch.object(flutterwave.FlutterwaveClient, 'request') as real_provider:
+                call_command(
+                    'replay_webhooks', recorded.name, '--repeat', '20', '--rate', '2000', '--concurrency', '8',
+                    stdout=StringIO(),
+                )
+
+        real_provider.assert_not_called()
+        for user, topup in zip(users, topups):
+            self.assertEqual(WebhookEvent.objects.filter(ref=topup.ref).count(), 1)
+            self.assertEqual(balance_of(user), Decimal('50.00'))
+
+
+
+class SQLiteTests(TransactionTestCase):
+    def statements(self, using='default'):
+        executed = []
+
+        def record(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        return executed, connections[using].execute_wrapper(record)
+
+    @override_settings(SQLITE_BUSY_TIMEOUT=1234)
+    def test_new_connections_get_the_pragmas(self):
+        fresh = connections.create_connection('default')
+        try:
+            with fresh.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                self.assertEqual(cursor.fetchone()[0].lower(), 'wal')
+                cursor.execute("PRAGMA busy_timeout")
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute("PRAGMA synchronous")
+                # NORMAL
+                self.assertEqual(cursor.fetchone()[0], 1)
+        finally:
+            fresh.close()
+
+    def test_write_transactions_begin_immediate(self):
+        executed, recording = self.statements()
+        with recording:
+            with write_transaction():
+                with write_transaction():
+                    User.objects.exists()
+            with db_transaction.atomic():
+                User.objects.exists()
+
+        begins = [sql for sql in executed if sql.startswith('BEGIN')]
+        # Nested blocks join the outer transaction, plain atomic() is left alone.
+        self.assertEqual(begins, ['BEGIN IMMEDIATE', 'BEGIN'])
+        self.assertIsNone(connection.transaction_mode)
+
+    def test_concurrent_writers_serialize(self):
+        user = make_user('08000000001')
+        writers = 8
+        barrier = threading.Barrier(writers)
+
+        def deposit(_):
+            barrier.wait()
+            try:
+                with write_transaction():
+                    # Read, then write after the others have had the chance
+                    # to read too, which deadlocks deferred transactions.
+                    balance = Customer.objects.values_list('balance', flat=True).get(user=user)
+                    time.sleep(0.02)
+                    Customer.objects.filter(user=user).update(balance=balance + 1)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=writers) as pool:
+            list(pool.map(deposit, range(writers)))
+
+        self.assertEqual(balance_of(user), Decimal(writers))
+
+
+REPLICA = 'replica_test'
+
+
+@override_settings(READ_REPLICAS=[REPLICA], READ_YOUR_WRITES_CACHE='default')
+class ReplicaRouterTests(TransactionTestCase):
+    """
+    A second SQLite file stands in for the replica. It is a copy of the
+    primary taken in setUp, so rows written after that are only on the
+    primary, as if replication lagged behind.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the test database setup, which only knows the
+        # aliases in settings.
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings[REPLICA] = {
+            **connections.settings['default'], 'NAME': f'{cls.replica_dir.name}/replica.sqlite3',
+        }
+        cls.databases = {*cls.databases, REPLICA}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        del cls.databases
+        cls.replica_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('08000000001', balance='100.00')
+        self.recepient = make_user('08000000002', vendor=True)
+        self.sync_replica()
+        token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.buckets = mock.patch('user.throttling._buckets', LocalBuckets(100))
+        self.buckets.start()
+        self.addCleanup(self.buckets.stop)
+
+    def sync_replica(self):
+        connections[REPLICA].close()
+        source = sqlite3.connect(connections.settings['default']['NAME'])
+        target = sqlite3.connect(connections.settings[REPLICA]['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def history(self, headers=None):
+        response = self.client.get(f'/api/v1/transactions/{self.user.phone}/', headers=headers)
+        return response.json()['data']
+
+    def initiate_transfer(self):
+        return self.client.post(
+            f'/api/v1/initiate-transfer/{self.user.phone}/',
+            {'recepient': self.recepient.phone, 'amount': '10.00', 'description': 'Lunch'},
+            content_type='application/json', headers=self.headers,
+        )
+
+    def test_reads_go_to_the_replica_and_writes_to_the_primary(self):
+        router = ReplicaRouter()
+        with replica_reads(None):
+            self.assertEqual(User.objects.all().db, REPLICA)
+            self.assertEqual(router.db_for_write(User), 'default')
+            make_user('08000000003')
+
+        self.assertEqual(User.objects.all().db, 'default')
+        self.assertTrue(User.objects.using('default').filter(phone='08000000003').exists())
+        self.assertFalse(User.objects.using(REPLICA).filter(phone='08000000003').exists())
+
+        with override_settings(READ_REPLICAS=[]), replica_reads(None):
+            self.assertEqual(User.objects.all().db, 'default')
+
+    def test_writers_read_from_the_primary_within_the_window(self):
+        self.assertEqual(self.initiate_transfer().status_code, 201)
+        self.assertIsNotNone(cache.get(sticky_key(self.user.pk)))
+
+        # The writer sees its transfer, anyone else reads the lagging replica.
+        self.assertEqual(len(self.history(self.headers)), 1)
+        self.assertEqual(len(self.history()), 0)
+
+        # Once the window is over the writer reads from the replica again.
+        cache.delete(sticky_key(self.user.pk))
+        self.assertEqual(len(self.history(self.headers)), 0)
+        self.sync_replica()
+        self.assertEqual(len(self.history(self.headers)), 1)
+
+    @override_settings(READ_YOUR_WRITES_SECONDS=60)
+    def test_reads_do_not_stick_and_stickiness_is_per_user(self):
+        self.history(self.headers)
+        self.assertIsNone(cache.get(sticky_key(self.user.pk)))
+
+        stick_to_primary(self.recepient.pk)
+        with replica_reads(self.recepient):
+            self.assertEqual(User.objects.all().db, 'default')
+        with replica_reads(self.user):
+            self.assertEqual(User.objects.all().db, REPLICA)
+
+@override_settings(QRCODE_FORMAT='payload')
+class QRCodeTests(TestCase):
+    def setUp(self):
+        self.sender = make_user('08000000001', balance='100.00')
+        self.recepient = make_user('08000000002', vendor=True)
+
+    def test_saving_a_stale_instance_keeps_the_rendered_state(self):
+        vendor = Vendor.objects.get(user=self.recepient)
+        vendor.business_name = 'Buka'
+        vendor.business_type = 'Food'
+        vendor.institution = 'Unilag'
+        vendor.save()
+
+        stale = Vendor.objects.get(pk=vendor.pk)
+        render_qrcode(Vendor, vendor.pk)
+        stale.business_name = 'Buka Two'
+        stale.save()
+
+        vendor.refresh_from_db()
+        self.assertEqual(vendor.qrcode_state, QRCODE_READY)
+        self.assertEqual(vendor.business_name, 'Buka Two')
+
+    def test_saving_a_stale_payment_code_keeps_the_rendered_state(self):
+        payment = PaymentCode.objects.create(
+            user=self.sender, transaction=pending_transfer(self.sender, self.recepient, '10.00')
+        )
+
+        stale = PaymentCode.objects.get(pk=payment.pk)
+        render_qrcode(PaymentCode, payment.pk)
+        stale.save()
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.qrcode_state, QRCODE_READY)
+
+    def test_payment_codes_are_only_shown_to_their_parties(self):
+        payment = PaymentCode.objects.create(
+            user=self.sender, transaction=pending_transfer(self.sender, self.recepient, '10.00')
+        )
+        url = f'/api/v1/payment-code/{payment.transaction.ref}/'
+        client = APIClient()
+
+        for user in (self.sender, self.recepient):
+            client.force_authenticate(user)
+            self.assertEqual(client.get(url).status_code, 200)
+
+        client.force_authenticate(make_user('08000000003'))
+        response = client.get(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('data', response.data)
+
+
+
+class QRCodeStorageTests(SimpleTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = override_settings(MEDIA_ROOT=media.name)
+        self.media.enable()
+        self.addCleanup(self.media.disable)
+
+    def stored_files(self):
+        shards, _ = default_storage.listdir('qrcode')
+        return [name for shard in shards for name in default_storage.listdir(f'qrcode/{shard}')[1]]
+
+    def test_formats(self):
+        png = store_qrcode({'ref': 'one'}, fmt='png')
+        svg = store_qrcode({'ref': 'one'}, fmt='svg')
+
+        self.assertTrue(png.endswith('.png'))
+        self.assertTrue(svg.endswith('.svg'))
+        with default_storage.open(png) as image:
+            self.assertEqual(image.read(8), b'\x89PNG\r\n\x1a\n')
+        with default_storage.open(svg) as image:
+            self.assertIn(b'<svg', image.read())
+        self.assertIsNone(store_qrcode({'ref': 'one'}, fmt='payload'))
+
+    def test_identical_codes_are_stored_once(self):
+        first = store_qrcode({'ref': 'one', 'amount': '1.00'}, fmt='png')
+        with mock.patch('user.utils.generate_qrcode') as generate:
+            # Same data in another key order.
+            self.assertEqual(store_qrcode({'amount': '1.00', 'ref': 'one'}, fmt='png'), first)
+        generate.assert_not_called()
+
+        self.assertNotEqual(store_qrcode({'ref': 'two'}, fmt='png'), first)
+        self.assertNotEqual(store_qrcode({'ref': 'one', 'amount': '1.00'}, fmt='png', fg='red'), first)
+        self.assertEqual(len(self.stored_files()), 3)
+
+    def test_racing_renders_keep_one_file(self):
+        generate = generate_qrcode
+        stored = []
+
+        def racing(data, **options):
+            if racing.first:
+                racing.first = False
+                # Another render stores the same code in the meantime.
+                stored.append(store_qrcode(data, **options))
+            return generate(data, **options)
+
+        racing.first = True
+
+        with mock.patch('user.utils.generate_qrcode', side_effect=racing):
+            path = store_qrcode({'ref': 'one'}, fmt='png')
+
+        self.assertEqual(stored, [path])
+        self.assertEqual(self.stored_files(), [path.rsplit('/', 1)[1]])
+
+class WalletIDTests(TestCase):
+    def test_permutation_covers_the_id_space_once(self):
+        ids = [permute_id(value, key='test') for value in range(WALLET_ID_SPACE)]
+
+        self.assertEqual(len(set(ids)), WALLET_ID_SPACE)
+        self.assertEqual((min(ids), max(ids)), (0, WALLET_ID_SPACE - 1))
+        self.assertNotEqual(ids[:10], list(range(10)))
+
+    def test_allocator_leases_blocks_as_it_runs_out(self):
+        leases = []
+
+        def lease_block(prefix, size):
+            start = len(leases) * size
+            leases.append(prefix)
+            return start, start + size
+
+        with override_settings(WALLET_ID_BLOCK_SIZE=3):
+            allocator = WalletIDAllocator(lease_block)
+            ids = [allocator.allocate('CUST') for _ in range(7)]
+
+        self.assertEqual(len(set(ids)), 7)
+        self.assertEqual(len(leases), 3)
+        self.assertTrue(all(len(wallet_id) == 11 and wallet_id.startswith('CUST') for wallet_id in ids))
+
+    def test_leases_never_overlap_and_stop_at_the_end_of_the_space(self):
+        first = IDSequence.objects.lease('CUST26', 100)
+        second = IDSequence.objects.lease('CUST26', 100)
+        self.assertEqual((first, second), ((0, 100), (100, 200)))
+
+        IDSequence.objects.filter(prefix='CUST26').update(next_value=WALLET_ID_SPACE - 10)
+        self.assertEqual(IDSequence.objects.lease('CUST26', 100), (WALLET_ID_SPACE - 10, WALLET_ID_SPACE))
+        with self.assertRaises(WalletIDsExhausted):
+            IDSequence.objects.lease('CUST26', 100)
+
+    def test_new_wallets_get_distinct_ids(self):
+        users = [make_user(f'080000000{index:02d}', vendor=index % 2 == 0) for index in range(20)]
+
+        wallet_ids = [user.vendor.VID if user.is_vendor else user.customer.CID for user in users]
+        self.assertEqual(len(set(wallet_ids)), 20)
+
+
+class TransactionRefTests(TestCase):
+    def test_refs_encode_their_creation_time(self):
+        at = datetime(2026, 3, 1, 12, 30, 15, 123000, tzinfo=dt_timezone.utc)
+        ref = generate_ref(at)
+
+        self.assertEqual(len(ref), REF_LENGTH)
+        self.assertEqual(decode_ref(ref), at)
+
+    def test_refs_sort_by_creation_time(self):
+        start = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        refs = [generate_ref(start + timedelta(milliseconds=step)) for step in range(0, 5000, 7)]
+
+        self.assertEqual(sorted(refs), refs)
+        self.assertEqual(len(set(generate_ref(start) for _ in range(1000))), 1000)
+
+    def test_old_refs_have_no_time(self):
+        self.assertIsNone(decode_ref('CPAY-1234567890'))
+        self.assertIsNone(decode_ref('U' * REF_LENGTH))
+
+    def test_transactions_get_a_unique_ref(self):
+        user = make_user('08000000001')
+        transaction = pending_topup(user)
+
+        self.assertIsNotNone(transaction.ref_created_at)
+        with self.assertRaises(IntegrityError):
+            Transaction.objects.create(sender=user, ref=transaction.ref, transaction_type='topup', status='pending')
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('08000000001')
+        start = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        for index in range(23):
+            topup = pending_topup(self.user)
+            # Pairs of rows share a timestamp, the id breaks the tie.
+            Transaction.objects.filter(pk=topup.pk).update(created_at=start + timedelta(minutes=index // 2))
+        self.transactions = Transaction.objects.filter(sender=self.user)
+        self.expected = list(self.transactions.order_by('created_at', 'pk').values_list('pk', flat=True))
+
+    def walk(self, newest_first=False):
+        pages, cursor = [], None
+        while True:
+            rows, next_cursor, prev_cursor = keyset_page(
+                self.transactions, cursor=cursor, page_size=5, newest_first=newest_first
+            )
+            pages.append(([row.pk for row in rows], prev_cursor))
+            if next_cursor is None:
+                return pages
+            cursor = next_cursor
+
+    def test_pages_cover_every_row_once(self):
+        pages = self.walk()
+
+        self.assertEqual([pk for rows, _ in pages for pk in rows], self.expected)
+        self.assertEqual([len(rows) for rows, _ in pages], [5, 5, 5, 5, 3])
+        self.assertIsNone(pages[0][1])
+
+        pages = self.walk(newest_first=True)
+        self.assertEqual([pk for rows, _ in pages for pk in rows], self.expected[::-1])
+
+    def test_prev_cursor_returns_the_previous_page(self):
+        pages = self.walk()
+
+        rows, _, _ = keyset_page(self.transactions, cursor=pages[2][1], page_size=5)
+        self.assertEqual([row.pk for row in rows], pages[1][0])
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('not-a-cursor', 'W10', 'WyJ4IiwxLCJuZXh0Il0'):
+            with self.assertRaises(InvalidCursor):
+                keyset_page(self.transactions, cursor=cursor)
+
+    def test_history_endpoint_pages_by_cursor(self):
+        client = APIClient()
+        url = f'/api/v1/transactions/{self.user.phone}/'
+
+        seen, cursor = [], None
+        while True:
+            params = {'pagination': 'cursor', 'page_size': 10}
+            if cursor:
+                params['cursor'] = cursor
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['ref'] for row in response.data['data']]
+            cursor = response.data['next']
+            if cursor is None:
+                break
+
+        expected = list(self.transactions.order_by('created_at', 'pk').values_list('ref', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(client.get(url, {'cursor': 'garbage'}).status_code, 400)
+
+
+
+class ActivityFeedTests(TestCase):
+    def setUp(self):
+        self.user = make_user('08000000001')
+        self.friend = make_user('08000000002', vendor=True)
+        start = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        for index in range(7):
+            # Alternately sent and received.
+            sender, recepient = (self.user, self.friend) if index % 2 == 0 else (self.friend, self.user)
+            row = pending_transfer(sender, recepient, f'{index + 1}.00')
+            Transaction.objects.filter(pk=row.pk).update(created_at=start + timedelta(minutes=index))
+        self.url = f'/api/v1/activity/{self.user.phone}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sent_and_received_are_merged_newest_first(self):
+        data = self.client.get(self.url, {'page_size': 10}).data['data']
+
+        self.assertEqual([row['amount'] for row in data], [f'{amount}.00' for amount in range(7, 0, -1)])
+        self.assertEqual([row['direction'] for row in data[:2]], ['debit', 'credit'])
+        self.assertTrue(all(row['counterparty'] == self.friend.phone for row in data))
+
+    def test_cursors_round_trip(self):
+        first = self.client.get(self.url, {'page_size': 3}).data
+        second = self.client.get(self.url, {'page_size': 3, 'cursor': first['next']}).data
+        back = self.client.get(self.url, {'page_size': 3, 'cursor': second['prev']}).data
+
+        self.assertEqual([row['amount'] for row in second['data']], ['4.00', '3.00', '2.00'])
+        self.assertEqual(back['data'], first['data'])
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 400)
+
+    def test_only_the_owner_and_superusers_read_the_feed(self):
+        self.assertIn(APIClient().get(self.url).status_code, (401, 403))
+
+        self.client.force_authenticate(self.friend)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('data', response.data)
+
+        self.client.force_authenticate(User.objects.create(phone='08000000009', email='admin@example.com', is_superuser=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+class TransactionSearchTests(TestCase):
+    def setUp(self):
+        self.user = make_user('08000000001')
+        self.friend = make_user('08000000002')
+        self.client = APIClient()
+        self.url = f'/api/v1/transactions/{self.user.phone}/'
+
+    def add(self, count, recepient=None, description='jollof rice', status='success'):
+        Transaction.objects.bulk_create([
+            Transaction(
+                sender=self.user, recepient=recepient, ref=generate_ref(), amount=Decimal('1.00'),
+                transaction_type='transfer', description=description, status=status,
+            )
+            for _ in range(count)
+        ])
+
+    def search(self, text, **params):
+        response = self.client.post(self.url + '?' + '&'.join(f'{k}={v}' for k, v in params.items()), {'search-string': text}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_descriptions_are_searched_through_the_index(self):
+        self.add(12)
+        self.add(3, description='printing')
+
+        self.assertIsNotNone(ranked_matches(self.user, 'jollof'))
+        data = self.search('jollof', page_size=5, page=3)
+        self.assertEqual(data['total_pages'], 3)
+        self.assertEqual(len(data['data']), 2)
+        self.assertTrue(all(row['description'] == 'jollof rice' for row in data['data']))
+
+    def test_status_and_phone_searches_use_the_filters(self):
+        self.add(4, recepient=self.friend, status='pending')
+        self.add(2)
+
+        self.assertIsNone(ranked_matches(self.user, 'pending'))
+        self.assertIsNone(ranked_matches(self.user, self.friend.phone))
+        self.assertEqual(len(self.search('pending')['data']), 4)
+        self.assertEqual(len(self.search(self.friend.phone)['data']), 4)
+
+    def test_cursor_pages_filter_matches_in_sql(self):
+        self.add(7)
+
+        data = self.search('jollof', pagination='cursor', page_size=5)
+        self.assertEqual(len(data['data']), 5)
+        data = self.search('jollof', pagination='cursor', page_size=5, cursor=data['next'])
+        self.assertEqual(len(data['data']), 2)
+        self.assertIsNone(data['next'])
+
+    def test_more_matches_than_sqlite_bound_variables(self):
+        self.add(33000)
+
+        data = self.search('jollof', page_size=10)
+        self.assertEqual(len(data['data']), 10)
+        self.assertEqual(data['total_pages'], 3300)
+        data = self.search('jollof', pagination='cursor', page_size=10)
+        self.assertEqual(len(data['data']), 10)
+
+
+
+@skipIf(orjson is None, "orjson is not installed")
+class RendererTests(SimpleTestCase):
+    def test_matches_the_drf_encoder(self):
+        data = {
+            "amount": Decimal('12.50'),
+            "blob": b'abc',
+            "elapsed": timedelta(seconds=90),
+            "items": (1, 2),
+            "nested": [{"fee": Decimal('0.10')}],
+        }
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render(data)),
+            json.loads(JSONRenderer().render(data)),
+        )
+
+
+
+class StatementTests(TestCase):
+    def setUp(self):
+        self.customer = make_user('08000000001')
+        self.vendor = make_user('08000000002', vendor=True)
+        Customer.objects.get(user=self.customer).deposit('100.00')
+        self.period = parse_period(f"{timezone.now():%Y-%m}")
+
+    def test_activity_goes_on_the_active_wallet(self):
+        # A vendor who also holds a customer wallet, which sorts first.
+        spare = Customer.objects.create(user=self.vendor)
+        transfer(pending_transfer(self.customer, self.vendor, '30.00'))
+
+        statements = {
+            statement['wallet_id']: statement
+            for statement in build_statements(wallets([self.vendor.pk]), *self.period)
+        }
+        vendor_wallet = Vendor.objects.get(user=self.vendor).VID
+        self.assertEqual(len(statements[vendor_wallet]['lines']), 1)
+        self.assertEqual(statements[vendor_wallet]['closing_balance'], Decimal('30.00'))
+        self.assertEqual(statements[spare.CID]['lines'], [])
+
+    def test_opening_entries_predate_ledger_activity(self):
+        wallet = Customer.objects.get(user=self.customer)
+        # Balance from before the ledger existed.
+        Customer.objects.filter(pk=wallet.pk).update(balance=F('balance') + 50)
+        first = LedgerEntry.objects.filter(wallet=wallet.CID).earliest('created_at')
+
+        call_command('ledger_balances', '--open', stdout=StringIO())
+
+        self.assertEqual(opening_balances([wallet.CID], first.created_at), {wallet.CID: Decimal('50.00')})
+        call_command('ledger_balances', stdout=StringIO())
+
+
+
+
+class AsyncProviderURLs:
+    # The async views next to the sync ones, whichever ASYNC_PROVIDER_VIEWS
+    # picked for user/urls.py.
+    urlpatterns = [
+        path('async/withdraw/<phone>/', async_views.withdraw),
+        path('async/ussd-topup/', async_views.ussd_topup),
+        path('async/verify-transaction/<ref>/', async_views.verify_transaction),
+        path('sync/withdraw/<phone>/', views.withdraw),
+    ]
+
+
+CHARGE_PAYLOAD = {
+    'status': 'success',
+    'data': {'status': 'pending', 'charged_amount': 10, 'app_fee': 0.1},
+    'meta': {'authorization': {'mode': 'ussd', 'note': '*889*767*1234#'}},
+}
+
+
+@override_settings(ROOT_URLCONF=AsyncProviderURLs, PIN_HASH_ROUNDS=4)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('08000000001', balance='100.00')
+        set_pin(pin_holder(self.user), '1234')
+        token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.buckets = mock.patch('user.throttling._buckets', LocalBuckets(100))
+        self.buckets.start()
+        self.addCleanup(self.buckets.stop)
+
+    def provider(self, payload=CHARGE_PAYLOAD, **kwargs):
+        provider = AsyncStubProvider(payload, **kwargs)
+        patcher = mock.patch('user.flutterwave.get_async_client', return_value=provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return provider
+
+    async def withdraw(self, headers=None, key=None, prefix='async', **data):
+        headers = self.headers if headers is None else headers
+        if key is not None:
+            headers = {**headers, 'Idempotency-Key': key}
+        data = {'authorization_pin': '1234', 'email': self.user.email, 'amount': '10.00', **data}
+        return await self.async_client.post(
+            f'/{prefix}/withdraw/{self.user.phone}/', data, content_type='application/json', headers=headers,
+        )
+
+    async def balance(self):
+        return await Customer.objects.filter(user=self.user).values_list('balance', flat=True).aget()
+
+    async def test_withdraw_charges_through_the_async_client(self):
+        provider = self.provider()
+        response = await self.withdraw()
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['data']['charged_amount'], body['meta']['code']), (10, '*889*767*1234#'))
+        self.assertEqual(provider.calls, 1)
+        self.assertEqual(await self.balance(), Decimal('90.00'))
+
+    def test_async_and_sync_withdrawals_answer_alike(self):
+        self.provider()
+        with mock.patch('user.flutterwave.get_client', return_value=StubProvider(CHARGE_PAYLOAD)):
+            sync = self.client.post(
+                f'/sync/withdraw/{self.user.phone}/',
+                {'authorization_pin': '1234', 'email': self.user.email, 'amount': '10.00'},
+                content_type='application/json', headers=self.headers,
+            )
+        response = async_to_sync(self.withdraw)()
+
+        self.assertEqual(response.status_code, sync.status_code)
+        sync_body, body = sync.json(), response.json()
+        for data in (sync_body['data'], body['data']):
+            del data['ref'], data['created_at']
+        self.assertEqual(body, sync_body)
+
+    async def test_refuses_unauthenticated_and_unauthorized_callers(self):
+        self.provider()
+        self.assertEqual((await self.withdraw(headers={})).status_code, 401)
+
+        staff = await User.objects.acreate(phone='08000000009', email='staff@example.com', is_staff=True)
+        token = ClaimsTokenObtainPairSerializer.get_token(staff).access_token
+        response = await self.withdraw(headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(await self.balance(), Decimal('100.00'))
+
+    @override_settings(THROTTLE_RATES={'transfer': '1/min', 'transfer:ip': '600/min'})
+    async def test_throttles_before_the_view_runs(self):
+        provider = self.provider()
+        codes = [(await self.withdraw()).status_code for _ in range(2)]
+
+        self.assertEqual(codes, [200, 429])
+        self.assertEqual(provider.calls, 1)
+
+    async def test_options_is_answered(self):
+        response = await self.async_client.options(f'/async/withdraw/{self.user.phone}/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    async def test_retries_replay_the_stored_response(self):
+        provider = self.provider()
+        first = await self.withdraw(key='key-1')
+        retry = await self.withdraw(key='key-1')
+
+        self.assertEqual(provider.calls, 1)
+        self.assertEqual((retry.status_code, retry.json()), (first.status_code, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(await self.balance(), Decimal('90.00'))
+
+    async def test_provider_timeouts_keep_the_debit_and_the_key(self):
+        provider = self.provider(error=requests.exceptions.ReadTimeout('timed out'))
+        first = await self.withdraw(key='key-1')
+        retry = await self.withdraw(key='key-1')
+
+        self.assertEqual(first.json(), {'status': False, 'message': 'Connection Timed Out'})
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(provider.calls, 1)
+        self.assertEqual(await self.balance(), Decimal('90.00'))
+
+    async def test_topup_provider_errors_settle_the_transaction(self):
+        data = {'account_bank': '057', 'phone': self.user.phone, 'email': self.user.email, 'amount': '50.00'}
+        for error, message, transaction_status in (
+            (requests.exceptions.ConnectionError('refused'), 'Connection Timed Out', 'pending'),
+            (ValueError('bad body'), 'An Error Occured.', 'failed'),
+        ):
+            with self.subTest(error=error):
+                provider = self.provider(error=error)
+                response = await self.async_client.post('/async/ussd-topup/', data, content_type='application/json')
+
+                self.assertEqual(response.json(), {'status': False, 'message': message})
+                topup = await Transaction.objects.filter(transaction_type='topup').alatest('pk')
+                self.assertEqual(topup.status, transaction_status)
+                self.assertEqual(provider.calls, 1)
+
+    async def test_verify_transaction_reports_connection_errors(self):
+        topup = await sync_to_async(pending_topup)(self.user)
+        self.provider(error=requests.exceptions.ConnectionError('refused'))
+        response = await self.async_client.get(f'/async/verify-transaction/{topup.ref}/')
+
+        self.assertEqual(response.json(), {'status': False, 'message': 'Connection Error'})
+        self.assertEqual((await self.async_client.get('/async/verify-transaction/NOPE/')).status_code, 404)
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.status_code = 201
+        self.writes = False
+        self.user = make_user('08000000001', balance='100.00')
+
+        @api_view(['POST'])
+        @idempotent
+        def view(request, phone='08000000001'):
+            self.calls += 1
+            if self.writes:
+                Customer.objects.filter(user__phone=phone).update(balance=F('balance') - 10)
+            if self.status_code is None:
+                return None
+            return Response({"status": True, "call": self.calls}, status=self.status_code)
+
+        self.view = view
+        self.factory = APIRequestFactory()
+
+    def post(self, data, key='key-1', **kwargs):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.view(self.factory.post('/pay/', data, format='json', **headers), **kwargs)
+
+    def test_retries_replay_the_stored_response(self):
+        first = self.post({'amount': '10.00'})
+        retry = self.post({'amount': '10.00'})
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_requests_without_a_key_always_run(self):
+        self.post({'amount': '10.00'}, key=None)
+        self.post({'amount': '10.00'}, key=None)
+        self.assertEqual(self.calls, 2)
+
+    def test_key_reused_for_a_different_request(self):
+        self.post({'amount': '10.00'})
+        response = self.post({'amount': '99.00'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_key_still_in_progress(self):
+        self.post({'amount': '10.00'})
+        IdempotencyKey.objects.update(status_code=None, locked_until=timezone.now() + timedelta(minutes=1))
+
+        response = self.post({'amount': '10.00'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.calls, 1)
+
+    def test_abandoned_key_is_taken_over(self):
+        self.post({'amount': '10.00'})
+        IdempotencyKey.objects.update(status_code=None, locked_until=timezone.now() - timedelta(seconds=1))
+
+        response = self.post({'amount': '10.00'})
+        self.assertEqual(response.data['call'], 2)
+        self.assertTrue(IdempotencyKey.objects.get().completed)
+
+    def test_server_errors_are_not_stored(self):
+        self.status_code = 503
+        self.post({'amount': '10.00'})
+        self.status_code = 201
+        response = self.post({'amount': '10.00'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.calls, 2)
+
+    def test_failures_after_writes_are_stored(self):
+        self.writes = True
+        self.status_code = 502
+        self.post({'amount': '10.00'})
+        retry = self.post({'amount': '10.00'})
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(retry.status_code, 502)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(balance_of(self.user), Decimal('90.00'))
+
+    def test_missing_response_after_writes_is_stored(self):
+        self.writes = True
+        self.status_code = None
+        with self.assertRaises(AssertionError):
+            self.post({'amount': '10.00'})
+        self.status_code = 201
+
+        self.assertEqual(self.post({'amount': '10.00'}).status_code, 500)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(balance_of(self.user), Decimal('90.00'))
+
+    def test_anonymous_keys_are_scoped_by_phone(self):
+        other = make_user('08000000002', balance='100.00')
+        self.writes = True
+        self.post({'amount': '10.00'}, phone=self.user.phone)
+        self.post({'amount': '10.00'}, phone=other.phone)
+        self.post({'amount': '10.00'}, phone=other.phone)
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual((balance_of(self.user), balance_of(other)), (Decimal('90.00'), Decimal('90.00')))
+
+    def test_expired_keys_can_be_reused(self):
+        self.post({'amount': '10.00'})
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.post({'amount': '99.00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.calls, 2)
+
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def check_buckets(self, buckets):
+        phone, ip = ('throttle:otp:phone:1', 1, 1 / 60), ('throttle:otp:ip:1', 5, 5 / 60)
+        self.assertEqual(buckets.take([phone, ip]), 0)
+        self.assertGreater(buckets.take([phone, ip]), 0)
+        # The refused request left the IP bucket alone.
+        for _ in range(4):
+            self.assertEqual(buckets.take([ip]), 0)
+        self.assertGreater(buckets.take([ip]), 0)
+
+    def test_local_buckets_take_all_tokens_or_none(self):
+        self.check_buckets(LocalBuckets(100))
+
+    def test_cache_buckets_take_all_tokens_or_none(self):
+        self.check_buckets(CacheBuckets('default'))
+
+    @override_settings(THROTTLE_RATES={'otp': '1/min', 'otp:ip': '2/min'})
+    def test_refused_phone_does_not_spend_the_ip_budget(self):
+        @api_view(['POST'])
+        @throttle_classes(bucket_throttles('otp'))
+        def view(request):
+            return Response({"status": True})
+
+        factory = APIRequestFactory()
+        with mock.patch('user.throttling._buckets', LocalBuckets(100)):
+            codes = [
+                view(factory.post('/otp/', {'phone': phone}, format='json')).status_code
+                for phone in ('08000000001', '08000000001', '08000000002', '08000000003')
+            ]
+        self.assertEqual(codes, [200, 429, 200, 429])
+
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('08000000001')
+        self.user.set_password('old-password')
+        self.user.save()
+        self.refresh = ClaimsTokenObtainPairSerializer.get_token(self.user)
+        self.auth = ClaimsJWTAuthentication()
+
+    def authenticate(self, token=None):
+        return self.auth.get_user((token or self.refresh).access_token)
+
+    def assertRevoked(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+        with self.assertRaises(AuthenticationFailed):
+            ClaimsTokenRefreshSerializer(data={'refresh': str(self.refresh)}).is_valid()
+
+    def test_token_authenticates_from_its_claims(self):
+        user = self.authenticate()
+        self.assertEqual((user.pk, user.phone, user.is_customer), (self.user.pk, self.user.phone, True))
+
+    def test_password_change_revokes_earlier_logins(self):
+        self.user.set_password('new-password')
+        self.user.save(update_fields=['password'])
+        self.assertRevoked()
+
+        # Logging in again works.
+        self.assertEqual(self.authenticate(ClaimsTokenObtainPairSerializer.get_token(self.user)).pk, self.user.pk)
+
+    def test_queryset_updates_revoke_through_the_claims(self):
+        User.objects.filter(pk=self.user.pk).update(is_vendor=True)
+        self.assertRevoked()
+
+    def test_deactivated_and_deleted_users_are_rejected(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertRevoked()
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertRevoked()
+
+    def test_revocation_survives_cache_eviction(self):
+        self.user.email = 'changed@example.com'
+        self.user.save()
+        cache.clear()
+        self.assertRevoked()
+
+    def test_warm_requests_run_no_queries(self):
+        # The password set in setUp revoked everything up to this second.
+        User.objects.filter(pk=self.user.pk).update(tokens_valid_after=None)
+        legacy = RefreshToken.for_user(self.user).access_token
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            legacy_user = self.auth.get_user(legacy)
+        self.assertEqual((user.pk, user.phone), (self.user.pk, self.user.phone))
+        self.assertEqual(
+            (legacy_user.pk, legacy_user.phone, legacy_user.is_customer, legacy_user.wallet_id),
+            (self.user.pk, self.user.phone, True, self.user.customer.CID),
+        )
+
+    def test_revoke_tokens_drops_the_cached_state(self):
+        self.authenticate()
+        revoke_tokens(self.user.pk)
+        self.assertRevoked()
+
+    def test_saves_drop_the_cached_state(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertRevoked()
+
+
+
+@override_settings(PIN_HASH_ROUNDS=4, PIN_MAX_ATTEMPTS=3)
+class PinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('08000000001', vendor=True)
+        self.wallet = pin_holder(self.user)
+        set_pin(self.wallet, '1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def change_pin(self, current_pin):
+        return self.client.patch(
+            f'/api/v1/authorization-pin/{self.user.phone}/',
+            {'authorization_pin': '5678', 'current_authorization_pin': current_pin},
+            format='json',
+        )
+
+    def test_serializers_never_expose_the_pin(self):
+        self.assertNotIn('transaction_pin', VendorSerializer(Vendor.objects.get(user=self.user)).data)
+        self.assertNotIn('transaction_pin', fast_vendors.serialize(Vendor.objects.all())[0])
+        self.assertNotIn('transaction_pin', fast_customers.names)
+
+    def test_wrong_pins_lock_the_wallet(self):
+        with self.assertRaises(InvalidPin) as raised:
+            check_pin(self.wallet, '0000')
+        self.assertEqual(raised.exception.attempts_left, 2)
+        with self.assertRaises(InvalidPin):
+            check_pin(self.wallet, '0000')
+        with self.assertRaises(PinLocked):
+            check_pin(self.wallet, '0000')
+        # Locked even for the right PIN.
+        with self.assertRaises(PinLocked):
+            check_pin(self.wallet, '1234')
+
+    def test_right_pin_resets_the_attempts(self):
+        for _ in range(2):
+            with self.assertRaises(InvalidPin):
+                check_pin(self.wallet, '0000')
+        check_pin(self.wallet, '1234')
+        with self.assertRaises(InvalidPin) as raised:
+            check_pin(self.wallet, '0000')
+        self.assertEqual(raised.exception.attempts_left, 2)
+
+    def test_locked_pin_change_answers_retry_after(self):
+        with mock.patch('user.throttling._buckets', LocalBuckets(100)):
+            responses = [self.change_pin('0000') for _ in range(3)]
+            locked = self.change_pin('1234')
+
+        self.assertEqual([response.status_code for response in responses], [401, 401, 429])
+        self.assertEqual(responses[0].data['attempts_left'], 2)
+        self.assertEqual(locked.status_code, 429)
+        self.assertIn('Retry-After', locked)
+
+
+
+sent_codes = {}
+
+
+def record_otp(user, code, purpose):
+    sent_codes[(user.phone, purpose)] = code
+
+
+def wrong_code(code):
+    return str((int(code) + 1) % 10 ** len(code)).zfill(len(code))
+
+
+@override_settings(OTP_SENDER='user.tests.record_otp', OTP_MAX_ATTEMPTS=3, PIN_HASH_ROUNDS=4, PIN_MAX_ATTEMPTS=3)
+class OTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        sent_codes.clear()
+        self.user = make_user('08000000001')
+        self.client = APIClient()
+        self.buckets = mock.patch('user.throttling._buckets', LocalBuckets(100))
+        self.buckets.start()
+        self.addCleanup(self.buckets.stop)
+
+    def send(self, purpose):
+        with mock.patch('user.otp.enqueue', run_now):
+            response = self.client.post(f'/api/v1/otp/{self.user.phone}/send/', {'purpose': purpose}, format='json')
+        return response, sent_codes.get((self.user.phone, purpose))
+
+    def verify(self, code, purpose='verification'):
+        return self.client.post(
+            f'/api/v1/otp/{self.user.phone}/verify/', {'purpose': purpose, 'otp': code}, format='json'
+        )
+
+    def reset_pin(self, code, pin='5678'):
+        self.client.force_authenticate(self.user)
+        return self.client.post(
+            f'/api/v1/authorization-pin/{self.user.phone}/reset/',
+            {'authorization_pin': pin, 'otp': code},
+            format='json',
+        )
+
+    def test_code_verifies_once(self):
+        response, code = self.send('verification')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.verify(code).status_code, 200)
+        replay = self.verify(code)
+        self.assertEqual(replay.status_code, 400)
+        self.assertEqual(replay.data['message'], otp.OTPExpired.message)
+
+    def test_guesses_are_limited(self):
+        _, code = self.send('verification')
+
+        self.assertEqual([self.verify(wrong_code(code)).data.get('attempts_left') for _ in range(3)], [2, 1, 0])
+        self.assertEqual(self.verify(code).status_code, 400)
+
+    def test_new_code_replaces_the_pending_one(self):
+        _, first = self.send('verification')
+        _, second = self.send('verification')
+
+        self.assertEqual(OTPChallenge.objects.filter(used_at__isnull=True).count(), 1)
+        if first != second:
+            self.assertEqual(self.verify(first).status_code, 400)
+        self.assertEqual(self.verify(second).status_code, 200)
+
+    def test_purposes_without_a_flow_are_refused(self):
+        self.assertEqual(self.send('login')[0].status_code, 400)
+        _, code = self.send('reset_pin')
+        # Only the PIN reset can spend a reset_pin code.
+        self.assertEqual(self.verify(code, purpose='reset_pin').status_code, 400)
+        self.assertIsNone(OTPChallenge.objects.get().used_at)
+
+    def test_reset_pin_replaces_a_locked_pin(self):
+        wallet = pin_holder(self.user)
+        set_pin(wallet, '1234')
+        for _ in range(3):
+            with self.assertRaises((InvalidPin, PinLocked)):
+                check_pin(wallet, '0000')
+
+        _, code = self.send('reset_pin')
+        self.assertEqual(self.reset_pin(wrong_code(code)).status_code, 400)
+        self.assertEqual(self.reset_pin(code).status_code, 200)
+        check_pin(pin_holder(self.user), '5678')
+
+        self.assertEqual(self.reset_pin(code, pin='9999').status_code, 400)
+        check_pin(pin_holder(self.user), '5678')
+
+
+
+@override_settings(PIN_HASH_ROUNDS=4)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.vendors = [make_user(f'0800000000{index}', vendor=True) for index in range(5)]
+        self.admin = User.objects.create(phone='08000000099', email='admin@example.com', is_staff=True, is_superuser=True)
+        set_pin(Vendor.objects.get(user=self.vendors[0]), '1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_csv_export(self):
+        response = self.client.get('/api/v1/exports/vendors.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(self.content(response))))
+
+        header = rows[0]
+        self.assertIn('VID', header)
+        self.assertEqual(header[-2:], ['phone', 'email'])
+        self.assertNotIn('transaction_pin', header)
+        self.assertEqual(
+            [row[header.index('phone')] for row in rows[1:]], [user.phone for user in self.vendors]
+        )
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/v1/exports/users.ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+
+        # Superusers are left out of the users export.
+        self.assertEqual([row['phone'] for row in rows], [user.phone for user in self.vendors])
+        self.assertTrue(all(row['is_vendor'] for row in rows))
+
+    def test_streams_in_chunks(self):
+        chunks = list(stream_csv('vendors', chunk_size=2))
+
+        # Header plus five rows, two lines per chunk.
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(b''.join(chunks).count(b'\n'), 6)
+
+    def test_only_admins_export(self):
+        self.client.force_authenticate(self.vendors[0])
+        self.assertEqual(self.client.get('/api/v1/exports/vendors.csv').status_code, 403)
+        self.assertIn(APIClient().get('/api/v1/exports/vendors.csv').status_code, (401, 403))
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/v1/exports/wallets.csv').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/exports/vendors.xml').status_code, 404)
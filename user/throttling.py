@@ -0,0 +1,208 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.throttling import BaseThrottle
+
+# Token buckets: each identity gets `capacity` requests up front and earns
+# them back at `capacity / period` per second, so short bursts pass but a
+# sustained flood is held to the configured rate.
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """
+    '10/min' to (capacity, tokens per second).
+    """
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period]
+
+
+def refill(state, now, capacity, rate):
+    if state is None:
+        return float(capacity)
+    tokens, updated = state
+    return min(float(capacity), tokens + (now - updated) * rate)
+
+
+def spend(levels, rates):
+    """
+    Waits for each refilled bucket level, and the levels after taking a
+    token from every bucket, or left as they are if any bucket is empty.
+    """
+    waits = [0 if tokens >= 1 else (1 - tokens) / rate for tokens, rate in zip(levels, rates)]
+    if not any(waits):
+        levels = [tokens - 1 for tokens in levels]
+    return max(waits), levels
+
+
+class LocalBuckets:
+    """
+    Buckets in this process's memory. Exact, but every worker process
+    keeps its own budget.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, buckets):
+        """
+        Take one token from each (key, capacity, rate) bucket, or none at
+        all if any of them is empty. Returns the seconds until every
+        bucket has a token again, 0 when the tokens were taken.
+        """
+        now = time.monotonic()
+        with self.lock:
+            levels = [refill(self.buckets.pop(key, None), now, capacity, rate) for key, capacity, rate in buckets]
+            wait, levels = spend(levels, [rate for _, _, rate in buckets])
+            for (key, _, _), tokens in zip(buckets, levels):
+                self.buckets[key] = (tokens, now)
+            # Least recently seen identities go first.
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class CacheBuckets:
+    """
+    Buckets in a Django cache, shared by every process using that cache
+    (a file, database or memcached backend). Each update holds a short
+    lock per bucket taken with cache.add().
+    """
+
+    lock_timeout = 1
+    lock_attempts = 50
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def lock(self, cache, lock_key):
+        for _ in range(self.lock_attempts):
+            if cache.add(lock_key, 1, timeout=self.lock_timeout):
+                return True
+            time.sleep(0.002)
+        # Without the lock the update still happens, at worst letting a
+        # racing request through, rather than failing the request.
+        return False
+
+    def take(self, buckets):
+        """
+        LocalBuckets.take() over the shared cache.
+        """
+        cache = self.cache
+        # Always locked in the same order, so two requests sharing some
+        # buckets can't each hold one the other is waiting for.
+        locks = [f"{key}:lock" for key in sorted(key for key, _, _ in buckets)]
+        held = [lock_key for lock_key in locks if self.lock(cache, lock_key)]
+
+        try:
+            now = time.time()
+            states = cache.get_many([key for key, _, _ in buckets])
+            levels = [refill(states.get(key), now, capacity, rate) for key, capacity, rate in buckets]
+            wait, levels = spend(levels, [rate for _, _, rate in buckets])
+            for (key, capacity, rate), tokens in zip(buckets, levels):
+                # A bucket left alone refills completely, so it can expire then.
+                cache.set(key, (tokens, now), timeout=int(capacity / rate) + 1)
+        finally:
+            cache.delete_many(held)
+        return wait
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    global _buckets
+
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                if settings.THROTTLE_BACKEND == 'cache':
+                    _buckets = CacheBuckets(settings.THROTTLE_CACHE)
+                else:
+                    _buckets = LocalBuckets(settings.THROTTLE_LOCAL_MAX_KEYS)
+    return _buckets
+
+
+def phone_identity(request, view):
+    phone = view.kwargs.get('phone')
+    if not phone and hasattr(request.data, 'get'):
+        phone = request.data.get('phone')
+    return str(phone) if phone else None
+
+
+def user_identity(request, view):
+    if request.user and request.user.is_authenticated:
+        return request.user.pk
+    return None
+
+
+class BucketThrottle(BaseThrottle):
+    """
+    One bucket per phone, user and client IP. A request spends a token
+    from each of its buckets only when none of them is empty, so a
+    refused request doesn't drain the budgets it did have.
+    """
+
+    scope = None
+    methods = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_identities(self, request, view):
+        return {
+            'phone': phone_identity(request, view),
+            'user': user_identity(request, view),
+            'ip': self.get_ident(request),
+        }
+
+    def allow_request(self, request, view):
+        if self.methods is not None and request.method not in self.methods:
+            return True
+
+        buckets = []
+        for kind, identity in self.get_identities(request, view).items():
+            if identity is not None:
+                capacity, rate = parse_rate(self.get_rate(kind))
+                buckets.append((f"throttle:{self.scope}:{kind}:{identity}", capacity, rate))
+        if not buckets:
+            return True
+
+        self.wait_seconds = get_buckets().take(buckets)
+        return not self.wait_seconds
+
+    def get_rate(self, kind):
+        # A '<scope>:<kind>' entry overrides the scope budget for one kind
+        # of identity, a campus NAT puts many students behind one IP.
+        rates = settings.THROTTLE_RATES
+        return rates.get(f"{self.scope}:{kind}", rates[self.scope])
+
+    def wait(self):
+        # Retry-After is sent in whole seconds, round up so a client that
+        # waits that long finds a token.
+        return math.ceil(self.wait_seconds) if self.wait_seconds else None
+
+
+def bucket_throttles(scope, methods=None):
+    """
+    Throttle classes for `throttle_classes`, checking one bucket per
+    phone, user and client IP, all sharing the THROTTLE_RATES[scope]
+    budget.
+    """
+    return [
+        type(f"{scope.title()}BucketThrottle", (BucketThrottle,), {'scope': scope, 'methods': methods})
+    ]
@@ -0,0 +1,292 @@
+from decimal import Decimal, InvalidOperation
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+
+from user.db import write_transaction
+from user.models import User, Vendor, Customer, Transaction, LedgerEntry
+from user.utils import generate_ref
+
+
+class TransferError(Exception):
+    message = "Transfer could not be completed"
+
+
+class InsufficientBalance(TransferError):
+    message = "Insufficient balance"
+
+
+class TransferNotPending(TransferError):
+    message = "Transaction has been authorized"
+
+
+class InvalidAmount(TransferError):
+    message = "Amount must be a positive number with at most 2 decimal places"
+
+
+class NoWallet(TransferError):
+    message = "Wallet not Found"
+
+
+def wallet_model(user):
+    # Role flags live on the user row, so picking the wallet table
+    # never needs the extra vendor/customer lookup.
+    if user.is_vendor:
+        return Vendor
+    return Customer
+
+
+def wallet_id_field(model):
+    return 'VID' if model is Vendor else 'CID'
+
+
+def wallet_of(user, *fields):
+    """
+    The wallet row of `user` with `fields` loaded. Raises NoWallet for
+    users without one, such as staff accounts.
+    """
+    model = wallet_model(user)
+    try:
+        return model.objects.only(*fields).get(user_id=user.pk)
+    except model.DoesNotExist:
+        raise NoWallet()
+
+
+def lock_wallets(*parties):
+    """
+    Lock the wallet rows of (user_id, model) parties and return a mapping
+    of user id to wallet ID.
+    """
+    # Rows are always locked in user id order so two transfers running in
+    # opposite directions between the same wallets can never deadlock.
+    wallet_ids = {}
+    for user_id, model in sorted(set(parties), key=lambda party: party[0]):
+        try:
+            wallet_ids[user_id] = (
+                model.objects.select_for_update()
+                .values_list(wallet_id_field(model), flat=True)
+                .get(user_id=user_id)
+            )
+        except model.DoesNotExist:
+            raise NoWallet()
+    return wallet_ids
+
+
+def transfer(transaction):
+    """
+    Move `transaction.amount` from the sender's wallet to the recepient's
+    wallet in a single database transaction.
+
+    Balances are changed with conditional UPDATE statements, so concurrent
+    transfers can never overdraw a wallet or overwrite each other's writes.
+    """
+    amount = Decimal(transaction.amount)
+    # A negative amount would credit the sender and debit the recepient
+    # without any balance check.
+    if amount <= 0:
+        raise InvalidAmount()
+
+    sender_model = wallet_model(transaction.sender)
+    recepient_model = wallet_model(transaction.recepient)
+
+    with write_transaction():
+        wallet_ids = lock_wallets(
+            (transaction.sender_id, sender_model),
+            (transaction.recepient_id, recepient_model),
+        )
+
+        claimed = Transaction.objects.filter(
+            pk=transaction.pk, status='pending', completed=False
+        ).update(status='success', completed=True)
+        if not claimed:
+            raise TransferNotPending()
+
+        debited = sender_model.objects.filter(
+            user_id=transaction.sender_id, balance__gte=amount
+        ).update(balance=F('balance') - amount)
+        if not debited:
+            raise InsufficientBalance()
+
+        recepient_model.objects.filter(
+            user_id=transaction.recepient_id
+        ).update(balance=F('balance') + amount)
+
+        LedgerEntry.objects.post(
+            [
+                (wallet_ids[transaction.sender_id], -amount),
+                (wallet_ids[transaction.recepient_id], amount),
+            ],
+            transaction=transaction,
+        )
+
+    transaction.status = 'success'
+    transaction.completed = True
+    return transaction
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    if not amount.is_finite() or amount <= 0 or amount != amount.quantize(Decimal('0.01')):
+        return None
+    return amount
+
+
+def in_batches(values, size=900):
+    # Keeps IN (...) lists under SQLite's bound parameter limit.
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def resolve_recepients(phones):
+    """
+    Map phone to (user_id, wallet model, wallet ID) for every phone that
+    belongs to a user with a wallet.
+    """
+    users = {}
+    for batch in in_batches(phones):
+        for user_id, phone, is_vendor, is_customer in User.objects.filter(phone__in=batch).values_list(
+            'id', 'phone', 'is_vendor', 'is_customer'
+        ):
+            if is_vendor or is_customer:
+                users[user_id] = (phone, Vendor if is_vendor else Customer)
+
+    recepients = {}
+    for model in (Vendor, Customer):
+        user_ids = [user_id for user_id, (_, owner_model) in users.items() if owner_model is model]
+        for batch in in_batches(user_ids):
+            for user_id, wallet_id in model.objects.filter(user_id__in=batch).values_list(
+                'user_id', wallet_id_field(model)
+            ):
+                recepients[users[user_id][0]] = (user_id, model, wallet_id)
+    return recepients
+
+
+def validate_lines(sender, lines, description=''):
+    """
+    Check every line in one pass. Returns the lines that can be applied as
+    (index, phone, recepient, amount, description) and a result for each
+    line that can't.
+    """
+    phones = {str(line.get('recepient')) for line in lines if isinstance(line, dict)}
+    recepients = resolve_recepients(phones)
+
+    valid, rejected = [], {}
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict):
+            rejected[index] = line_result(index, None, None, 'invalid', message="Bad Request")
+            continue
+
+        phone = str(line.get('recepient'))
+        amount = parse_amount(line.get('amount'))
+        if amount is None:
+            rejected[index] = line_result(index, phone, line.get('amount'), 'invalid', message="Invalid amount")
+        elif phone not in recepients:
+            rejected[index] = line_result(index, phone, amount, 'invalid', message="Resource not Found")
+        elif recepients[phone][0] == sender.pk:
+            rejected[index] = line_result(index, phone, amount, 'invalid', message="Cannot transfer to self")
+        else:
+            valid.append((index, phone, recepients[phone], amount, line.get('description') or description))
+    return valid, rejected
+
+
+def line_result(index, phone, amount, result, ref=None, message=None):
+    return {
+        "line": index,
+        "recepient": phone,
+        "amount": None if amount is None else f"{amount}",
+        "status": result,
+        "ref": ref,
+        "message": message,
+    }
+
+
+def bulk_transfer(sender, lines, description='', chunk_size=None):
+    """
+    Pay out `lines` of {"recepient": phone, "amount": ..., "description": ...}
+    from `sender`'s wallet and return a result per line, in line order.
+
+    Lines are applied in chunks, each in its own database transaction: one
+    insert for the Transaction rows, one debit, one set-based credit per
+    wallet table and one ledger insert. Lines the balance can't cover fail
+    on their own without stopping the rest. Raises NoWallet when `sender`
+    has no wallet.
+    """
+    chunk_size = chunk_size or settings.BULK_TRANSFER_CHUNK_SIZE
+    sender_model = type(wallet_of(sender, 'pk'))
+    valid, results = validate_lines(sender, lines, description)
+
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        try:
+            accepted, transactions = apply_chunk(sender, sender_model, chunk, results)
+        except DatabaseError:
+            # The chunk rolled back as a whole, later chunks still run.
+            for index, phone, _, amount, _ in chunk:
+                results[index] = line_result(index, phone, amount, 'failed', message=TransferError.message)
+            continue
+
+        for transaction, (index, phone, _, amount, _) in zip(transactions, accepted):
+            results[index] = line_result(index, phone, amount, 'success', ref=transaction.ref)
+
+    return [results[index] for index in range(len(lines))]
+
+
+def apply_chunk(sender, sender_model, chunk, results):
+    with write_transaction():
+        balance, sender_wallet_id = (
+            sender_model.objects.select_for_update()
+            .values_list('balance', wallet_id_field(sender_model))
+            .get(user_id=sender.pk)
+        )
+
+        accepted = []
+        for index, phone, recepient, amount, line_description in chunk:
+            if amount <= balance:
+                balance -= amount
+                accepted.append((index, phone, recepient, amount, line_description))
+            else:
+                results[index] = line_result(index, phone, amount, 'failed', message=InsufficientBalance.message)
+        if not accepted:
+            return [], []
+
+        # bulk_create skips save(), so refs are issued here.
+        transactions = Transaction.objects.bulk_create([
+            Transaction(
+                sender_id=sender.pk,
+                recepient_id=recepient[0],
+                ref=generate_ref(),
+                amount=amount,
+                transaction_type='transfer',
+                description=line_description or '',
+                status='success',
+                completed=True,
+            )
+            for _, _, recepient, amount, line_description in accepted
+        ])
+
+        total = sum(amount for _, _, _, amount, _ in accepted)
+        sender_model.objects.filter(user_id=sender.pk).update(balance=F('balance') - total)
+
+        # Recepients are credited with one UPDATE per wallet table and
+        # distinct amount.
+        credits = defaultdict(Decimal)
+        for _, _, (user_id, model, _), amount, _ in accepted:
+            credits[(model, user_id)] += amount
+        groups = defaultdict(list)
+        for (model, user_id), amount in credits.items():
+            groups[(model, amount)].append(user_id)
+        for (model, amount), user_ids in groups.items():
+            model.objects.filter(user_id__in=user_ids).update(balance=F('balance') + amount)
+
+        LedgerEntry.objects.post_many([
+            (transaction, [(sender_wallet_id, -amount), (recepient[2], amount)])
+            for transaction, (_, _, recepient, amount, _) in zip(transactions, accepted)
+        ])
+
+    return accepted, transactions
@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.urls import path
 
 from user import views
+from user import async_views
+
+# Views that wait on Flutterwave, async ones when served over ASGI.
+provider_views = async_views if settings.ASYNC_PROVIDER_VIEWS else views
 
 urlpatterns = [
     path('users/', views.users),
@@ -8,18 +13,32 @@ urlpatterns = [
     path('vendors/<ID>/', views.vendor_detail),
     path('customers/', views.customers),
     path('customers/<ID>/', views.customer_detail),
+    path('wallets/<ID>/summary/', views.wallet_summary),
+    path('exports/<resource>.<extension>', views.export),
+    path('statements/<ID>/<period>.<extension>', views.wallet_statement),
 
     # Funding Wallet
-    path('ussd-topup/', views.ussd_topup),
-    path('bank-transfer-topup/', views.bank_transfer_topup),
-    path('direct-bank-charge-topup/', views.direct_bank_charge_topup),
-    path('verify-transaction/<ref>/', views.verify_transaction),
+    path('ussd-topup/', provider_views.ussd_topup),
+    path('bank-transfer-topup/', provider_views.bank_transfer_topup),
+    path('direct-bank-charge-topup/', provider_views.direct_bank_charge_topup),
+    path('verify-transaction/<ref>/', provider_views.verify_transaction),
+    path('webhooks/flutterwave/', views.flutterwave_webhook),
 
     path('transactions/<phone>/', views.transaction_history),
+    path('activity/<phone>/', views.activity_feed),
 
     # In App Transfer
     path('initiate-transfer/<phone>/', views.initiate_transfer),
     path('authorize-transfer/<ref>/', views.authorize_transfer),
+    path('bulk-transfer/<phone>/', views.bulk_transfer_view),
+    path('withdraw/<phone>/', provider_views.withdraw),
+    path('authorization-pin/<phone>/', views.authorization_pin),
+    path('authorization-pin/<phone>/reset/', views.reset_authorization_pin),
+
+    # One-time passwords
+    path('otp/<phone>/send/', views.send_otp_view),
+    path('otp/<phone>/verify/', views.verify_otp_view),
 
-    path('generate-code/<user>/<ID>/', views.generate_payment_code),
+    path('generate-code/<phone>/', views.generate_payment_code),
+    path('payment-code/<ref>/', views.payment_code_detail),
 ]
\ No newline at end of file
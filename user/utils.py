@@ -1,57 +1,207 @@
 import os
+import hmac
+import json
+import time
+import hashlib
+import secrets
+import threading
 import qrcode
-import pyotp
 from io import BytesIO
+from qrcode.image.svg import SvgPathImage
+from django.conf import settings
 from django.core.files import File
-from random import randint
-from datetime import date
+from django.core.files.storage import default_storage
+from datetime import date, datetime, timezone
 
-os.environ['otp-secret'] = pyotp.random_base32()
+QRCODE_PENDING = 'pending'
+QRCODE_READY = 'ready'
+QRCODE_FAILED = 'failed'
+QRCODE_STATES = [
+    (QRCODE_PENDING, 'Pending'),
+    (QRCODE_READY, 'Ready'),
+    (QRCODE_FAILED, 'Failed'),
+]
 
-def generate_ID(vendor=False, customer=False):
-    lowest_digit = 00000
-    highest_digit = 99999
-    number = randint(lowest_digit, highest_digit)
-    year = date.today().strftime("%y")
+# Wallet IDs are a 4 letter prefix, the 2 digit year and a 5 digit number.
+WALLET_ID_SPACE = 100000
+
+# FE1 splits the ID space into a x b, the smallest such rectangle that
+# covers 100000 numbers.
+_FE1_A = 317
+_FE1_B = 316
+
+
+class WalletIDsExhausted(Exception):
+    pass
+
+
+def _round_function(key, round_number, value):
+    digest = hmac.new(key, f"{round_number}:{value}".encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def permute_id(value, key, rounds=4):
+    """
+    Keyed permutation of [0, WALLET_ID_SPACE): every counter value maps to
+    a distinct number, but consecutive counters give unrelated numbers.
+    """
+    key = key.encode()
+    while True:
+        for round_number in range(rounds):
+            left, right = divmod(value, _FE1_B)
+            value = _FE1_A * right + (left + _round_function(key, round_number, right)) % _FE1_A
+        # Cycle walk back into the ID space.
+        if value < WALLET_ID_SPACE:
+            return value
+
+
+class WalletIDAllocator:
+    """
+    Hands out unique VID/CID values without querying for collisions. Each
+    process leases a block of counter values from the database and maps
+    them through `permute_id`.
+    """
+
+    def __init__(self, lease_block):
+        self.lease_block = lease_block
+        self.blocks = {}
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def allocate(self, kind):
+        prefix = f"{kind}{date.today().strftime('%y')}"
+
+        with self.lock:
+            # A forked worker must not reuse its parent's leased block.
+            if self.pid != os.getpid():
+                self.blocks = {}
+                self.pid = os.getpid()
+
+            start, end = self.blocks.get(prefix, (0, 0))
+            if start >= end:
+                start, end = self.lease_block(prefix, settings.WALLET_ID_BLOCK_SIZE)
+            self.blocks[prefix] = (start + 1, end)
+
+        number = permute_id(start, key=f"{settings.WALLET_ID_KEY}:{prefix}")
+        return f"{prefix}{number:05d}"
+
+
+# Transaction refs follow the ULID layout: a 48 bit millisecond timestamp
+# followed by 80 random bits, Crockford base32 encoded to 26 characters.
+# They sort by creation time, which keeps the ref index append-only.
+REF_LENGTH = 26
+_CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def generate_ref(at=None):
+    millis = int((at.timestamp() if at else time.time()) * 1000)
+    value = (millis << 80) | secrets.randbits(80)
+    return ''.join(_CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
 
-    if vendor:
-        return f"VEND{year}{number}"
-    else:
-        return f"CUST{year}{number}"
 
+def decode_ref(ref):
+    """
+    Return the creation time encoded in a transaction ref, or None for refs
+    issued before refs were time-ordered.
+    """
+    if len(ref) != REF_LENGTH or any(char not in _CROCKFORD for char in ref):
+        return None
+
+    value = 0
+    for char in ref:
+        value = (value << 5) | _CROCKFORD.index(char)
+    return datetime.fromtimestamp((value >> 80) / 1000, tz=timezone.utc)
+
+
+def qrcode_payload(data):
+    # Canonical JSON so the same data always hashes, and renders, the same.
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def qrcode_path(payload, fmt, fg, bg, box_size, border):
+    digest = hashlib.sha256(f"{fmt}:{fg}:{bg}:{box_size}:{border}:{payload}".encode()).hexdigest()
+    return f"qrcode/{digest[:2]}/{digest}.{fmt}"
+
+
+def generate_qrcode(data, fg='black', bg='white', box_size=None, border=None, fmt=None):
+    fmt = fmt or settings.QRCODE_FORMAT
+    box_size = box_size or settings.QRCODE_BOX_SIZE
+    border = settings.QRCODE_BORDER if border is None else border
 
-def generate_qrcode(data, fg='black', bg='white', box_size=25):
     QR = qrcode.QRCode(
         version = 1,
         box_size= box_size,
-        border = 5
+        border = border
     )
 
     # Add data to Qrcode instance
-    QR.add_data(data)
+    QR.add_data(qrcode_payload(data))
 
     # Ensures entire dimension of the QRcode is utilized.
     QR.make(fit=True)
 
-    # Converts the QRcode object into an image.
-    img = QR.make_image(
-        fill_color = fg,
-        back_color = bg
-    )
-
-    filename = data['sender']
+    # Converts the QRcode object into an image. SVG output is resolution
+    # independent, PNG stays 1-bit for the default colours.
+    if fmt == 'svg':
+        img = QR.make_image(image_factory=SvgPathImage)
+    else:
+        img = QR.make_image(
+            fill_color = fg,
+            back_color = bg
+        )
 
     buffer = BytesIO()
     img.save(buffer)
     buffer.seek(0)
 
-    qrcode_image = File(buffer, name=f"{filename}.jpg")
+    path = qrcode_path(qrcode_payload(data), fmt, fg, bg, box_size, border)
+    qrcode_image = File(buffer, name=os.path.basename(path))
 
     return qrcode_image
 
 
-def generate_otp():
-    otp_secret = os.environ.get('otp-secret')
-    otp_generator = pyotp.TOTP(otp_secret, interval=30)
-    otp = otp_generator.now()
-    return otp
\ No newline at end of file
+def store_qrcode(data, fg='black', bg='white', box_size=None, border=None, fmt=None):
+    """
+    Render `data` into media storage and return the stored name. Files are
+    named after a hash of the payload and render options, so an identical
+    code is only ever rendered and stored once.
+    """
+    fmt = fmt or settings.QRCODE_FORMAT
+    if fmt == 'payload':
+        # Clients render the payload themselves, nothing to store.
+        return None
+
+    box_size = box_size or settings.QRCODE_BOX_SIZE
+    border = settings.QRCODE_BORDER if border is None else border
+
+    path = qrcode_path(qrcode_payload(data), fmt, fg, bg, box_size, border)
+    if default_storage.exists(path):
+        return path
+
+    image = generate_qrcode(data, fg=fg, bg=bg, box_size=box_size, border=border, fmt=fmt)
+    name = default_storage.save(path, image)
+    if name != path:
+        # A concurrent render stored the same bytes first and storage gave
+        # this copy a suffixed name, keep the content-addressed one.
+        default_storage.delete(name)
+    return path
+
+
+def render_qrcode(model, pk):
+    """
+    Background job that renders and stores the QR code of a Vendor,
+    Customer or PaymentCode row, then flips its `qrcode_state`.
+    """
+    instance = model.objects.get(pk=pk)
+
+    try:
+        name = store_qrcode(instance.qrcode_data())
+    except Exception:
+        model.objects.filter(pk=pk).update(qrcode_state=QRCODE_FAILED)
+        raise
+
+    model.objects.filter(pk=pk).update(qrcode=name or '', qrcode_state=QRCODE_READY)
+
+
+def generate_otp(digits=6):
+    return f"{secrets.randbelow(10 ** digits):0{digits}d}"
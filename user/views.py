@@ -1,40 +1,65 @@
+import hmac
+import math
 import requests
-import bcrypt
 from decimal import Decimal
 
 from django.shortcuts import get_object_or_404
-from django.db import IntegrityError
+from django.db import IntegrityError, connections, router
 from django.core.paginator import Paginator
-from django.http import Http404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.conf import settings
-from django.db.models import Q
+from django.utils import timezone
 
-from user.models import User, Vendor, Customer, PaymentCode, Transaction
+from user.models import User, Vendor, Customer, PaymentCode, Transaction, WebhookEvent
 from user.serializers import UserSerializer, VendorSerializer, CustomerSerializer, TransactionSerializer
-from user.utils import generate_qrcode
-from user.decorators import roles_required
+from user.serializers import fast_users, fast_vendors, fast_customers, fast_transactions
+from user.utils import qrcode_payload
+from user.decorators import roles_required, idempotent
+from user.throttling import bucket_throttles
+from user.routers import read_from_replica
+from user.pagination import keyset_page, InvalidCursor
+from user.search import ranked_matches, search_filters
+from user.exports import EXPORTS, STREAMS, CONTENT_TYPES
+from user.balances import wallet_summary as get_wallet_summary, wallet_model_for
+from user import statements
+from user import otp
+from user import flutterwave
+from user.tasks import enqueue
+from user.pins import check_pin, set_pin, valid_pin, pin_holder, PinError, PinLocked, InvalidPin
+from user.transfers import transfer, bulk_transfer, wallet_of, parse_amount
+from user.transfers import InsufficientBalance, TransferNotPending, InvalidAmount, NoWallet
 
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, throttle_classes
 from rest_framework import status
 
 # Authentication
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
+
+
+def list_page(request, rows):
+    # Admin lists are served a bounded page at a time, whole tables go
+    # through the streaming exports below.
+    paginator = Paginator(rows, per_page=page_size_from(request))
+    return paginator.get_page(request.GET.get('page', 1)), paginator
 
 
 # ------------------------------------------------------------------------------
 # USER ENDPOINTS
 # ------------------------------------------------------------------------------
 @api_view(['GET','POST'])
+@read_from_replica()
 def users(request):
     if request.method == "GET":
         if getattr(request.user, 'is_superuser'):
-            users = User.objects.filter(is_superuser=False)
-            serializer = UserSerializer(users, many=True)
+            users = User.objects.filter(is_superuser=False).order_by('pk')
+            page, paginator = list_page(request, fast_users.values(users))
 
             context = {
-                'users': serializer.data,
-                'count': users.count(),
+                'users': fast_users.serialize_rows(page),
+                'count': paginator.count,
+                'current_page': page.number,
+                'total_pages': paginator.num_pages,
                 'status': True,
             }
 
@@ -90,15 +115,17 @@ def users(request):
 # ------------------------------------------------------------------------------
 @api_view(['GET','POST'])
 @roles_required(['is_superuser', 'is_vendor'])
+@read_from_replica()
 def vendors(request):
     if request.method == "GET":
-        vendor = Vendor.objects.all()
-
-        serializer = VendorSerializer(vendor, many=True)
+        vendor = Vendor.objects.order_by('pk')
+        page, paginator = list_page(request, fast_vendors.values(vendor))
 
         context = {
-            'vendors': serializer.data,
-            'count': vendor.count(),
+            'vendors': fast_vendors.serialize_rows(page),
+            'count': paginator.count,
+            'current_page': page.number,
+            'total_pages': paginator.num_pages,
             'status': True,
         }
 
@@ -119,6 +146,7 @@ def vendor_detail(request, ID):
                     ** serializer.data, 
                     "phone": vendor.user.phone,
                     "email": vendor.user.email,
+                    "qrcode_payload": qrcode_payload(vendor.qrcode_data()),
                 },
                 'status': True,
             }
@@ -153,6 +181,7 @@ def vendor_detail(request, ID):
                     ** serializer.data, 
                     "phone": vendor.user.phone,
                     "email": vendor.user.email,
+                    "qrcode_payload": qrcode_payload(vendor.qrcode_data()),
                 },
                 'updated': True,
                 'status': True,
@@ -172,15 +201,17 @@ def vendor_detail(request, ID):
 # ------------------------------------------------------------------------------
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@read_from_replica()
 def customers(request):
     if request.method == "GET":
-        customer = Customer.objects.all()
-
-        serializer = CustomerSerializer(customer, many=True)
+        customer = Customer.objects.order_by('pk')
+        page, paginator = list_page(request, fast_customers.values(customer))
 
         context = {
-            'customers': serializer.data,
-            'count': customer.count(),
+            'customers': fast_customers.serialize_rows(page),
+            'count': paginator.count,
+            'current_page': page.number,
+            'total_pages': paginator.num_pages,
             'status': True,
         }
 
@@ -202,6 +233,7 @@ def customer_detail(request, ID):
                     ** serializer.data, 
                     "phone": customer.user.phone,
                     "email": customer.user.email,
+                    "qrcode_payload": qrcode_payload(customer.qrcode_data()),
                 },
                 'status': True,
             }
@@ -232,6 +264,7 @@ def customer_detail(request, ID):
                     ** serializer.data, 
                     "phone": customer.user.phone,
                     "email": customer.user.email,
+                    "qrcode_payload": qrcode_payload(customer.qrcode_data()),
                 },
                 'updated': True,
                 'status': True,
@@ -244,39 +277,196 @@ def customer_detail(request, ID):
                 "message": "User is not authorized to access this endpoint."
             }
             return Response(context)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def wallet_summary(request, ID):
+    # Served from the balance cache, the wallet row is only read on a miss.
+    summary = get_wallet_summary(ID)
+    if summary is None:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if not (request.user.is_superuser or request.user.pk == summary["user_id"]):
+        context = {
+            "status": False,
+            "message": "User is not authorized to access this endpoint."
+        }
+        return Response(context, status=status.HTTP_403_FORBIDDEN)
+
+    context = {
+        "status": True,
+        "wallet": {
+            "wallet_id": summary["wallet_id"],
+            "type": summary["type"],
+            "balance": summary["balance"],
+        },
+    }
+    return Response(context, status=status.HTTP_200_OK)
 # ------------------------------------------------------------------------------
 # 
 
 # START AUTHORIZATION PIN
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 @api_view(['POST', 'PATCH'])
+@throttle_classes(bucket_throttles('transfer'))
 @permission_classes([IsAuthenticated])
 @roles_required(['is_vendor', 'is_customer'])
 def authorization_pin(request, phone):
-    if request.method == "POST":
-        pin = request.data.get("authorization_pin", None)
+    pin = request.data.get("authorization_pin", None)
 
-        if pin is None:
-            return Response({"status": False,"message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+    if pin is None:
+        return Response({"status": False,"message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
 
-        initiator = get_object_or_404(User, phone=phone)
-        try:
-            initiator = initiator.vendor
-        except Vendor.DoesNotExist:
-            initiator = initiator.customer
-
-        """@TODO
-        - download and install bcrypt
-        - hash the user's authorization pin and save to database
-        """
-        hashed_authorization_pin = bcrypt.hashpw(
-            authorization_pin.encode(),
-            bcrypt.gensalt()
-        )
-        initiator.transaction_pin = hashed_authorization_pin
-        initiator.save()
+    if not valid_pin(pin):
+        return Response({"status": False, "message": "Authorization pin must be 4 to 6 digits"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.user.phone != phone:
+        context = {
+            "status": False,
+            "message": "User is not authorized to access this endpoint."
+        }
+        return Response(context, status=status.HTTP_403_FORBIDDEN)
+
+    wallet = pin_holder(request.user)
+
+    if request.method == "POST":
+        if wallet.transaction_pin:
+            return Response({"status": False, "message": "Authorization pin has already been set"}, status=status.HTTP_409_CONFLICT)
     elif request.method == "PATCH":
-        return
+        current_pin = request.data.get("current_authorization_pin", None)
+        if current_pin is None:
+            return Response({"status": False,"message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            check_pin(wallet, current_pin)
+        except PinError as error:
+            return pin_error_response(error)
+
+    set_pin(wallet, pin)
+
+    context = {
+        "status": True,
+        "message": "Authorization pin has been set"
+    }
+    return Response(context, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@throttle_classes(bucket_throttles('otp_verify'))
+@permission_classes([IsAuthenticated])
+@roles_required(['is_vendor', 'is_customer'])
+def reset_authorization_pin(request, phone):
+    # A forgotten PIN is replaced with a reset_pin OTP in its place, which
+    # this request spends. Also lifts a PIN lockout.
+    pin = request.data.get("authorization_pin", None)
+    code = request.data.get("otp", None)
+
+    if pin is None or code is None:
+        return Response({"status": False,"message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not valid_pin(pin):
+        return Response({"status": False, "message": "Authorization pin must be 4 to 6 digits"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.user.phone != phone:
+        context = {
+            "status": False,
+            "message": "User is not authorized to access this endpoint."
+        }
+        return Response(context, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        otp.verify_otp(request.user, 'reset_pin', code)
+    except otp.OTPError as error:
+        return otp_error_response(error)
+
+    set_pin(pin_holder(request.user), pin)
+
+    context = {
+        "status": True,
+        "message": "Authorization pin has been reset"
+    }
+    return Response(context, status=status.HTTP_200_OK)
+
+
+def pin_error_response(error):
+    context = {
+        "status": False,
+        "message": error.message,
+    }
+    if isinstance(error, PinLocked):
+        response = Response(context, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response["Retry-After"] = str(math.ceil(error.retry_after))
+        return response
+    if isinstance(error, InvalidPin):
+        context["attempts_left"] = error.attempts_left
+        return Response(context, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(context, status=status.HTTP_400_BAD_REQUEST)
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END AUTHORIZATION PIN
+
+
+# START OTP
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+@api_view(['POST'])
+@throttle_classes(bucket_throttles('otp'))
+@permission_classes([AllowAny])
+def send_otp_view(request, phone):
+    purpose = request.data.get("purpose", None)
+
+    if purpose not in otp.PURPOSES:
+        return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user = get_object_or_404(User.objects.only('pk', 'phone'), phone=phone)
+    except Http404:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    challenge = otp.send_otp(user, purpose)
+
+    context = {
+        "status": True,
+        "message": "OTP has been sent",
+        "data": {
+            "purpose": purpose,
+            "expires_at": challenge.expires_at,
+        }
+    }
+    return Response(context, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@throttle_classes(bucket_throttles('otp_verify'))
+@permission_classes([AllowAny])
+def verify_otp_view(request, phone):
+    purpose = request.data.get("purpose", None)
+    code = request.data.get("otp", None)
+
+    if purpose not in otp.VERIFY_PURPOSES or code is None:
+        return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user = get_object_or_404(User.objects.only('pk', 'phone'), phone=phone)
+    except Http404:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        otp.verify_otp(user, purpose, code)
+    except otp.OTPError as error:
+        return otp_error_response(error)
+
+    return Response({"status": True, "message": "OTP verified"}, status=status.HTTP_200_OK)
+
+
+def otp_error_response(error):
+    context = {
+        "status": False,
+        "message": error.message,
+    }
+    if isinstance(error, otp.InvalidOTP):
+        context["attempts_left"] = error.attempts_left
+    return Response(context, status=status.HTTP_400_BAD_REQUEST)
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END OTP
 
 # START QRCODE MANAGEMENT
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -296,50 +486,42 @@ def generate_payment_code(request, phone):
                 "message": "Bad Request"
             }
             return Response(context, status=status.HTTP_400_BAD_REQUEST)
-        
+        amount = parse_amount(amount)
+        if amount is None:
+            return Response({"status": False, "message": InvalidAmount.message}, status=status.HTTP_400_BAD_REQUEST)
+
+
         initiator = get_object_or_404(User, phone=phone)
         receiver = get_object_or_404(User, phone=recepientID)
 
+        # As with initiate_transfer, the balance is only checked here and
+        # the money moves when the payment is authorized.
         try:
-            sender = initiator.vendor
-        except Vendor.DoesNotExist:
-            sender = initiator.customer
+            sender = wallet_of(initiator, 'balance')
+            wallet_of(receiver, 'pk')
+        except NoWallet as error:
+            return Response({"status": False, "message": error.message}, status=status.HTTP_404_NOT_FOUND)
 
-        if sender.withdraw(amount) is None:
+        if sender.balance < amount:
             # Create a Transaction instance for failed transactions here.
             return Response({"status": False, "message": "Insufficient balance"}, status=status.HTTP_200_OK)
-        
-        try:
-            recepient = receiver.vendor
-        except Vendor.DoesNotExist:
-            recepient = receiver.customer
 
         transaction = Transaction.objects.create(
-            sender = sender,
-            recepient = recepient,
-            amount = Decimal(amount),
+            sender = initiator,
+            recepient = receiver,
+            amount = amount,
             transaction_type = transaction_type,
             description = description,
             status = 'pending'
         )
 
-        data = {
-            "ref": transaction.ref,
-            "sender": sender,
-            "recepient": recepient,
-            "amount": amount,
-            "description": transaction.description,
-            "status": transaction.status,
-            "created_at": transaction.created_at
-        }
         # Should the authorization pin of the sender be added to the qrcode data
         # so it can be authorized by the receiver of the money. 
-        generated_qrcode = generate_qrcode(data)
-        
+        # The QR image is rendered in the background, clients poll for it
+        # until `qrcode_state` is ready.
         payment = PaymentCode.objects.create(
             user=initiator,
             transaction = transaction,
-            qrcode = generated_qrcode
         )
 
         serializer = TransactionSerializer(transaction)
@@ -347,11 +529,46 @@ def generate_payment_code(request, phone):
         context = {
             "status": True,
             "data": {
-                ** serializer,
-                "qrcode": payment.qrcode
+                ** serializer.data,
+                "qrcode": payment.qrcode.url if payment.qrcode else None,
+                "qrcode_state": payment.qrcode_state,
+                "qrcode_payload": qrcode_payload(payment.qrcode_data()),
             }
         }
         return Response(context, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def payment_code_detail(request, ref):
+    try:
+        payment = get_object_or_404(
+            PaymentCode.objects.select_related('transaction__sender', 'transaction__recepient'),
+            transaction__ref=ref,
+        )
+    except Http404:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    # The code carries both phones and the amount, only the two parties
+    # to the payment get to see it.
+    parties = (payment.transaction.sender_id, payment.transaction.recepient_id)
+    if not (request.user.is_superuser or request.user.pk in parties):
+        context = {
+            "status": False,
+            "message": "User is not authorized to access this endpoint."
+        }
+        return Response(context, status=status.HTTP_403_FORBIDDEN)
+
+    context = {
+        "status": True,
+        "data": {
+            "ref": payment.transaction.ref,
+            "qrcode": payment.qrcode.url if payment.qrcode else None,
+            "qrcode_state": payment.qrcode_state,
+            "qrcode_payload": qrcode_payload(payment.qrcode_data()),
+        }
+    }
+    return Response(context, status=status.HTTP_200_OK)
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 # END QRCODE MANAGEMENT
 
@@ -359,8 +576,10 @@ def generate_payment_code(request, phone):
 # START TRANSFER
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 @api_view(['POST'])
+@throttle_classes(bucket_throttles('transfer'))
 # @permission_classes([IsAuthenticated])
 # @roles_required(['is_vendor', 'is_customer'])
+@idempotent
 def initiate_transfer(request, phone):
     recepientID = request.data.get("recepient", None)
     email = request.data.get("email", None)
@@ -370,21 +589,26 @@ def initiate_transfer(request, phone):
     if recepientID is None or amount is None:
         return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
 
+    amount = parse_amount(amount)
+    if amount is None:
+        return Response({"status": False, "message": InvalidAmount.message}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
         initiator = get_object_or_404(User, phone=phone)
         receiver = get_object_or_404(User, phone=recepientID)
     except Http404:
         return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
 
-    # Performance Optimized!!!
+    # The balance is only checked here, the money moves when the
+    # transfer is authorized.
     try:
-        sender = initiator.vendor
-    except Vendor.DoesNotExist:
-        sender = initiator.customer
+        sender = wallet_of(initiator, 'balance')
+        wallet_of(receiver, 'pk')
+    except NoWallet as error:
+        return Response({"status": False, "message": error.message}, status=status.HTTP_404_NOT_FOUND)
 
-    if sender.withdraw(amount) is None:
+    if sender.balance < amount:
         # Create a Transaction instance for failed transactions here.
-        amount = Decimal(amount)
         transaction = Transaction.objects.create(
             sender = initiator,
             recepient = receiver,
@@ -403,7 +627,7 @@ def initiate_transfer(request, phone):
     transaction = Transaction.objects.create(
         sender = initiator,
         recepient = receiver,
-        amount = Decimal(amount),
+        amount = amount,
         transaction_type = "transfer",
         description = description,
         status = "pending"
@@ -421,8 +645,10 @@ def initiate_transfer(request, phone):
 
 
 @api_view(['POST'])
+@throttle_classes(bucket_throttles('transfer'))
 # @permission_classes([IsAuthenticated])
 # @roles_required(['is_vendor', 'is_customer'])
+@idempotent
 def authorize_transfer(request, ref):
     authorization_pin = request.data.get("authorization_pin", None)
 
@@ -430,7 +656,9 @@ def authorize_transfer(request, ref):
         return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        transaction = get_object_or_404(Transaction, ref=ref)
+        transaction = get_object_or_404(
+            Transaction.objects.select_related('sender', 'recepient'), ref=ref
+        )
     except Http404:
         return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
     
@@ -445,24 +673,22 @@ def authorize_transfer(request, ref):
         }
         return Response(context, status=status.HTTP_208_ALREADY_REPORTED)
 
-    # Transfer Order of Accounts
     try:
-        sender = transaction.sender.customer
-    except Customer.DoesNotExist:
-        sender = transaction.sender.vendor
-
-    try:
-        recepient = transaction.recepient.vendor
-    except Vendor.DoesNotExist:
-        recepient = transaction.recepient.customer
+        check_pin(pin_holder(transaction.sender), authorization_pin)
+    except PinError as error:
+        return pin_error_response(error)
 
     if transaction.transaction_type == 'transfer':
-
-        sender.withdraw(transaction.amount)
-        recepient.deposit(transaction.amount)
-        transaction.status = 'success'
-        transaction.completed = True
-        transaction.save()
+        try:
+            transfer(transaction)
+        except TransferNotPending as error:
+            return Response({"status": False, "message": error.message}, status=status.HTTP_208_ALREADY_REPORTED)
+        except InsufficientBalance as error:
+            return Response({"status": False, "message": error.message}, status=status.HTTP_200_OK)
+        except InvalidAmount as error:
+            return Response({"status": False, "message": error.message}, status=status.HTTP_400_BAD_REQUEST)
+        except NoWallet as error:
+            return Response({"status": False, "message": error.message}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = TransactionSerializer(transaction)
 
@@ -481,6 +707,61 @@ def authorize_transfer(request, ref):
     # else:
     #     return Response({"status": False, "message": "Unauthorized User"}, status=status.HTTP_401_UNAUTHORIZED)
 
+
+@api_view(['POST'])
+@throttle_classes(bucket_throttles('transfer'))
+@permission_classes([IsAuthenticated])
+@roles_required(['is_superuser', 'is_vendor', 'is_customer'])
+@idempotent
+def bulk_transfer_view(request, phone):
+    lines = request.data.get("transfers", None)
+    authorization_pin = request.data.get("authorization_pin", None)
+    description = request.data.get("description", "")
+
+    if not isinstance(lines, list) or not lines or authorization_pin is None:
+        return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(lines) > settings.BULK_TRANSFER_MAX_LINES:
+        return Response(
+            {"status": False, "message": f"At most {settings.BULK_TRANSFER_MAX_LINES} transfers per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        initiator = get_object_or_404(User, phone=phone)
+    except Http404:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if not (request.user.is_superuser or request.user.pk == initiator.pk):
+        context = {
+            "status": False,
+            "message": "User is not authorized to access this endpoint."
+        }
+        return Response(context, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        check_pin(pin_holder(initiator), authorization_pin)
+    except PinError as error:
+        return pin_error_response(error)
+
+    try:
+        results = bulk_transfer(initiator, lines, description=description)
+    except NoWallet as error:
+        return Response({"status": False, "message": error.message}, status=status.HTTP_404_NOT_FOUND)
+    succeeded = [result for result in results if result["status"] == "success"]
+
+    context = {
+        "status": True,
+        "data": {
+            "total": len(results),
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "amount": f"{sum((Decimal(result['amount']) for result in succeeded), Decimal('0.00'))}",
+        },
+        "results": results,
+    }
+    return Response(context, status=status.HTTP_200_OK)
+
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 # END TRANSFER
 
@@ -488,9 +769,35 @@ def authorize_transfer(request, ref):
 # START WITHDRAW
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 @api_view(['POST'])
+@throttle_classes(bucket_throttles('transfer'))
 @permission_classes([IsAuthenticated])
 @roles_required(['is_vendor', 'is_customer'])
+@idempotent
 def withdraw(request, phone):
+    prepared = prepare_withdrawal(request, phone)
+    if isinstance(prepared, Response):
+        return prepared
+    transaction, json = prepared
+
+    try:
+        response = flutterwave.get_client().charge('ussd', json)
+        return withdrawal_response(transaction, response)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return provider_error_response("Connection Timed Out")
+
+
+# The provider-bound views are split into the database work before the
+# provider call and the response built from its answer, so the async
+# views in user/async_views.py run exactly the same steps.
+
+def provider_error_response(message, transaction=None, transaction_status=None):
+    if transaction is not None:
+        transaction.status = transaction_status
+        transaction.save()
+    return Response({"status": False, "message": message})
+
+
+def prepare_withdrawal(request, phone):
     authorization_pin = request.data.get("authorization_pin", None)
     email = request.data.get("email", None)
     amount = request.data.get("amount", None)
@@ -507,6 +814,11 @@ def withdraw(request, phone):
         sender = initiator.vendor
     except Vendor.DoesNotExist:
         sender = initiator.customer
+
+    try:
+        check_pin(sender, authorization_pin)
+    except PinError as error:
+        return pin_error_response(error)
     
     transaction = Transaction.objects.create(
         sender=initiator, 
@@ -519,12 +831,6 @@ def withdraw(request, phone):
         transaction.save()
         return Response({"status": False, "message": "Insufficient balance"}, status=status.HTTP_200_OK)
     
-    url = "https://api.flutterwave.com/v3/charges?type=ussd"
-
-    token = settings.FLUTTERWAVE_SECRET_KEY
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
     json = {
         "account_bank": "057", # To be change to actual variable.
         "amount": amount,
@@ -534,42 +840,41 @@ def withdraw(request, phone):
         "fullname": "",
         "phone": phone,
     }
+    return transaction, json
 
-    try:
-        response = requests.post(url=url, headers=headers, json=json)
-        if response.status_code == 200:
-            transaction.status = response.json()['data']['status']
 
-            serializer = TransactionSerializer(transaction)
+def withdrawal_response(transaction, response):
+    if response.status_code == 200:
+        data = response.data
+        authorization = response.meta['authorization']
+        transaction.status = data['status']
 
-            context = {
-                'status': True,
-                'data': {
-                    ** serializer.data,
-                    'charged_amount': response.json()['data']['charged_amount'],
-                    'transaction_fee': response.json()['data']['app_fee'],
-                },
-                'meta': {
-                    'mode': response.json()['meta']['authorization']['mode'],
-                    'code': response.json()['meta']['authorization']['note']
-                }
-            }
+        serializer = TransactionSerializer(transaction)
 
-            return Response(context, status=status.HTTP_200_OK)
-    except requests.exceptions.ConnectTimeout:
         context = {
-            "status": False,
-            "message": "Connection Timed Out"
+            'status': True,
+            'data': {
+                ** serializer.data,
+                'charged_amount': data['charged_amount'],
+                'transaction_fee': data['app_fee'],
+            },
+            'meta': {
+                'mode': authorization['mode'],
+                'code': authorization['note']
+            }
         }
-        return Response(context)
+
+        return Response(context, status=status.HTTP_200_OK)
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 # END WITHDRAW
 
 # START TRANSACTION
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 @api_view(['GET', 'POST'])
+@throttle_classes(bucket_throttles('search', methods=['POST']))
 # @permission_classes([IsAuthenticated])
 # @roles_required(['is_vendor', 'is_customer'])
+@read_from_replica(methods=['GET', 'POST'])
 def transaction_history(request, phone):
     try:
         initiator = get_object_or_404(User, phone=phone)
@@ -577,18 +882,12 @@ def transaction_history(request, phone):
         return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
 
     if request.method == "GET":
-        transactions = Transaction.objects.filter(sender=initiator).order_by("created_at")
-        paginator = Paginator(transactions, per_page=10)
-        page_number = request.GET.get('page', 1)
-        transactions = paginator.get_page(page_number)
-        serializer = TransactionSerializer(transactions, many=True)
+        transactions = Transaction.objects.filter(sender=initiator)
 
-        context = {
-            "status": True,
-            "data": serializer.data,
-            "current_page": page_number,
-            "total_pages": paginator.num_pages
-        }
+        try:
+            context = paginate_transactions(request, transactions)
+        except InvalidCursor:
+            return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(context, status=status.HTTP_200_OK)
 
@@ -598,27 +897,133 @@ def transaction_history(request, phone):
         if search_string is None:
             return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
 
-        transactions = Transaction.objects.filter(sender=initiator)
-        transactions = transactions.filter(
-            Q(ref__contains=search_string) |
-            Q(transaction_type__icontains=search_string)|
-            Q(status__icontains=search_string)
-        ).order_by("created_at")
-        
-        paginator = Paginator(transactions, per_page=10)
-        page_number = request.GET.get('page', 1)
-        transactions = paginator.get_page(page_number)
-        serializer = TransactionSerializer(transactions, many=True)
+        matches = ranked_matches(
+            initiator, search_string, connections[router.db_for_read(Transaction)]
+        )
 
-        context = {
+        if matches is None:
+            # Query too short for the index, a status or phone number the
+            # plain filters answer faster, or no index on this database.
+            transactions = Transaction.objects.filter(sender=initiator).filter(search_filters(search_string))
+        else:
+            transactions = Transaction.objects.filter(pk__in=matches.subquery())
+
+        try:
+            if matches is not None and not cursor_requested(request):
+                context = paginate_ranked(request, matches)
+            else:
+                context = paginate_transactions(request, transactions)
+        except InvalidCursor:
+            return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        context["search_string"] = search_string
+        return Response(context, status=status.HTTP_200_OK)
+
+
+def page_size_from(request):
+    try:
+        page_size = int(request.GET.get('page_size', settings.TRANSACTION_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.TRANSACTION_PAGE_SIZE
+    return max(1, min(page_size, settings.MAX_PAGE_SIZE))
+
+
+def cursor_requested(request):
+    # ?pagination=cursor (or any ?cursor=) switches to keyset pages, the
+    # page-number mode stays the default for existing clients.
+    return request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET
+
+
+def paginate_ranked(request, matches):
+    paginator = Paginator(matches, per_page=page_size_from(request))
+    page_number = request.GET.get('page', 1)
+    page = paginator.get_page(page_number)
+
+    transactions = Transaction.objects.in_bulk(page.object_list)
+
+    return {
+        "status": True,
+        "data": fast_transactions.serialize_instances(transactions[pk] for pk in page.object_list),
+        "current_page": page_number,
+        "total_pages": paginator.num_pages
+    }
+
+
+def paginate_transactions(request, transactions):
+    page_size = page_size_from(request)
+
+    if cursor_requested(request):
+        rows, next_cursor, prev_cursor = keyset_page(
+            transactions, cursor=request.GET.get('cursor'), page_size=page_size
+        )
+        return {
             "status": True,
-            "data": serializer.data,
-            "current_page": page_number,
-            "total_pages": paginator.num_pages,
-            "search_string": search_string
+            "data": fast_transactions.serialize_instances(rows),
+            "next": next_cursor,
+            "prev": prev_cursor,
         }
 
-        return Response(context, status=status.HTTP_200_OK)
+    paginator = Paginator(fast_transactions.values(transactions.order_by("created_at")), per_page=page_size)
+    page_number = request.GET.get('page', 1)
+    transactions = paginator.get_page(page_number)
+
+    return {
+        "status": True,
+        "data": fast_transactions.serialize_rows(transactions),
+        "current_page": page_number,
+        "total_pages": paginator.num_pages
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica()
+def activity_feed(request, phone):
+    # Lists counterparty phones, only the owner and superusers read it.
+    if not (request.user.is_superuser or request.user.phone == phone):
+        context = {
+            "status": False,
+            "message": "User is not authorized to access this endpoint."
+        }
+        return Response(context, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        user = get_object_or_404(User, phone=phone)
+    except Http404:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    # Sent and received rows are read from their own (party, created_at)
+    # index and merged, newest first.
+    sent = Transaction.objects.filter(sender=user).select_related('recepient')
+    received = Transaction.objects.filter(recepient=user).select_related('sender')
+
+    try:
+        rows, next_cursor, prev_cursor = keyset_page(
+            [sent, received],
+            cursor=request.GET.get('cursor'),
+            page_size=page_size_from(request),
+            newest_first=True,
+        )
+    except InvalidCursor:
+        return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = []
+    for transaction, row in zip(rows, fast_transactions.serialize_instances(rows)):
+        outgoing = transaction.sender_id == user.pk
+        counterparty = transaction.recepient if outgoing else transaction.sender
+        data.append({
+            **row,
+            "direction": "debit" if outgoing else "credit",
+            "counterparty": counterparty.phone if counterparty else None,
+        })
+
+    context = {
+        "status": True,
+        "data": data,
+        "next": next_cursor,
+        "prev": prev_cursor,
+    }
+    return Response(context, status=status.HTTP_200_OK)
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 # END TRANSACTION
 
@@ -627,9 +1032,26 @@ def transaction_history(request, phone):
 # START TOPUP        
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 @api_view(['POST'])
+@throttle_classes(bucket_throttles('topup'))
 # @authentication_classes([IsAuthenticated])
 # @roles_required(['is_vendor', 'is_customer'])
+@idempotent
 def ussd_topup(request):
+    prepared = prepare_ussd_topup(request)
+    if isinstance(prepared, Response):
+        return prepared
+    transaction, json = prepared
+
+    try:
+        response = flutterwave.get_client().charge('ussd', json)
+        return ussd_topup_response(transaction, response)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return provider_error_response("Connection Timed Out", transaction, "pending")
+    except Exception:
+        return provider_error_response("An Error Occured.", transaction, "failed")
+
+
+def prepare_ussd_topup(request):
     account_bank = request.data.get('account_bank', None)
     phone = request.data.get('phone', None)
     email = request.data.get('email', None)
@@ -645,12 +1067,6 @@ def ussd_topup(request):
     user = get_object_or_404(User, phone=phone)
     transaction = Transaction.objects.create(sender=user, amount=amount, transaction_type="topup")
 
-    url = "https://api.flutterwave.com/v3/charges?type=ussd"
-
-    token = settings.FLUTTERWAVE_SECRET_KEY
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
     json = {
         "account_bank": "057", # To be change to actual variable.
         "amount": amount,
@@ -660,51 +1076,55 @@ def ussd_topup(request):
         "fullname": "",
         "phone": phone,
     }
+    return transaction, json
 
-    try:
-        response = requests.post(url=url, headers=headers, json=json)
-        if response.status_code == 200:
-            transaction.status = response.json()['data']['status']
-            transaction.transaction_fee = response.json()['data']['app_fee']
-            transaction.save()
 
-            serializer = TransactionSerializer(transaction)
+def ussd_topup_response(transaction, response):
+    if response.status_code == 200:
+        data = response.data
+        authorization = response.meta['authorization']
+        transaction.status = data['status']
+        transaction.transaction_fee = data['app_fee']
+        transaction.save()
 
-            context = {
-                'status': True,
-                'data': {
-                    ** serializer.data,
-                    'charged_amount': response.json()['data']['charged_amount'],
-                    'transaction_fee': response.json()['data']['app_fee'],
-                },
-                'meta': {
-                    'mode': response.json()['meta']['authorization']['mode'],
-                    'code': response.json()['meta']['authorization']['note']
-                }
-            }
+        serializer = TransactionSerializer(transaction)
 
-            return Response(context, status=status.HTTP_200_OK)
-    except requests.exceptions.ConnectTimeout:
-        transaction.status = "pending"
-        transaction.save()
-        context = {
-            "status": False,
-            "message": "Connection Timed Out"
-        }
-        return Response(context)
-    except Exception:
-        transaction.status = "failed"
-        transaction.save()
         context = {
-            "status": False,
-            "message": "An Error Occured."
+            'status': True,
+            'data': {
+                ** serializer.data,
+                'charged_amount': data['charged_amount'],
+                'transaction_fee': data['app_fee'],
+            },
+            'meta': {
+                'mode': authorization['mode'],
+                'code': authorization['note']
+            }
         }
-        return Response(context)
+
+        return Response(context, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
+@throttle_classes(bucket_throttles('topup'))
 # @authentication_classes([IsAuthenticated])
 # @roles_required(['is_vendor', 'is_customer'])
+@idempotent
 def bank_transfer_topup(request):
+    prepared = prepare_bank_transfer_topup(request)
+    if isinstance(prepared, Response):
+        return prepared
+    transaction, json = prepared
+
+    try:
+        response = flutterwave.get_client().charge('bank_transfer', json)
+        return bank_transfer_topup_response(transaction, response)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return provider_error_response("Connection Timed Out")
+    except Exception:
+        return provider_error_response("An Error Occured.")
+
+
+def prepare_bank_transfer_topup(request):
     phone = request.data.get('phone', None)
     email = request.data.get('email', None)
     amount = request.data.get('amount', None)
@@ -719,12 +1139,6 @@ def bank_transfer_topup(request):
     user = get_object_or_404(User, phone=phone, email=email)
     transaction = Transaction.objects.create(sender=user, amount=amount, transaction_type="topup")
     
-    url = "https://api.flutterwave.com/v3/charges?type=bank_transfer"
-
-    token = settings.FLUTTERWAVE_SECRET_KEY
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
     json = {
         "tx_ref": transaction.ref,
         "amount": amount,
@@ -734,48 +1148,54 @@ def bank_transfer_topup(request):
         "phone": phone,
         "narration": "CampusPay"
     }
+    return transaction, json
 
-    try:
-        response = requests.post(url=url, headers=headers, json=json)
-        if response.status_code == 200:
-            transaction.status = "pending"
-            transaction.save()
 
-            serializer = TransactionSerializer(transaction)
+def bank_transfer_topup_response(transaction, response):
+    if response.status_code == 200:
+        authorization = response.meta['authorization']
+        transaction.status = "pending"
+        transaction.save()
 
-            context = {
-                'status': True,
-                'data': {
-                    ** serializer.data,
-                },
-                'meta': {
-                    'mode': response.json()['meta']['authorization']['mode'],
-                    'transfer_account': response.json()['meta']['authorization']['transfer_account'],
-                    'transfer_bank': response.json()['meta']['authorization']['transfer_bank'],
-                    'transfer_amount': response.json()['meta']['authorization']['transfer_amount'],
-                    'account_expiration': response.json()['meta']['authorization']['account_expiration']
-                }
-            }
+        serializer = TransactionSerializer(transaction)
 
-            return Response(context, status=status.HTTP_200_OK)
-    except requests.exceptions.ConnectTimeout:
-        context = {
-            "status": False,
-            "message": "Connection Timed Out"
-        }
-        return Response(context)
-    except Exception as error:
-        print(error)
         context = {
-            "status": False,
-            "message": "An Error Occured."
+            'status': True,
+            'data': {
+                ** serializer.data,
+            },
+            'meta': {
+                'mode': authorization['mode'],
+                'transfer_account': authorization['transfer_account'],
+                'transfer_bank': authorization['transfer_bank'],
+                'transfer_amount': authorization['transfer_amount'],
+                'account_expiration': authorization['account_expiration']
+            }
         }
-        return Response(context)
+
+        return Response(context, status=status.HTTP_200_OK)
     
 @api_view(['POST'])
+@throttle_classes(bucket_throttles('topup'))
 # @authentication_classes([IsAuthenticated])
 # @roles_required(['is_vendor', 'is_customer'])
+@idempotent
 def direct_bank_charge_topup(request):
+    prepared = prepare_direct_bank_charge_topup(request)
+    if isinstance(prepared, Response):
+        return prepared
+    transaction, json = prepared
+
+    try:
+        response = flutterwave.get_client().charge('account', json)
+        return direct_bank_charge_topup_response(transaction, response)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return provider_error_response("Connection Timed Out")
+    except Exception:
+        return provider_error_response("An Error Occured.")
+
+
+def prepare_direct_bank_charge_topup(request):
     account_bank = request.data.get('account_bank', None)
     account_number = request.data.get('account_number', None)
     phone = request.data.get('phone', None)
@@ -792,12 +1212,6 @@ def direct_bank_charge_topup(request):
     user = get_object_or_404(User, phone=phone)
     transaction = Transaction.objects.create(sender=user, amount=amount, transaction_type="topup")
     
-    url = "https://api.flutterwave.com/v3/charges?type=account"
-
-    token = settings.FLUTTERWAVE_SECRET_KEY
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
     json = {
         "tx_ref": transaction.ref,
         "amount": amount,
@@ -809,47 +1223,38 @@ def direct_bank_charge_topup(request):
         "phone": phone,
         "narration": "CamPay"
     }
+    return transaction, json
 
-    try:
-        response = requests.post(url=url, headers=headers, json=json)
-        if response.status_code == 200:
-            transaction.status = response.json()['data']['status']
-            transaction.transaction_fee = response.json()['data']['app_fee']
-            transaction.save()
 
-            serializer = TransactionSerializer(transaction)
+def direct_bank_charge_topup_response(transaction, response):
+    if response.status_code == 200:
+        data = response.data
+        authorization = response.meta['authorization']
+        transaction.status = data['status']
+        transaction.transaction_fee = data['app_fee']
+        transaction.save()
 
-            context = {
-                'status': True,
-                'data': {
-                    ** serializer.data,
-                    'charged_amount': response.json()['data']['charged_amount'],
-                    'transaction_fee': response.json()['data']['app_fee'],
-                },
-                'account': {
-                    'account_number': response.json()['data']['account']['account_number'],
-                    'account_name': response.json()['data']['account']['account_name'],
-                    'bank_code': response.json()['data']['account']['bank_code'],
-                },
-                'meta': {
-                    'mode': response.json()['meta']['authorization']['mode'],
-                    'validate_instructions': response.json()['meta']['authorization']['validate_instructions'],
-                }
-            }
+        serializer = TransactionSerializer(transaction)
 
-            return Response(context, status=status.HTTP_200_OK)
-    except requests.exceptions.ConnectTimeout:
         context = {
-            "status": False,
-            "message": "Connection Timed Out"
-        }
-        return Response(context)
-    except Exception:
-        context = {
-            "status": False,
-            "message": "An Error Occured."
+            'status': True,
+            'data': {
+                ** serializer.data,
+                'charged_amount': data['charged_amount'],
+                'transaction_fee': data['app_fee'],
+            },
+            'account': {
+                'account_number': data['account']['account_number'],
+                'account_name': data['account']['account_name'],
+                'bank_code': data['account']['bank_code'],
+            },
+            'meta': {
+                'mode': authorization['mode'],
+                'validate_instructions': authorization['validate_instructions'],
+            }
         }
-        return Response(context)
+
+        return Response(context, status=status.HTTP_200_OK)
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
 # END TOPUP
 
@@ -870,4 +1275,94 @@ def verify_transaction(request, ref):
         return Response(response, status=status.HTTP_200_OK)
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------
-# END VERIFY TRANSACTIONS
\ No newline at end of file
+# END VERIFY TRANSACTIONS
+
+
+# START WEBHOOKS
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def flutterwave_webhook(request):
+    signature = request.headers.get('verif-hash', '')
+    if not settings.FLUTTERWAVE_WEBHOOK_HASH or not hmac.compare_digest(signature, settings.FLUTTERWAVE_WEBHOOK_HASH):
+        return Response({"status": False, "message": "Invalid signature"}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if not isinstance(request.data, dict):
+        return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    event = request.data.get('event', None)
+    data = request.data.get('data', None) or {}
+    if not isinstance(data, dict):
+        return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+    ref = data.get('tx_ref', None)
+
+    if event != 'charge.completed' or ref is None:
+        # Acknowledge events we don't handle so the provider stops retrying.
+        return Response({"status": True, "message": "Ignored"}, status=status.HTTP_200_OK)
+
+    webhook_event, created = WebhookEvent.objects.get_or_create(
+        ref=ref,
+        defaults={'event': event, 'payload': request.data},
+    )
+    if created:
+        # Let the reconciler pick it up too in case the worker dies first.
+        Transaction.objects.filter(ref=ref, completed=False).update(next_verify_at=timezone.now())
+        enqueue(webhook_event.process)
+
+    return Response({"status": True, "duplicate": not created}, status=status.HTTP_200_OK)
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END WEBHOOKS
+
+
+# START STATEMENTS
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def wallet_statement(request, ID, period, extension):
+    model, id_field = wallet_model_for(ID)
+    if model is None or extension not in statements.RENDERERS:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        start, end = statements.parse_period(period)
+    except ValueError:
+        return Response({"status": False, "message": "Bad Request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    user_id = model.objects.filter(**{id_field: ID}).values_list('user_id', flat=True).first()
+    if user_id is None:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if not (request.user.is_superuser or request.user.pk == user_id):
+        context = {
+            "status": False,
+            "message": "User is not authorized to access this endpoint."
+        }
+        return Response(context, status=status.HTTP_403_FORBIDDEN)
+
+    wallet_rows = [row for row in statements.wallets([user_id]) if row[1] == ID]
+    statement = next(statements.build_statements(wallet_rows, start, end))
+
+    response = HttpResponse(
+        statements.RENDERERS[extension](statement), content_type=statements.CONTENT_TYPES[extension]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{ID}-{period}.{extension}"'
+    return response
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END STATEMENTS
+
+
+# START EXPORTS
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@read_from_replica()
+def export(request, resource, extension):
+    if resource not in EXPORTS or extension not in STREAMS:
+        return Response({"status": False, "message": "Resource not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(STREAMS[extension](resource), content_type=CONTENT_TYPES[extension])
+    response['Content-Disposition'] = f'attachment; filename="{resource}.{extension}"'
+    return response
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------
+# END EXPORTS
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'user.routers.read_your_writes_middleware',
 ]
 
 ROOT_URLCONF = 'wallet.urls'
@@ -85,9 +86,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default, which locks whole
+        # tables between threads and ignores busy_timeout, so tests that
+        # run requests concurrently see the same locking as production.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Pragmas set on every SQLite connection, see user/db.py. busy_timeout is
+# how long, in milliseconds, a writer waits for the lock before failing.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 20000))
+
+# Read replicas of the default database, DATABASE_REPLICAS is a comma
+# separated list of their names (for SQLite, files kept current with
+# `manage.py sync_sqlite_replicas`). List, history and search endpoints
+# read from them, see user/routers.py. A user's reads stay on the primary
+# for READ_YOUR_WRITES_SECONDS after a request of theirs wrote to it,
+# READ_YOUR_WRITES_CACHE has to be shared by every worker for that to hold.
+READ_REPLICAS = []
+for index, name in enumerate(filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), start=1):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'NAME': name.strip(), 'TEST': {'MIRROR': 'default'}}
+    READ_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['user.routers.ReplicaRouter']
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+READ_YOUR_WRITES_CACHE = os.getenv("READ_YOUR_WRITES_CACHE", "default")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -138,16 +164,139 @@ AUTH_USER_MODEL = 'user.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ]
+        'user.authentication.ClaimsJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'user.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+
+# Set CACHE_BACKEND to django.core.cache.backends.filebased.FileBasedCache
+# and CACHE_LOCATION to a shared directory when running several workers,
+# the default local-memory cache is private to each process.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("CACHE_LOCATION", 'campuspay'),
+    }
 }
 
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'user.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'user.authentication.ClaimsTokenRefreshSerializer',
 }
 
 
 FLUTTERWAVE_PUBLIC_KEY = os.getenv("FLUTTERWAVE_PUBLIC_KEY")
 FLUTTERWAVE_SECRET_KEY = os.getenv("FLUTTERWAVE_SECRET_KEY")
+FLUTTERWAVE_WEBHOOK_HASH = os.getenv("FLUTTERWAVE_WEBHOOK_HASH")
+FLUTTERWAVE_BASE_URL = os.getenv("FLUTTERWAVE_BASE_URL", "https://api.flutterwave.com/v3")
+
+# Outbound provider calls: (connect, read) timeouts in seconds, bounded
+# retries with jittered backoff and a circuit breaker per worker process.
+FLUTTERWAVE_CONNECT_TIMEOUT = float(os.getenv("FLUTTERWAVE_CONNECT_TIMEOUT", 3.05))
+FLUTTERWAVE_READ_TIMEOUT = float(os.getenv("FLUTTERWAVE_READ_TIMEOUT", 15))
+FLUTTERWAVE_MAX_RETRIES = int(os.getenv("FLUTTERWAVE_MAX_RETRIES", 2))
+FLUTTERWAVE_RETRY_BACKOFF = float(os.getenv("FLUTTERWAVE_RETRY_BACKOFF", 0.25))
+FLUTTERWAVE_POOL_SIZE = int(os.getenv("FLUTTERWAVE_POOL_SIZE", 20))
+FLUTTERWAVE_BREAKER_THRESHOLD = int(os.getenv("FLUTTERWAVE_BREAKER_THRESHOLD", 5))
+FLUTTERWAVE_BREAKER_RESET = float(os.getenv("FLUTTERWAVE_BREAKER_RESET", 30))
+
+# Under ASGI (uvicorn wallet.asgi:application) set ASYNC_PROVIDER_VIEWS=1
+# to route topups, withdrawals and verification to the async views in
+# user/async_views.py, which need httpx. The async client's pool bounds
+# the provider calls in flight per process.
+ASYNC_PROVIDER_VIEWS = os.getenv("ASYNC_PROVIDER_VIEWS", "0") == "1"
+FLUTTERWAVE_ASYNC_POOL_SIZE = int(os.getenv("FLUTTERWAVE_ASYNC_POOL_SIZE", 500))
+
+# Background reconciliation of pending topups, see `manage.py reconcile_transactions`.
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 100))
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", 8))
+RECONCILE_BACKOFF_FACTOR = 0.1
+RECONCILE_MIN_DELAY = 15
+RECONCILE_MAX_DELAY = 60 * 60
+RECONCILE_MAX_AGE = 60 * 60 * 24 * 3
+
+# Threads for work pushed off the request path, see `user.tasks`.
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", 4))
+
+# QR codes: 'svg', 'png' (QRCODE_BOX_SIZE pixels per module) or 'payload'
+# to hand the raw payload to clients that render it themselves.
+QRCODE_FORMAT = os.getenv("QRCODE_FORMAT", "png")
+QRCODE_BOX_SIZE = int(os.getenv("QRCODE_BOX_SIZE", 4))
+QRCODE_BORDER = 4
+
+# Wallet IDs are leased from the database in blocks and shuffled with a
+# keyed permutation, changing the key reorders IDs not yet issued.
+WALLET_ID_BLOCK_SIZE = int(os.getenv("WALLET_ID_BLOCK_SIZE", 100))
+WALLET_ID_KEY = os.getenv("WALLET_ID_KEY", SECRET_KEY)
+
+TRANSACTION_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+# Rows fetched per database round trip by the streaming admin exports.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# Monthly statements, see `manage.py generate_statements`.
+STATEMENT_WORKERS = int(os.getenv("STATEMENT_WORKERS", os.cpu_count() or 1))
+STATEMENT_SHARD_SIZE = int(os.getenv("STATEMENT_SHARD_SIZE", 500))
+
+# Cached wallet summaries, rewritten on every committed ledger posting.
+WALLET_SUMMARY_TIMEOUT = int(os.getenv("WALLET_SUMMARY_TIMEOUT", 60 * 5))
+WALLET_SUMMARY_WRITE_THROUGH_LIMIT = 2
+
+# Cached token revocation state per user, dropped whenever a User is saved
+# or deleted. Queryset updates to a User show up once it expires.
+REVOCATION_CACHE_TIMEOUT = int(os.getenv("REVOCATION_CACHE_TIMEOUT", 60))
+
+# Idempotency-Key replays on money-moving endpoints. Keys are kept for the
+# TTL, an unfinished request holds its key for the lock timeout, which
+# must outlast the slowest provider call with retries.
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 60 * 60 * 24))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", 120))
+
+# Transaction PINs: bcrypt cost (stored hashes at another cost are
+# upgraded on the next correct PIN), threads hashing at once per worker,
+# and the lockout after PIN_MAX_ATTEMPTS wrong PINs. PIN_CACHE has to be
+# shared by every worker for the lockout to hold.
+PIN_HASH_ROUNDS = int(os.getenv("PIN_HASH_ROUNDS", 10))
+PIN_HASH_WORKERS = int(os.getenv("PIN_HASH_WORKERS", 2))
+PIN_MAX_ATTEMPTS = int(os.getenv("PIN_MAX_ATTEMPTS", 5))
+PIN_LOCKOUT_SECONDS = int(os.getenv("PIN_LOCKOUT_SECONDS", 60 * 15))
+PIN_CACHE = os.getenv("PIN_CACHE", "default")
+
+# One-time passwords: code length, lifetime in seconds, wrong guesses
+# allowed per code, and the callable delivering codes, called as
+# sender(user, code, purpose).
+OTP_DIGITS = int(os.getenv("OTP_DIGITS", 6))
+OTP_TTL = int(os.getenv("OTP_TTL", 60 * 5))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+OTP_SENDER = os.getenv("OTP_SENDER", "user.otp.log_otp")
+
+# Bulk payouts: lines per request, and lines applied per DB transaction.
+BULK_TRANSFER_MAX_LINES = int(os.getenv("BULK_TRANSFER_MAX_LINES", 20000))
+BULK_TRANSFER_CHUNK_SIZE = int(os.getenv("BULK_TRANSFER_CHUNK_SIZE", 500))
+
+# Token bucket throttles per phone, user and client IP, see user.throttling.
+# 'local' keeps buckets in each worker's memory, 'cache' shares them through
+# THROTTLE_CACHE, which should then be a file, database or memcached cache.
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "local")
+THROTTLE_CACHE = os.getenv("THROTTLE_CACHE", "default")
+THROTTLE_LOCAL_MAX_KEYS = 100000
+THROTTLE_RATES = {
+    'transfer': os.getenv("THROTTLE_TRANSFER_RATE", "20/min"),
+    'transfer:ip': os.getenv("THROTTLE_TRANSFER_IP_RATE", "600/min"),
+    'topup': os.getenv("THROTTLE_TOPUP_RATE", "5/min"),
+    'topup:ip': os.getenv("THROTTLE_TOPUP_IP_RATE", "150/min"),
+    'search': os.getenv("THROTTLE_SEARCH_RATE", "30/min"),
+    'search:ip': os.getenv("THROTTLE_SEARCH_IP_RATE", "900/min"),
+    'otp': os.getenv("THROTTLE_OTP_RATE", "3/min"),
+    'otp:ip': os.getenv("THROTTLE_OTP_IP_RATE", "60/min"),
+    'otp_verify': os.getenv("THROTTLE_OTP_VERIFY_RATE", "10/min"),
+    'otp_verify:ip': os.getenv("THROTTLE_OTP_VERIFY_IP_RATE", "300/min"),
+}